@@ -1,2 +1,32 @@
-from goet.tracer.print import PrintTracer
-from goet.tracer.sql import SqlTracer
\ No newline at end of file
+"""Tracers are imported on first use (PEP 562), so `import goet` stays cheap and has no side effects."""
+# Not typing.TYPE_CHECKING: importing typing would cost more than everything else here.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from goet.lib.db.query import find_steps
+    from goet.tracer.fanout import FanoutTracer
+    from goet.tracer.print import PrintTracer
+    from goet.tracer.sql import SqlTracer
+
+# Attribute -> module it's imported from.
+LAZY = {
+    "FanoutTracer": "goet.tracer.fanout",
+    "PrintTracer": "goet.tracer.print",
+    "SqlTracer": "goet.tracer.sql",
+    "find_steps": "goet.lib.db.query",
+}
+
+__all__ = list(LAZY)
+
+
+def __getattr__(name: str):
+    module = LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(__import__(module, fromlist=[name]), name)
+    # Cached, __getattr__ isn't called again for it.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
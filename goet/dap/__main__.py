@@ -0,0 +1,28 @@
+"""Serve recorded runs to an editor, as a Debug Adapter Protocol server.
+
+    python -m goet.dap [--database trace.sqlite3] [--port 4711]
+
+Speaks over stdin/stdout, or with --port on a local TCP socket.
+"""
+import argparse
+import asyncio
+
+from goet.dap.server import serve_stdio, serve_tcp
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m goet.dap")
+    parser.add_argument(
+        "--database", help="path or file: URI of the recordings (default $GOET_DB)"
+    )
+    parser.add_argument("--port", type=int, help="listen on this TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    if args.port is None:
+        asyncio.run(serve_stdio(args.database))
+    else:
+        asyncio.run(serve_tcp(args.database, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional
+
+Message = Dict[str, Any]
+
+HEADER = b"Content-Length: "
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Message]:
+    """The next Debug Adapter Protocol message, None once the client is gone.
+
+    Messages are a JSON body after "Content-Length: <n>" and an empty line.
+    """
+    length = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            if length is not None:
+                break
+            continue
+        if line.startswith(HEADER):
+            length = int(line[len(HEADER) :])
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    return json.loads(body)
+
+
+def encode_message(message: Message) -> bytes:
+    body = json.dumps(message, separators=(",", ":")).encode()
+    return HEADER + str(len(body)).encode() + b"\r\n\r\n" + body
+
+
+class Channel:
+    """Channel numbers and writes the messages sent to the client.
+
+    Each message is a single write, so messages sent by concurrent tasks never interleave.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.seq = 0
+
+    async def send(self, message: Message):
+        self.seq += 1
+        self.writer.write(encode_message({"seq": self.seq, **message}))
+        await self.writer.drain()
+
+    async def respond(
+        self,
+        request: Message,
+        body: Optional[Message] = None,
+        error: Optional[str] = None,
+    ):
+        response = {
+            "type": "response",
+            "request_seq": request["seq"],
+            "command": request["command"],
+            "success": error is None,
+        }
+        if error is not None:
+            response["message"] = error
+        if body is not None:
+            response["body"] = body
+        await self.send(response)
+
+    async def event(self, event: str, body: Optional[Message] = None):
+        message: Message = {"type": "event", "event": event}
+        if body is not None:
+            message["body"] = body
+        await self.send(message)
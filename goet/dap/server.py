@@ -0,0 +1,449 @@
+import asyncio
+import os
+import reprlib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import attr
+
+from goet.dap.protocol import Channel, Message, read_message
+from goet.lib.db.navigator import Child, Navigator
+from goet.lib.db.pickles import LazyValue
+from goet.lib.db.runs import list_runs
+from goet.lib.db.sqlite import Database, connect
+from goet.lib.frame.frame import Loop
+from goet.tracer.breakpoint import matches
+
+# A recording has a single thread.
+THREAD_ID = 1
+
+CAPABILITIES = {
+    "supportsConfigurationDoneRequest": True,
+    "supportsStepBack": True,
+    "supportsDelayedStackTraceLoading": True,
+}
+
+# Events to send once the response is out.
+Events = List[Tuple[str, Message]]
+
+REPR = reprlib.Repr()
+REPR.maxstring = 80
+REPR.maxother = 80
+
+
+@attr.frozen
+class Scope:
+    """The locals of step `f_id`, or the value at JSON `path` in them, read when they are expanded."""
+
+    f_id: int
+    path: str = "$"
+
+
+def named(items: Any, start: int, count: int) -> List[Tuple[str, Any]]:
+    stop = start + count if count else None
+    return [(str(name), value) for name, value in islice(items, start, stop)]
+
+
+class Variables:
+    """Variables hands out variablesReferences, and answers each `variables` request with a page of children.
+
+    Only the requested page of a container is read: from the stored document, by SQLite (see
+    `Navigator.children`). Documents it can't read that way are decoded whole, their pickled values (see
+    LazyValue) are only unpickled once expanded. References are valid until the navigator moves (see `clear`).
+    """
+
+    def __init__(self, navigator: Navigator):
+        self.navigator = navigator
+        # Never reused, a reference from before a move can't point at another value.
+        self.containers: Dict[int, Any] = {}
+        self.last_reference = 0
+
+    def clear(self):
+        self.containers.clear()
+
+    def reference(self, value: Any) -> int:
+        self.last_reference += 1
+        self.containers[self.last_reference] = value
+        return self.last_reference
+
+    def children(self, reference: int, start: int = 0, count: int = 0) -> List[Message]:
+        value = self.containers.get(reference)
+        if value is None:
+            raise ValueError(f"Unknown variablesReference {reference}")
+        if isinstance(value, Scope):
+            children = self.navigator.children(value.f_id, value.path, start, count)
+            if children is not None:
+                return [self.render_child(value.f_id, child) for child in children]
+            # Only the locals themselves: Scopes of values inside are for documents `children` reads.
+            items = named(self.navigator.locals(value.f_id).items(), start, count)
+        elif isinstance(value, LazyValue):
+            items = [("value", value.value)]
+        elif isinstance(value, dict):
+            summary = value.get("$buffer")
+            items = named((summary or value).items(), start, count)
+        elif isinstance(value, (list, tuple)):
+            stop = len(value) if not count else min(len(value), start + count)
+            items = [(str(i), value[i]) for i in range(start, stop)]
+        elif isinstance(value, (set, frozenset)):
+            items = named(enumerate(value), start, count)
+        else:
+            items = named(vars(value).items(), start, count)
+        return [self.render(name, child) for name, child in items]
+
+    def render_child(self, f_id: int, child: Child) -> Message:
+        """A DAP Variable for a value read from step `f_id`'s document, containers expanded from there too."""
+        if not child.is_container:
+            return self.render(child.name, child.value)
+        size = "indexedVariables" if isinstance(child.value, list) else "namedVariables"
+        return {
+            "name": child.name,
+            "type": type(child.value).__name__,
+            # Their first few children, as much as the repr shows.
+            "value": REPR.repr(child.value),
+            "variablesReference": self.reference(Scope(f_id, child.path)),
+            size: child.size,
+        }
+
+    def render(self, name: str, value: Any) -> Message:
+        """A DAP Variable, expandable when `value` has children."""
+        variable = {"name": name, "type": type(value).__name__, "variablesReference": 0}
+        if isinstance(value, LazyValue):
+            # Unpickled when the client expands it.
+            variable.update(
+                value="<pickled>",
+                variablesReference=self.reference(value),
+                presentationHint={"lazy": True},
+            )
+        elif isinstance(value, dict) and value.keys() == {"$blob"}:
+            blob = value["$blob"]
+            variable.update(type=blob["type"], value=f"<{blob['nbytes']} bytes>")
+        elif isinstance(value, dict) and value.keys() == {"$buffer"}:
+            summary = value["$buffer"]
+            variable.update(
+                type=summary.get("type", "buffer"),
+                value=f"shape={summary.get('shape')} dtype={summary.get('dtype')}",
+                variablesReference=self.reference(value),
+            )
+        elif isinstance(value, dict):
+            variable.update(
+                value=REPR.repr(value),
+                variablesReference=self.reference(value),
+                namedVariables=len(value),
+            )
+        elif isinstance(value, (list, tuple)):
+            variable.update(
+                value=REPR.repr(value),
+                variablesReference=self.reference(value),
+                indexedVariables=len(value),
+            )
+        elif isinstance(value, (set, frozenset)):
+            variable.update(
+                value=REPR.repr(value),
+                variablesReference=self.reference(value),
+                indexedVariables=len(value),
+            )
+        elif isinstance(value, (str, int, float, bool, type(None), bytes)):
+            variable["value"] = REPR.repr(value)
+        else:
+            # An unpickled object.
+            variable.update(
+                value=REPR.repr(value),
+                variablesReference=self.reference(value)
+                if hasattr(value, "__dict__")
+                else 0,
+            )
+        return variable
+
+
+class DebugSession:
+    """DebugSession answers one client's Debug Adapter Protocol requests from a recorded run.
+
+    >>> asyncio.run(serve_tcp(port=4711))
+
+    The client launches with {"database": path or URI (default $GOET_DB), "runId": runs.id (default the latest)}
+    and starts stopped at the run's first step. Steps go both ways: next, stepIn, stepOut, continue (to the next
+    breakpoint hit), and stepBack, reverseContinue. See Navigator.
+
+    Requests are handled concurrently, each in a task of its own: ones that read the recording run in a
+    single worker thread (which owns the database connections), so they never block the others, nor reading
+    further requests.
+    """
+
+    def __init__(self, channel: Channel, database: Optional[Database] = None):
+        self.channel = channel
+        self.database = database
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="goet-dap")
+        self.navigator: Optional[Navigator] = None
+        self.variables: Optional[Variables] = None
+        # path -> breakpoint lines.
+        self.breakpoints: Dict[str, Set[int]] = {}
+        # The run's recorded filenames, once a breakpoint is looked for.
+        self.filenames: Optional[Set[str]] = None
+        self.tasks: Set["asyncio.Task"] = set()
+
+    async def run(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                if message.get("type") != "request":
+                    continue
+                task = asyncio.ensure_future(self.handle(message))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+                if message["command"] == "disconnect":
+                    await task
+                    break
+            if self.tasks:
+                await asyncio.wait(self.tasks)
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def handle(self, request: Message):
+        handler = getattr(self, f"on_{request['command']}", None)
+        if handler is None:
+            await self.channel.respond(
+                request, error=f"Unsupported request {request['command']!r}"
+            )
+            return
+        events: Events = []
+        try:
+            body = await handler(request.get("arguments") or {}, events)
+        except Exception as e:
+            await self.channel.respond(request, error=f"{type(e).__name__}: {e}")
+            return
+        await self.channel.respond(request, body)
+        for event, event_body in events:
+            await self.channel.event(event, event_body)
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Run `fn` in the worker thread, after what earlier requests queued there.
+
+        Only the worker touches the navigator: a request sent right after launch waits for it to be opened.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, fn, *args
+        )
+
+    async def on_initialize(self, arguments: Message, events: Events) -> Message:
+        events.append(("initialized", {}))
+        return CAPABILITIES
+
+    async def on_launch(self, arguments: Message, events: Events):
+        database = arguments.get("database", self.database)
+        await self.call(self.open, database, arguments.get("runId"))
+        events.append(("stopped", self.stopped("entry")))
+
+    async def on_attach(self, arguments: Message, events: Events):
+        await self.on_launch(arguments, events)
+
+    def open(self, database: Optional[Database], run_id: Optional[int]):
+        connection = connect(database)
+        if run_id is None:
+            runs = list_runs(connection)
+            if not runs:
+                raise ValueError("No recorded runs")
+            run_id = runs[0].id
+        self.navigator = Navigator(connection, run_id)
+        self.variables = Variables(self.navigator)
+        self.filenames = None
+
+    async def on_configurationDone(self, arguments: Message, events: Events):
+        pass
+
+    async def on_setBreakpoints(self, arguments: Message, events: Events) -> Message:
+        path = arguments["source"]["path"]
+        lines = [breakpoint["line"] for breakpoint in arguments.get("breakpoints", [])]
+        self.breakpoints[path] = set(lines)
+        recorded = await self.call(self.recorded_lines, path, lines)
+        return {
+            "breakpoints": [
+                {"verified": True, "line": line}
+                if line in recorded
+                else {"verified": False, "line": line, "message": "Line not run in this recording"}
+                for line in lines
+            ]
+        }
+
+    async def on_threads(self, arguments: Message, events: Events) -> Message:
+        return {"threads": [{"id": THREAD_ID, "name": "main"}]}
+
+    async def on_stackTrace(self, arguments: Message, events: Events) -> Message:
+        return await self.call(
+            self.stack_trace, arguments.get("startFrame", 0), arguments.get("levels", 0)
+        )
+
+    def stack_trace(self, start: int, levels: int) -> Message:
+        stack = self.navigator.stack_at(self.navigator.current.f_id)
+        frames = stack[start : start + levels if levels else None]
+        return {
+            "stackFrames": [
+                {
+                    "id": step.f_id,
+                    "name": step.f_funcname,
+                    "source": {
+                        "name": os.path.basename(step.f_filename),
+                        "path": step.f_filename,
+                    },
+                    "line": step.f_lineno,
+                    "column": 1,
+                }
+                for step in frames
+            ],
+            "totalFrames": len(stack),
+        }
+
+    async def on_scopes(self, arguments: Message, events: Events) -> Message:
+        scope = Scope(arguments["frameId"])
+        reference = await self.call(lambda: self.variables.reference(scope))
+        return {
+            "scopes": [
+                {"name": "Locals", "variablesReference": reference, "expensive": False}
+            ]
+        }
+
+    async def on_variables(self, arguments: Message, events: Events) -> Message:
+        variables = await self.call(
+            lambda: self.variables.children(
+                arguments["variablesReference"],
+                arguments.get("start", 0),
+                arguments.get("count", 0),
+            )
+        )
+        return {"variables": variables}
+
+    def stopped(self, reason: str) -> Message:
+        return {"reason": reason, "threadId": THREAD_ID, "allThreadsStopped": True}
+
+    async def move(self, events: Events, move: Callable[[], Any]):
+        """Move the navigator, and report the stop. At either end of the run it stays where it is.
+
+        `move` returns the reason of the stop, or anything else for a step. Loop iterations the move went past
+        without a record of them (see Loops) are reported on the console.
+        """
+
+        def moved() -> Tuple[str, List[Loop]]:
+            self.variables.clear()
+            start = self.navigator.current.f_id
+            reason = move()
+            elided = self.navigator.elided(start, self.navigator.current.f_id)
+            return reason if isinstance(reason, str) else "step", elided
+
+        reason, elided = await self.call(moved)
+        for loop in elided:
+            output = (
+                f"{os.path.basename(loop.f_filename)}:{loop.f_lineno} ({loop.f_funcname}):"
+                f" loop ran {loop.elided:,} more times, not recorded\n"
+            )
+            events.append(("output", {"category": "console", "output": output}))
+        events.append(("stopped", self.stopped(reason)))
+
+    async def on_next(self, arguments: Message, events: Events):
+        await self.move(events, lambda: self.navigator.step_over())
+
+    async def on_stepIn(self, arguments: Message, events: Events):
+        await self.move(events, lambda: self.navigator.step_forward())
+
+    async def on_stepOut(self, arguments: Message, events: Events):
+        await self.move(events, lambda: self.navigator.step_out())
+
+    async def on_stepBack(self, arguments: Message, events: Events):
+        await self.move(events, lambda: self.navigator.step_back())
+
+    async def on_continue(self, arguments: Message, events: Events) -> Message:
+        await self.move(events, lambda: self.run_to_breakpoint(reverse=False))
+        return {"allThreadsContinued": True}
+
+    async def on_reverseContinue(self, arguments: Message, events: Events):
+        await self.move(events, lambda: self.run_to_breakpoint(reverse=True))
+
+    def recorded_filenames(self, path: str) -> List[str]:
+        """The recorded filenames naming the client's `path`.
+
+        A script started with a relative path records relative co_filenames (relative to the traced process's
+        working directory, not ours): they name any path ending with them, see `matches`.
+        """
+        if self.filenames is None:
+            self.filenames = self.navigator.filenames()
+        return [
+            filename
+            for filename in self.filenames
+            if matches(path, os.path.normpath(filename))
+        ]
+
+    def recorded_lines(self, path: str, lines: List[int]) -> Set[int]:
+        """The `lines` of the client's `path` the run has a step at."""
+        if self.navigator is None:
+            return set()
+        filenames = self.recorded_filenames(path)
+        return {
+            line
+            for line in lines
+            if any(
+                self.navigator.find("f_filename = ? AND f_lineno = ?", (filename, line)) is not None
+                for filename in filenames
+            )
+        }
+
+    def run_to_breakpoint(self, reverse: bool) -> str:
+        """Go to the next (or previous) breakpoint hit, or to the end (or start) of the run without one."""
+        navigator = self.navigator
+        f_id = navigator.current.f_id
+        where = f"f_filename = ? AND f_lineno = ? AND f_id {'<' if reverse else '>'} ?"
+        hits = [
+            navigator.find(where, (filename, line, f_id), after=f_id, reverse=reverse)
+            for path, lines in list(self.breakpoints.items())
+            for filename in self.recorded_filenames(path)
+            for line in lines
+        ]
+        hits = [hit for hit in hits if hit is not None]
+        if hits:
+            navigator.goto(max(hits) if reverse else min(hits))
+            return "breakpoint"
+        # The first step, or the last one.
+        navigator.goto(
+            navigator.find("f_id > ?", (0,), after=0 if reverse else sys.maxsize, reverse=not reverse)
+        )
+        return "step"
+
+    async def on_disconnect(self, arguments: Message, events: Events):
+        # Answered after the requests already queued in the worker.
+        await self.call(lambda: None)
+
+
+async def serve_stdio(database: Optional[Database] = None):
+    """Serve a single client over stdin/stdout, as editors launch debug adapters."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout
+    )
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    await DebugSession(Channel(writer), database).run(reader)
+
+
+async def serve_tcp(
+    database: Optional[Database] = None,
+    host: str = "127.0.0.1",
+    port: int = 4711,
+    ready: Optional[Callable[[asyncio.AbstractServer], None]] = None,
+):
+    """Serve clients on a local socket, a session each. `ready` is called with the server once it listens."""
+
+    async def session(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await DebugSession(Channel(writer), database).run(reader)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(session, host, port)
+    if ready is not None:
+        ready(server)
+    async with server:
+        await server.serve_forever()
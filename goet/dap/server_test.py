@@ -0,0 +1,214 @@
+import asyncio
+import os
+import tempfile
+import types
+
+from goet.dap.protocol import encode_message, read_message
+from goet.dap.server import serve_tcp
+from goet.tracer.sql import SqlTracer
+
+
+def work():
+    numbers = list(range(10000))
+    point = {"x": 1, "y": [1, 2]}
+    total = sum(numbers)
+    return total
+
+
+LINE = work.__code__.co_firstlineno
+
+path = os.path.join(tempfile.mkdtemp(), "dap.sqlite3")
+recorded = SqlTracer(path)
+with recorded as t:
+    work()
+pickled = SqlTracer(path, pickle_values=True)
+with pickled as t:
+    work()
+# As if the script was started with a relative path.
+relative_work = types.FunctionType(
+    work.__code__.replace(co_filename=os.path.join(".", os.path.relpath(__file__))), globals()
+)
+relative = SqlTracer(path)
+with relative as t:
+    relative_work()
+
+
+class Client:
+    """A DAP client: `request` waits for the response, events are queued in `events`."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.seq = 0
+        self.responses = {}
+        self.events = asyncio.Queue()
+        self.reading = asyncio.ensure_future(self.read(reader))
+
+    async def read(self, reader):
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                return
+            if message["type"] == "response":
+                self.responses.pop(message["request_seq"]).set_result(message)
+            else:
+                await self.events.put(message)
+
+    async def request(self, command, **arguments):
+        self.seq += 1
+        response = self.responses[self.seq] = asyncio.get_running_loop().create_future()
+        self.writer.write(
+            encode_message(
+                {"seq": self.seq, "type": "request", "command": command, "arguments": arguments}
+            )
+        )
+        return await response
+
+    async def body(self, command, **arguments):
+        response = await self.request(command, **arguments)
+        assert response["success"], response
+        return response.get("body")
+
+    async def event(self, name):
+        event = await self.events.get()
+        assert event["event"] == name, event
+        return event.get("body")
+
+    async def top(self):
+        (frame,) = (await self.body("stackTrace", threadId=1, levels=1))["stackFrames"]
+        return frame["name"], frame["line"] - LINE
+
+    async def locals(self):
+        (frame,) = (await self.body("stackTrace", threadId=1, levels=1))["stackFrames"]
+        (scope,) = (await self.body("scopes", frameId=frame["id"]))["scopes"]
+        variables = await self.body("variables", variablesReference=scope["variablesReference"])
+        return {variable["name"]: variable for variable in variables["variables"]}
+
+
+async def session(port: int, run_id: int) -> Client:
+    client = Client(*await asyncio.open_connection("127.0.0.1", port))
+    capabilities = await client.body("initialize", adapterID="goet")
+    assert capabilities["supportsStepBack"]
+    await client.event("initialized")
+    await client.body("launch", database=path, runId=run_id)
+    assert (await client.event("stopped"))["reason"] == "entry"
+    return client
+
+
+async def main(port: int):
+    client = await session(port, recorded.run_id)
+    breakpoints = await client.body(
+        "setBreakpoints",
+        source={"path": __file__},
+        breakpoints=[{"line": LINE + 3}, {"line": LINE - 2}],
+    )
+    # Only lines the run has a step at.
+    assert [breakpoint["verified"] for breakpoint in breakpoints["breakpoints"]] == [True, False]
+    unrecorded = await client.body(
+        "setBreakpoints",
+        source={"path": os.path.join(os.path.dirname(__file__), "other.py")},
+        breakpoints=[{"line": 1}],
+    )
+    assert not unrecorded["breakpoints"][0]["verified"]
+    await client.body("configurationDone")
+
+    await client.body("continue", threadId=1)
+    assert (await client.event("stopped"))["reason"] == "breakpoint"
+    assert await client.top() == ("work", 3)
+    variables = await client.locals()
+    assert variables["numbers"]["indexedVariables"] == 10000
+    assert variables["point"]["namedVariables"] == 2
+
+    # Only the requested page of a container.
+    page = await client.body(
+        "variables",
+        variablesReference=variables["numbers"]["variablesReference"],
+        start=5000,
+        count=3,
+    )
+    assert [(v["name"], v["value"]) for v in page["variables"]] == [
+        ("5000", "5000"),
+        ("5001", "5001"),
+        ("5002", "5002"),
+    ]
+    point = await client.body(
+        "variables", variablesReference=variables["point"]["variablesReference"]
+    )
+    assert [(v["name"], v["value"]) for v in point["variables"]] == [
+        ("x", "1"),
+        ("y", "[1, 2]"),
+    ]
+
+    # Requests sent together are all answered.
+    threads, stack = await asyncio.gather(
+        client.body("threads"), client.body("stackTrace", threadId=1)
+    )
+    assert threads["threads"] == [{"id": 1, "name": "main"}]
+    assert [frame["name"] for frame in stack["stackFrames"]][:2] == ["work", "<module>"]
+
+    await client.body("stepBack", threadId=1)
+    await client.event("stopped")
+    assert await client.top() == ("work", 2)
+    # References don't survive a move.
+    stale = await client.request(
+        "variables", variablesReference=variables["numbers"]["variablesReference"]
+    )
+    assert not stale["success"]
+
+    await client.body("next", threadId=1)
+    await client.event("stopped")
+    assert await client.top() == ("work", 3)
+    await client.body("next", threadId=1)
+    await client.event("stopped")
+    assert await client.top() == ("work", 4)
+    # Out to the module's `with` line, or before 3.10 (no line there) nowhere, staying put.
+    await client.body("stepOut", threadId=1)
+    await client.event("stopped")
+    top = await client.top()
+    assert top == ("work", 4) or top[0] == "<module>"
+
+    await client.body("reverseContinue", threadId=1)
+    assert (await client.event("stopped"))["reason"] == "breakpoint"
+    assert await client.top() == ("work", 3)
+    # No breakpoint hit before this one: back to the start of the run.
+    await client.body("reverseContinue", threadId=1)
+    assert (await client.event("stopped"))["reason"] == "step"
+    assert (await client.top())[0] == "<module>"
+
+    assert not (await client.request("evaluate", expression="numbers"))["success"]
+    await client.body("disconnect")
+    await client.reading
+
+    # Pickled locals are only unpickled once expanded.
+    client = await session(port, pickled.run_id)
+    await client.body("setBreakpoints", source={"path": __file__}, breakpoints=[{"line": LINE + 3}])
+    await client.body("continue", threadId=1)
+    await client.event("stopped")
+    numbers = (await client.locals())["numbers"]
+    assert numbers["presentationHint"] == {"lazy": True}
+    (value,) = (
+        await client.body("variables", variablesReference=numbers["variablesReference"])
+    )["variables"]
+    assert value["type"] == "list" and value["indexedVariables"] == 10000
+    await client.body("disconnect")
+    await client.reading
+
+    # Breakpoints set on the absolute path hit in files recorded with a relative one.
+    client = await session(port, relative.run_id)
+    await client.body("setBreakpoints", source={"path": __file__}, breakpoints=[{"line": LINE + 3}])
+    await client.body("continue", threadId=1)
+    assert (await client.event("stopped"))["reason"] == "breakpoint"
+    assert "point" in await client.locals()
+    await client.body("disconnect")
+
+
+async def run():
+    listening = asyncio.get_running_loop().create_future()
+    server = asyncio.ensure_future(serve_tcp(port=0, ready=listening.set_result))
+    port = (await listening).sockets[0].getsockname()[1]
+    try:
+        await main(port)
+    finally:
+        server.cancel()
+
+
+asyncio.run(run())
@@ -0,0 +1,72 @@
+"""Measure what `import goet` costs, and fail if it regressed.
+
+    python -m goet.import_bench
+
+Runs `python -X importtime -c "import goet"` in fresh interpreters and reports the median cumulative import time
+of the goet package, and its slowest imports. Exits non-zero when it's over BUDGET_US, or when `import goet` pulled
+in a module it shouldn't (tracers, converters, sqlite3: all imported on first use instead).
+"""
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+RUNS = 15
+# Microseconds. Typically well under 1ms, the budget leaves room for slow machines.
+BUDGET_US = 5000
+# Nothing that does I/O or takes tens of milliseconds to import.
+FORBIDDEN = ("sqlite3", "cattr", "attr", "goet.tracer", "goet.lib", "goet.sink")
+
+CHECK = f"""
+import sys
+import goet
+loaded = [m for m in sys.modules if m.split(".")[0] in {FORBIDDEN!r} or m.startswith({FORBIDDEN!r})]
+print("\\n".join(loaded))
+"""
+
+
+def importtime() -> Dict[str, Tuple[int, int]]:
+    """module -> (self, cumulative) microseconds, for `goet` and the modules importing it imported."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import goet"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, module = line[len("import time:") :].split("|")
+        rows.append((module, int(own), int(cumulative)))
+    # A module's imports are listed before it, indented: goet's are the indented lines right above it.
+    times = {}
+    for module, own, cumulative in reversed(rows):
+        if times and not module.startswith("  "):
+            break
+        if times or module.strip() == "goet":
+            times[module.strip()] = (own, cumulative)
+    return times
+
+
+def main():
+    runs = [importtime() for _ in range(RUNS)]
+    cumulative: List[int] = [times["goet"][1] for times in runs]
+    median = statistics.median(cumulative)
+    print(f"import goet: median {median / 1000:.2f}ms, min {min(cumulative) / 1000:.2f}ms ({RUNS} runs)")
+
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)[:5]
+    for module, (own, _) in slowest:
+        print(f"  {own / 1000:8.2f}ms  {module}")
+
+    loaded = subprocess.run(
+        [sys.executable, "-c", CHECK], capture_output=True, text=True, check=True
+    ).stdout.split()
+    if loaded:
+        sys.exit(f"import goet imported {', '.join(sorted(loaded))}")
+    if median > BUDGET_US:
+        sys.exit(f"import goet took {median / 1000:.2f}ms, over the {BUDGET_US / 1000:.0f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
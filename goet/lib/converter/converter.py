@@ -1,8 +1,7 @@
-from collections import defaultdict
-from collections.abc import Set
+from collections.abc import Mapping, Set
 from base64 import b85encode
 from datetime import datetime
-from typing import Any, Union
+from typing import Any, Iterable, Optional, Tuple, Union
 from types import (
     BuiltinFunctionType,
     BuiltinMethodType,
@@ -15,7 +14,8 @@ from types import (
 from cattr.converters import Converter, GenConverter, NoneType
 
 from functools import partial
-from textwrap import shorten
+
+from goet.lib.converter.summarizers import Blobs, store_blob, summarize, summarizer_for
 
 
 def is_function(obj):
@@ -32,8 +32,11 @@ def is_function(obj):
     )
 
 
+PRIMITIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
 def is_jsonable_primitive(typ: type) -> bool:
-    return typ in (str, int, float, bool, type(None))
+    return typ in PRIMITIVE_TYPES
 
 
 def is_jsonable_container(typ: type) -> bool:
@@ -48,19 +51,62 @@ def is_not_jsonable(obj: Any) -> bool:
     return not is_jsonable(obj)
 
 
+# Bytes-like values at least this big go to the blob store (when there is one) instead of inline Base85.
+BLOB_SIZE = 1024
+
+# A dict whose only key is one of these is written as {"$dict": the dict}, so it's not read back as a marker.
+ESCAPED = "$dict"
+# Single key objects written in place of a value.
+MARKERS = ("$ref", "$blob", "$buffer", "$pickle", ESCAPED)
+
+# Types written as their repr, like modules (see `register_opaque`).
+OPAQUE_TYPES: Tuple[type, ...] = ()
+
+
+def register_opaque(typ: type):
+    """Write instances of `typ` (and its subclasses) as their repr, not their attributes.
+
+    For goet's own objects (tracers, sinks) met in traced code: their state isn't the program's, and recording
+    it would copy pending events back into the recording.
+    """
+    global OPAQUE_TYPES
+    OPAQUE_TYPES += (typ,)
+
+
+def unstructure_bytes(b: bytes) -> str:
+    return (b85encode(b) if b else b"").decode("utf8")
+
+
+def unstructure_datetime(dt: datetime) -> str:
+    return dt.isoformat()
+
+
 def unstructure_complex_types(
     obj: Any,
     memo: dict,
+    blobs: Optional[Blobs] = None,
 ) -> Union[str, int, float, bool, NoneType, list, dict]:
-    # Handles recursive cases
-    if is_jsonable_primitive(type(obj)):
-        return obj
+    """Unstructure `obj`, emitting each distinct object only once.
 
-    obj_id = id(obj)
-    if obj_id in memo:
-        return f"<recursive {shorten(repr(obj), width=30, placeholder=' ...')}>"
-    else:
-        memo[obj_id] = True
+    Every object that becomes a JSON container (dict or list) is numbered in the order it is first emitted.
+    Later occurrences, including recursive ones, are emitted as {"$ref": n} (see `resolve_refs`).
+    `memo` maps id(obj) -> (n, obj), share it to keep numbering across several values.
+
+    Buffer-like values (numpy arrays, array.array, memoryview, pandas objects) are emitted as
+    {"$buffer": summary} (see `Summarizer`). With `blobs`, bytes and bytearrays of at least BLOB_SIZE are
+    stored there as raw bytes and emitted as {"$blob": summary}, which isn't numbered.
+
+    Dicts that would read as one of these markers are escaped (see `unstructure_items`).
+    """
+    typ = type(obj)
+    if is_jsonable_primitive(typ):
+        return obj
+    elif typ is bytes or typ is bytearray:
+        if blobs is not None and len(obj) >= BLOB_SIZE:
+            return {"$blob": store_blob(obj, blobs)}
+        return unstructure_bytes(obj)
+    elif isinstance(obj, datetime):
+        return unstructure_datetime(obj)
 
     unknown_name = "<unknown>"
     if is_function(obj):
@@ -68,53 +114,137 @@ def unstructure_complex_types(
         return f"<function {name}>"
     elif isinstance(obj, ModuleType):
         return repr(obj)
-    elif isinstance(obj, type):
+    elif isinstance(obj, type) or isinstance(obj, OPAQUE_TYPES):
         return repr(obj)
+
+    # Handles shared and recursive references. Keep `obj` alive so its id can't be reused meanwhile.
+    obj_id = id(obj)
+    seen = memo.get(obj_id)
+    if seen is not None:
+        return {"$ref": seen[0]}
+    memo[obj_id] = (len(memo), obj)
+
+    summarizer = summarizer_for(typ)
+    if summarizer is not None:
+        return {"$buffer": summarize(obj, summarizer, blobs)}
+    elif typ in (list, tuple, set, frozenset):
+        return [unstructure_complex_types(x, memo, blobs) for x in obj]
+    elif typ is dict:
+        return unstructure_items(obj.items(), memo, blobs)
     elif hasattr(obj, "__slots__") and obj.__slots__:
-        return {
-            slot: unstructure_complex_types(getattr(obj, slot), memo)
-            for slot in obj.__slots__
-            if not slot.startswith("__") and hasattr(obj, slot)
-        }
+        return unstructure_items(
+            (
+                (slot, getattr(obj, slot))
+                for slot in obj.__slots__
+                if not slot.startswith("__") and hasattr(obj, slot)
+            ),
+            memo,
+            blobs,
+        )
     elif hasattr(obj, "__dict__"):
-        if isinstance(obj, type):
-            return {obj.__name__: repr(obj)}
-        return {
-            k: unstructure_complex_types(v, memo)
-            for k, v in obj.__dict__.items()
-            if not k.startswith("__")
-        }
-    elif isinstance(obj, (dict, defaultdict)):
-        return {
-            str(k): unstructure_complex_types(v, memo)
-            for k, v in obj.items()
-            if not str(k).startswith("__")
-        }
+        return unstructure_items(
+            ((k, v) for k, v in obj.__dict__.items() if not k.startswith("__")),
+            memo,
+            blobs,
+        )
+    elif isinstance(obj, Mapping):
+        # Also covers FrameLocalsProxy, what `frame.f_locals` returns on Python 3.13+.
+        return unstructure_items(
+            ((k, v) for k, v in obj.items() if not str(k).startswith("__")), memo, blobs
+        )
     elif hasattr(obj, "__iter__"):
-        return [unstructure_complex_types(x, memo) for x in iter(obj)]
+        size = len(memo)
+        try:
+            return [unstructure_complex_types(x, memo, blobs) for x in iter(obj)]
+        except Exception:
+            # e.g. a cursor of a closed connection. Forget what was numbered meanwhile, it isn't emitted.
+            for key in list(memo)[size:]:
+                del memo[key]
+            return []
     else:
         # return {repr(obj): unknown_name}
         return {}
 
 
+def unstructure_items(items: Iterable[Tuple[Any, Any]], memo: dict, blobs: Optional[Blobs] = None) -> dict:
+    """Unstructure the items of a dict-like object into a JSON object.
+
+    Keys that are equal once converted to str (e.g. 1 and "1") are kept apart by using the repr of the later
+    ones, and a value is only unstructured once its key is settled, so only what's emitted is numbered.
+    """
+    result = {}
+    for k, v in items:
+        key = k if type(k) is str else str(k)
+        if key in result:
+            key = repr(k)
+            if key in result:
+                continue
+        result[key] = unstructure_complex_types(v, memo, blobs)
+    if len(result) == 1 and next(iter(result)) in MARKERS:
+        return {ESCAPED: result}
+    return result
+
+
+def unstructure_snapshot(
+    f_locals: Mapping[str, Any], blobs: Optional[Blobs] = None
+) -> dict:
+    """Unstructure all locals of a line at once, so objects shared between locals are emitted once."""
+    memo: dict = {}
+    # Most locals are primitives, emitted as they are.
+    return {
+        str(name): value
+        if type(value) in PRIMITIVE_TYPES
+        else unstructure_complex_types(value, memo, blobs)
+        for name, value in f_locals.items()
+    }
+
+
+def resolve_refs(snapshot: dict) -> dict:
+    """Replace {"$ref": n} with the n-th emitted container, restoring aliasing (and cycles) in place."""
+    containers: list = []
+
+    def resolve(value):
+        if isinstance(value, dict):
+            if value.keys() == {"$ref"}:
+                return containers[value["$ref"]]
+            if value.keys() == {"$blob"} or value.keys() == {"$pickle"}:
+                # Not numbered.
+                return value
+            if value.keys() == {ESCAPED}:
+                value = value[ESCAPED]
+                containers.append(value)
+                for k, v in value.items():
+                    value[k] = resolve(v)
+                return value
+            containers.append(value)
+            if value.keys() == {"$buffer"}:
+                # Emitted as a whole, nothing inside a summary is numbered.
+                return value
+            for k, v in value.items():
+                value[k] = resolve(v)
+        elif isinstance(value, list):
+            containers.append(value)
+            for i, v in enumerate(value):
+                value[i] = resolve(v)
+        return value
+
+    for name, value in snapshot.items():
+        snapshot[name] = resolve(value)
+    return snapshot
+
+
 def configure_converter(converter: Converter):
     """
     Configure the converter for use with the stdlib json module.
 
-    * bytes are serialized as base64 strings
+    * bytes are serialized as base85 strings
     * datetimes are serialized as ISO 8601
     * counters are serialized as dicts
     * sets are serialized as lists
+    * buffers (numpy arrays, array.array, memoryview, pandas objects) are summarized
     """
 
-    def unstructure_bytes(b: bytes) -> str:
-        return (b85encode(b) if b else b"").decode("utf8")
-
     converter.register_unstructure_hook(bytes, unstructure_bytes)
-
-    def unstructure_datetime(dt: datetime) -> str:
-        return dt.isoformat()
-
     converter.register_unstructure_hook(datetime, unstructure_datetime)
 
     converter.register_unstructure_hook_func(
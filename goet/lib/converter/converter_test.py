@@ -2,10 +2,16 @@ import json
 from collections import Counter, defaultdict
 from dataclasses import dataclass
 from datetime import datetime
+from types import MappingProxyType
 from typing import Any, Dict
 
 import attr
-from goet.lib.converter.converter import make_converter
+from goet.lib.converter.converter import (
+    make_converter,
+    register_opaque,
+    resolve_refs,
+    unstructure_snapshot,
+)
 
 converter = make_converter()
 
@@ -42,6 +48,7 @@ test({}, "{}")
 test({"a": 1}, '{"a": 1}')
 test(Counter(), "{}")
 test(defaultdict(), "{}")
+test(MappingProxyType({"a": 1}), '{"a": 1}')
 
 # Bytes
 test(b"123", '"F)}j"')
@@ -103,7 +110,84 @@ test(F(f=F(f=None)), json.dumps({"f": {"f": None}}))
 # Recursive class
 ff = F(f=None)
 ff.f = ff
-test(ff, '{"f": "<recursive <__main__.F object at ...>"}')
+test(ff, '{"f": {"$ref": 0}}')
+
+# Shared references are emitted once per snapshot
+shared = B(x=[1])
+snapshot = unstructure_snapshot({"a": shared, "b": [shared, shared.x], "ff": ff})
+test(
+    snapshot,
+    '{"a": {"x": [1]}, "b": [{"$ref": 0}, {"$ref": 1}], "ff": {"f": {"$ref": 3}}}',
+)
+resolved = resolve_refs(json.loads(json.dumps(snapshot)))
+assert resolved["b"][0] is resolved["a"]
+assert resolved["b"][1] is resolved["a"]["x"]
+assert resolved["ff"]["f"] is resolved["ff"]
+
+# Dicts that look like markers are escaped, and read back as they were
+x = [1]
+snapshot = unstructure_snapshot({"x": x, "c": {"$ref": 0}, "d": {"$dict": x}, "e": B(x={"$blob": 1})})
+assert snapshot["c"] == {"$dict": {"$ref": 0}}, snapshot
+resolved = resolve_refs(json.loads(json.dumps(snapshot)))
+assert resolved["c"] == {"$ref": 0} and resolved["d"] == {"$dict": [1]} and resolved["d"]["$dict"] is resolved["x"]
+assert resolved["e"] == {"x": {"$blob": 1}}
+
+# Keys equal once converted to str are kept apart, and only emitted values are numbered
+y, z = [7], ["x"]
+snapshot = unstructure_snapshot({"y": {1: y, "1": z, "'1'": [0]}, "z": z})
+resolved = resolve_refs(json.loads(json.dumps(snapshot)))
+assert resolved["y"] == {"1": [7], "'1'": ["x"], "\"'1'\"": [0]} and resolved["z"] == ["x"], resolved
+assert resolved["z"] is resolved["y"]["'1'"]
+
+# Buffers are summarized, not converted element by element
+from array import array
+
+test(
+    array("i", range(10)),
+    '{"$buffer": {"type": "array.array", "shape": [10], "dtype": "i", "nbytes": 40, '
+    '"head": [0, 1, 2], "tail": [7, 8, 9], "hash": "985cf028840e4c1d2f9011a224900445"}}',
+)
+test(
+    memoryview(b"ab"),
+    '{"$buffer": {"type": "memoryview", "shape": [2], "dtype": "B", "nbytes": 2, '
+    '"head": [97, 98], "tail": [], "hash": "3dc9ae220222e2e156b2a5abb60d01c7"}}',
+)
+# A summary counts as one container, nothing inside it is numbered
+buffer, shared = array("b"), [1]
+snapshot = unstructure_snapshot({"a": buffer, "b": [buffer, shared], "c": shared})
+assert snapshot["b"][0] == {"$ref": 0} and snapshot["c"] == {"$ref": 2}
+resolved = resolve_refs(json.loads(json.dumps(snapshot)))
+assert resolved["b"][0] is resolved["a"]
+assert resolved["c"] is resolved["b"][1]
+
+
+# Large bytes-like values go to the blob store, when there is one
+class Blobs:
+    buffers = False
+
+    def __init__(self):
+        self.data = {}
+
+    def put(self, digest, buffer):
+        self.data[digest] = bytes(buffer)
+
+
+blobs = Blobs()
+large = bytearray(2048)
+snapshot = unstructure_snapshot({"a": b"123", "b": large, "c": [large]}, blobs)
+assert snapshot["a"] == "F)}j"
+assert snapshot["b"] == snapshot["c"][0] == {
+    "$blob": {
+        "type": "bytearray",
+        "nbytes": 2048,
+        "hash": "6b388b264f7a0fd2be5a45e0b4c1c1a3",
+    }
+}
+assert blobs.data == {"6b388b264f7a0fd2be5a45e0b4c1c1a3": bytes(2048)}
+resolved = resolve_refs({**json.loads(json.dumps(snapshot)), "d": [{"$ref": 0}]})
+assert resolved["d"][0] is resolved["c"]
+test(bytearray(b"123"), '"F)}j"')
+
 
 # Functions
 def f():
@@ -137,6 +221,20 @@ test(lambda: 1, '"<function <lambda>>"')
 
 # Containers[Complex]
 test({"a": {"b": b"123"}}, '{"a": {"b": "F)}j"}}')
+test(B(x=b"123"), '{"x": "F)}j"}')
 test({"a": {"f": f}}, '{"a": {"f": "<function f>"}}')
 test({"a": {"A": A}}, '{"a": {"A": "<class \'__main__.A\'>"}}')
 test({"a": {"b": B(x=1)}}, '{"a": {"b": {"x": 1}}}')
+
+
+# Opaque types are written as their repr, not their attributes.
+class Recorder:
+    def __init__(self):
+        self.pending = ["recorded"]
+
+    def __repr__(self):
+        return "<Recorder>"
+
+
+register_opaque(Recorder)
+assert unstructure_snapshot({"r": Recorder(), "b": B(x=1)}) == {"r": "<Recorder>", "b": {"x": 1}}
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import sys
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Protocol
+
+import attr
+
+# Items kept from each end of a summarized buffer. 0 disables the preview.
+PREVIEW_SIZE = 3
+
+Summary = Dict[str, Any]
+
+
+class Blobs(Protocol):
+    """Where raw bytes go, keyed by digest (see BlobStore)."""
+
+    # Whether summarized buffers keep their raw bytes too, not only bytes-like values.
+    buffers: bool
+
+    def put(self, digest: str, buffer: Any):
+        ...
+
+
+@attr.frozen
+class Summarizer:
+    """Summarizer records a (potentially huge) buffer-like value as a small summary instead of element by element.
+
+    * `match(typ)` tells whether the summarizer handles values of type `typ`
+    * `summarize(obj, preview)` returns the summary: type, shape, dtype, ... and head/tail of `preview` items
+    * `buffer(obj)` returns the value's raw bytes as a C-contiguous buffer (or None), to be hashed and
+      optionally stored
+    """
+
+    match: Callable[[type], bool]
+    summarize: Callable[[Any, int], Summary]
+    buffer: Callable[[Any], Any] = lambda obj: None
+
+
+SUMMARIZERS: List[Summarizer] = []
+# type -> its Summarizer (or None), matches are only looked up once per type.
+TYPES: Dict[type, Optional[Summarizer]] = {}
+
+
+def register_summarizer(summarizer: Summarizer, first: bool = False):
+    """Register `summarizer`, after the existing ones unless `first`."""
+    if first:
+        SUMMARIZERS.insert(0, summarizer)
+    else:
+        SUMMARIZERS.append(summarizer)
+    TYPES.clear()
+
+
+def summarizer_for(typ: type) -> Optional[Summarizer]:
+    try:
+        return TYPES[typ]
+    except KeyError:
+        pass
+    summarizer = next((s for s in SUMMARIZERS if s.match(typ)), None)
+    TYPES[typ] = summarizer
+    return summarizer
+
+
+def digest(buffer: Any) -> str:
+    return hashlib.blake2b(buffer, digest_size=16).hexdigest()
+
+
+def summarize(
+    obj: Any, summarizer: Summarizer, blobs: Optional[Blobs] = None
+) -> Summary:
+    try:
+        summary = summarizer.summarize(obj, PREVIEW_SIZE)
+        buffer = summarizer.buffer(obj)
+    except Exception as e:
+        # e.g. a released memoryview.
+        return {"type": type(obj).__name__, "error": f"{type(e).__name__}: {e}"}
+    if buffer is not None:
+        summary["hash"] = digest(buffer)
+        if blobs is not None and blobs.buffers:
+            blobs.put(summary["hash"], buffer)
+    return summary
+
+
+def store_blob(obj: Any, blobs: Blobs) -> Summary:
+    """Put a bytes-like value in `blobs`, the returned summary stands in for it."""
+    summary = {"type": type(obj).__name__, "nbytes": len(obj), "hash": digest(obj)}
+    blobs.put(summary["hash"], obj)
+    return summary
+
+
+def head_tail(items: Any, size: int, preview: int) -> Summary:
+    """The first and last `preview` items of a sliceable sequence, converted with `.tolist()`."""
+    if not preview:
+        return {}
+    try:
+        items[:0].tolist()
+    except NotImplementedError:
+        # e.g. a memoryview with a format tolist() doesn't support.
+        return {}
+    if size <= 2 * preview:
+        return {"head": items[:].tolist(), "tail": []}
+    return {"head": items[:preview].tolist(), "tail": items[-preview:].tolist()}
+
+
+def is_type(module: str, name: str) -> Callable[[type], bool]:
+    """Match `module.name` (or subclasses) by name, so its library never has to be imported."""
+
+    def match(typ: type) -> bool:
+        return any(
+            getattr(cls, "__module__", "").split(".")[0] == module
+            and cls.__name__ == name
+            for cls in typ.__mro__
+        )
+
+    return match
+
+
+def summarize_memoryview(obj: memoryview, preview: int) -> Summary:
+    summary = {
+        "type": "memoryview",
+        "shape": list(obj.shape),
+        "dtype": obj.format,
+        "nbytes": obj.nbytes,
+    }
+    if obj.ndim == 1:
+        summary.update(head_tail(obj, len(obj), preview))
+    return summary
+
+
+def memoryview_buffer(obj: memoryview) -> Any:
+    return obj if obj.c_contiguous else obj.tobytes()
+
+
+def summarize_array(obj: array, preview: int) -> Summary:
+    return {
+        "type": "array.array",
+        "shape": [len(obj)],
+        "dtype": obj.typecode,
+        "nbytes": len(obj) * obj.itemsize,
+        **head_tail(obj, len(obj), preview),
+    }
+
+
+def summarize_ndarray(obj: Any, preview: int) -> Summary:
+    summary = {
+        "type": "numpy.ndarray",
+        "shape": list(obj.shape),
+        "dtype": str(obj.dtype),
+        "nbytes": int(obj.nbytes),
+        **head_tail(obj.flat, obj.size, preview),
+    }
+    if obj.dtype.kind not in "biufU":
+        # Items aren't JSON primitives (objects, complex, datetimes, bytes, ...), stringify them.
+        summary["head"] = [str(x) for x in summary.get("head", [])]
+        summary["tail"] = [str(x) for x in summary.get("tail", [])]
+    return summary
+
+
+def ndarray_buffer(obj: Any) -> Any:
+    if obj.dtype.hasobject:
+        # Object arrays hold pointers, their bytes mean nothing outside this process.
+        return None
+    if not obj.flags.c_contiguous:
+        obj = obj.copy(order="C")
+    # As flat bytes, some dtypes (e.g. datetime64) can't be exported through the buffer protocol.
+    return obj.reshape(-1).view("u1")
+
+
+def pandas_values(obj: Any) -> list:
+    return json.loads(obj.to_json(orient="values", default_handler=str))
+
+
+def summarize_pandas(obj: Any, preview: int) -> Summary:
+    pandas = sys.modules["pandas"]
+    is_frame = obj.ndim == 2
+    summary = {
+        "type": f"pandas.{type(obj).__name__}",
+        "shape": list(obj.shape),
+        "dtype": {str(k): str(v) for k, v in obj.dtypes.items()}
+        if is_frame
+        else str(obj.dtype),
+        "nbytes": int(obj.memory_usage(deep=False).sum() if is_frame else obj.nbytes),
+    }
+    try:
+        # Hashes values and index row by row (vectorized), object columns included.
+        hashes = pandas.util.hash_pandas_object(obj, index=True).to_numpy()
+        summary["hash"] = digest(hashes.tobytes())
+    except TypeError:
+        # Unhashable cells (e.g. lists).
+        pass
+    if preview:
+        rows = len(obj)
+        if rows <= 2 * preview:
+            summary.update(head=pandas_values(obj), tail=[])
+        else:
+            summary.update(
+                head=pandas_values(obj.head(preview)),
+                tail=pandas_values(obj.tail(preview)),
+            )
+    return summary
+
+
+register_summarizer(
+    Summarizer(
+        lambda typ: issubclass(typ, memoryview), summarize_memoryview, memoryview_buffer
+    )
+)
+register_summarizer(
+    Summarizer(lambda typ: issubclass(typ, array), summarize_array, lambda obj: obj)
+)
+register_summarizer(
+    Summarizer(is_type("numpy", "ndarray"), summarize_ndarray, ndarray_buffer)
+)
+register_summarizer(Summarizer(is_type("pandas", "DataFrame"), summarize_pandas))
+register_summarizer(Summarizer(is_type("pandas", "Series"), summarize_pandas))
@@ -0,0 +1,33 @@
+import sqlite3
+from typing import Any, Set
+
+
+class BlobStore:
+    """BlobStore keeps raw bytes once per digest: large bytes-like locals, and with `buffers=True` the contents of
+    summarized buffers too (see `Summarizer`).
+
+    Bytes are read straight from the buffer by sqlite3, without copying them into a bytes object first.
+    A value unchanged between lines is only hashed again, never rewritten.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, buffers: bool = False):
+        self.connection = connection
+        self.buffers = buffers
+        self.cursor = connection.cursor()
+        # Digests written by this store.
+        self.digests: Set[str] = set()
+
+    def put(self, digest: str, buffer: Any):
+        if digest in self.digests:
+            return
+        self.cursor.execute(
+            "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)",
+            (digest, memoryview(buffer).cast("B")),
+        )
+        self.digests.add(digest)
+
+    def get(self, digest: str) -> bytes:
+        (data,) = self.cursor.execute(
+            "SELECT data FROM blobs WHERE digest = ?", (digest,)
+        ).fetchone()
+        return data
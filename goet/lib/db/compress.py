@@ -0,0 +1,165 @@
+import sqlite3
+import struct
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# First byte of a compressed locals document. Dictionary codecs are followed by the dictionary id.
+ZLIB, ZLIB_DICT, ZSTD, ZSTD_DICT = b"z", b"Z", b"s", b"S"
+DICT_ID = struct.Struct("<I")
+# zlib only looks back 32 KiB, a longer dictionary would be wasted.
+ZLIB_DICT_SIZE = 32 * 1024
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+
+class Compressor:
+    """Compressor compresses the locals documents of a run (zlib, or zstd when `zstandard` is installed).
+
+    Documents repeat the same keys and class shapes from one line to the next, but each one is too small to
+    compress well on its own. So the first `train_after` documents are compressed as they are and kept as samples,
+    then a dictionary is built from them, stored in the dictionaries table, and used for the rest of the run.
+    `train_after=0` never uses a dictionary.
+
+    Compressed documents are bytes, see `Decompressor` to read them back.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        run_id: int,
+        codec: Optional[str] = None,
+        level: Optional[int] = None,
+        train_after: int = 256,
+        dict_size: int = 16 * 1024,
+    ):
+        codec = codec or default_codec()
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        if codec not in ("zlib", "zstd"):
+            raise ValueError(f"Unknown codec {codec!r}")
+        self.connection = connection
+        self.run_id = run_id
+        self.codec = codec
+        self.level = level
+        self.train_after = train_after
+        self.dict_size = dict_size
+        self.samples: List[bytes] = []
+        # (header, dictionary) once trained.
+        self.dictionary: Optional[Tuple[bytes, bytes]] = None
+        if codec == "zstd":
+            self.zstd = zstandard.ZstdCompressor(level=3 if level is None else level)
+
+    def compress(self, text: str) -> bytes:
+        data = text.encode()
+        if self.dictionary is None and len(self.samples) < self.train_after:
+            self.samples.append(data)
+            if len(self.samples) == self.train_after:
+                self.train()
+
+        if self.dictionary is not None:
+            header = self.dictionary[0]
+            if self.codec == "zstd":
+                return header + self.zstd.compress(data)
+            # Copying a primed compressor skips loading the dictionary again.
+            compressor = self.zlib.copy()
+            return header + compressor.compress(data) + compressor.flush()
+        elif self.codec == "zstd":
+            return ZSTD + self.zstd.compress(data)
+        return ZLIB + zlib.compress(data, self.zlib_level)
+
+    @property
+    def zlib_level(self) -> int:
+        return -1 if self.level is None else self.level
+
+    def train(self):
+        samples, self.samples = self.samples, []
+        if self.codec == "zstd":
+            try:
+                trained = zstandard.train_dictionary(self.dict_size, samples)
+            except zstandard.ZstdError:
+                # e.g. too few (or too small) samples, carry on without a dictionary.
+                self.train_after = 0
+                return
+            dictionary = trained.as_bytes()
+            self.zstd = zstandard.ZstdCompressor(
+                level=3 if self.level is None else self.level, dict_data=trained
+            )
+            header = ZSTD_DICT
+        else:
+            # zlib's "training": the most recent samples, most common strings end up closest to the data.
+            dictionary = b"".join(samples)[-ZLIB_DICT_SIZE:]
+            self.zlib = zlib.compressobj(self.zlib_level, zdict=dictionary)
+            header = ZLIB_DICT
+
+        cursor = self.connection.execute(
+            "INSERT INTO dictionaries (run_id, codec, data) VALUES (?, ?, ?)",
+            (self.run_id, self.codec, dictionary),
+        )
+        self.dictionary = (header + DICT_ID.pack(cursor.lastrowid), dictionary)
+
+
+class Decompressor:
+    """Decompressor reads locals documents back, whether they were compressed or not.
+
+    >>> decompressor = Decompressor(connection)
+    >>> json.loads(decompressor.decompress(f_locals))
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.dictionaries: Dict[int, bytes] = {}
+        # Decompressors primed with each dictionary, copied for every document.
+        self.zlib: Dict[int, "zlib._Decompress"] = {}
+        self.zstd: Dict[int, "zstandard.ZstdDecompressor"] = {}
+
+    def dictionary(self, dict_id: int) -> bytes:
+        dictionary = self.dictionaries.get(dict_id)
+        if dictionary is None:
+            (dictionary,) = self.connection.execute(
+                "SELECT data FROM dictionaries WHERE id = ?", (dict_id,)
+            ).fetchone()
+            self.dictionaries[dict_id] = dictionary
+        return dictionary
+
+    def zstd_for(self, dict_id: int) -> "zstandard.ZstdDecompressor":
+        decompressor = self.zstd.get(dict_id)
+        if decompressor is None:
+            if zstandard is None:
+                raise ValueError("Reading zstd compressed locals needs the zstandard package")
+            dict_data = (
+                zstandard.ZstdCompressionDict(self.dictionary(dict_id)) if dict_id else None
+            )
+            decompressor = self.zstd[dict_id] = zstandard.ZstdDecompressor(
+                dict_data=dict_data
+            )
+        return decompressor
+
+    def decompress(self, value: Union[str, bytes]) -> str:
+        if isinstance(value, str):
+            return value
+
+        header, data = value[:1], memoryview(value)[1:]
+        if header == ZLIB:
+            return zlib.decompress(data).decode()
+        elif header == ZSTD:
+            return self.zstd_for(0).decompress(data).decode()
+
+        (dict_id,) = DICT_ID.unpack_from(data)
+        data = data[DICT_ID.size :]
+        if header == ZLIB_DICT:
+            primed = self.zlib.get(dict_id)
+            if primed is None:
+                primed = zlib.decompressobj(zdict=self.dictionary(dict_id))
+                self.zlib[dict_id] = primed
+            decompressor = primed.copy()
+            return (decompressor.decompress(data) + decompressor.flush()).decode()
+        elif header == ZSTD_DICT:
+            return self.zstd_for(dict_id).decompress(data).decode()
+        raise ValueError(f"Unknown compression {header!r}")
@@ -0,0 +1,76 @@
+"""Compare storing locals as plain JSON vs compressed, with and without a trained dictionary.
+
+    python -m goet.lib.db.compress_bench
+
+Reports the compression ratio and the write (compress) / read (decompress) throughput over the locals of a traced
+run. zstd rows are skipped when zstandard isn't installed.
+"""
+import sqlite3
+import time
+from typing import List
+
+from goet.lib.db import compress
+from goet.lib.db.compress import Compressor, Decompressor
+from goet.lib.db.schema import SCHEMA
+from goet.sink.memory import MemorySink
+from goet.tracer.fanout import FanoutTracer
+
+
+class Order:
+    def __init__(self, order_id):
+        self.order_id = order_id
+        self.customer = f"customer-{order_id % 17}"
+        self.items = [{"sku": f"sku-{i}", "qty": i % 3 + 1} for i in range(order_id % 5)]
+        self.total = 12.5 * order_id
+
+
+def workload():
+    orders = []
+    totals = {}
+    for order_id in range(400):
+        order = Order(order_id)
+        totals[order.customer] = totals.get(order.customer, 0) + order.total
+        if len(orders) < 20:
+            orders.append(order)
+    return totals
+
+
+def trace_documents() -> List[str]:
+    """The locals documents of every line of `workload`."""
+    sink = MemorySink()
+    with FanoutTracer([sink]) as t:
+        workload()
+    return [values[-1] for kind, values in sink.events if kind == "frames"]
+
+
+def main():
+    documents = trace_documents()
+    raw = sum(len(document.encode()) for document in documents)
+    print(f"{len(documents)} documents, {raw / 1e6:.2f} MB of JSON")
+
+    connection = sqlite3.connect(":memory:")
+    connection.executescript(SCHEMA)
+    codecs = ["zlib"] + (["zstd"] if compress.zstandard is not None else [])
+    for codec in codecs:
+        for train_after in (0, 256):
+            compressor = Compressor(connection, 1, codec, train_after=train_after)
+            start = time.perf_counter()
+            compressed = [compressor.compress(document) for document in documents]
+            write = time.perf_counter() - start
+
+            decompressor = Decompressor(connection)
+            start = time.perf_counter()
+            for value in compressed:
+                decompressor.decompress(value)
+            read = time.perf_counter() - start
+
+            size = sum(len(value) for value in compressed)
+            name = f"{codec}{' + dictionary' if train_after else ''}"
+            print(
+                f"{name:<18} ratio {raw / size:5.1f}x   "
+                f"write {raw / write / 1e6:7.1f} MB/s   read {raw / read / 1e6:7.1f} MB/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
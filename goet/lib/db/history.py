@@ -0,0 +1,261 @@
+import hashlib
+import json
+import sqlite3
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from goet.lib.converter.converter import ESCAPED
+from goet.lib.db.compress import Decompressor
+
+if TYPE_CHECKING:
+    from goet.lib.db.search import SearchIndex
+
+# (f_id, value_id) of a change point. value_id is None when the variable was deleted.
+Change = Tuple[int, Optional[int]]
+
+
+def value_id(dumped: str) -> int:
+    """64-bit id of a recorded value (signed, as SQLite stores integers). Equal values have equal ids."""
+    return int.from_bytes(
+        hashlib.blake2b(dumped.encode(), digest_size=8).digest(), "little", signed=True
+    )
+
+
+def dumps_each(document: Mapping[str, Any]) -> Tuple[str, Dict[str, str]]:
+    """A locals document as json.dumps would write it, and each value's JSON on the way (see `resolve_each`)."""
+    values = {name: json.dumps(value) for name, value in document.items()}
+    text = "{" + ", ".join(f"{json.dumps(name)}: {dumped}" for name, dumped in values.items()) + "}"
+    if '"$ref"' in text:
+        return text, resolve_each(document)
+    return text, values
+
+
+def resolve_each(document: Mapping[str, Any]) -> Dict[str, str]:
+    """Each value's JSON, with {"$ref": n} written {"$ref": digest of the n-th container's JSON}.
+
+    So the JSON of a value aliasing another local's (`a = b = [1]`) changes when that value does. Containers are
+    numbered as in `resolve_refs`. A reference to a container that's still being written (a cycle) is kept.
+    """
+    digests: List[str] = []
+
+    def dumps(value: Any) -> str:
+        if isinstance(value, dict):
+            keys = value.keys()
+            if keys == {"$ref"}:
+                digest = digests[value["$ref"]]
+                return json.dumps({"$ref": digest} if digest else value)
+            if keys == {"$blob"} or keys == {"$pickle"}:
+                return json.dumps(value)
+            index = len(digests)
+            digests.append("")
+            if keys == {"$buffer"}:
+                # Emitted as a whole, nothing inside a summary is numbered.
+                text = json.dumps(value)
+            elif keys == {ESCAPED}:
+                text = f"{{{json.dumps(ESCAPED)}: {dumps_object(value[ESCAPED])}}}"
+            else:
+                text = dumps_object(value)
+        elif isinstance(value, list):
+            index = len(digests)
+            digests.append("")
+            text = "[" + ", ".join([dumps(item) for item in value]) + "]"
+        else:
+            return json.dumps(value)
+        digests[index] = hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+        return text
+
+    def dumps_object(value: Mapping[str, Any]) -> str:
+        return "{" + ", ".join([f"{json.dumps(k)}: {dumps(v)}" for k, v in value.items()]) + "}"
+
+    return {name: dumps(value) for name, value in document.items()}
+
+
+class History:
+    """History indexes when each variable changed: (code, variable name) -> the steps its value changed at.
+
+    Rows are fed in step order (see `record`). A change point is the first step of a frame that shows a new value
+    for a variable: bound for the first time, changed (same value_id means same recorded value), or deleted (missing
+    from the step, so steps must hold every local: SqlTracer rejects `history` with other `capture_locals`).
+    Shared objects are written as {"$ref": n} in a locals document, and hashed with what they stand for (see
+    `resolve_each`): a value that only moved in the document can show up as a change, a changed alias can't be
+    missed.
+
+    The changes table then answers "every value `total` took in `checkout`", or "the last write to `total`
+    before this step", with a range scan of its index instead of decoding every step's locals.
+    See `history` and `last_change`, or Navigator.history.
+
+    With `changes=False` the changes table isn't written, e.g. to only feed the new values to a `search` index.
+    """
+
+    INSERT = "INSERT INTO changes (run_id, code_id, name, f_id, value_id) VALUES (?, ?, ?, ?, ?)"
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        run_id: int,
+        changes: bool = True,
+        search: Optional["SearchIndex"] = None,
+    ):
+        self.run_id = run_id
+        self.changes = changes
+        self.search = search
+        # Change points found so far.
+        self.count = 0
+        # Frames on the stack, outermost first: (f_call_id, code_id, value ids of the last step by name).
+        self.stack: List[Tuple[int, int, Dict[str, int]]] = []
+        self.use(connection)
+
+    def use(self, connection: sqlite3.Connection):
+        """Write to `connection` from now on, e.g. a partitioned run's next segment."""
+        self.connection = connection
+        self.codes: Dict[Tuple[str, str], int] = {}
+        if self.search is not None:
+            self.search.use(connection)
+
+    def code_id(self, filename: str, funcname: str) -> int:
+        key = (filename, funcname)
+        code_id = self.codes.get(key)
+        if code_id is None:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO codes (f_filename, f_funcname) VALUES (?, ?)", key
+            )
+            (code_id,) = self.connection.execute(
+                "SELECT id FROM codes WHERE f_filename = ? AND f_funcname = ?", key
+            ).fetchone()
+            self.codes[key] = code_id
+        return code_id
+
+    def record(
+        self,
+        f_id: int,
+        f_call_id: Optional[int],
+        filename: str,
+        funcname: str,
+        values: Mapping[str, str],
+    ):
+        """Index step `f_id`, `values` maps each local to its recorded JSON."""
+        code_id = self.code_id(filename, funcname)
+        call = -1 if f_call_id is None else f_call_id
+        stack = self.stack
+        # Frames called after this one have returned: this frame is running again.
+        while stack and stack[-1][0] > call:
+            stack.pop()
+        if stack and stack[-1][0] == call and stack[-1][1] == code_id:
+            last = stack[-1][2]
+        else:
+            last = {}
+            stack.append((call, code_id, last))
+
+        rows = []
+        new_values = []
+        for name, dumped in values.items():
+            new = value_id(dumped)
+            if last.get(name) != new:
+                last[name] = new
+                rows.append((self.run_id, code_id, name, f_id, new))
+                new_values.append((name, dumped))
+        for name in [name for name in last if name not in values]:
+            del last[name]
+            rows.append((self.run_id, code_id, name, f_id, None))
+        self.count += len(rows)
+        if rows and self.changes:
+            self.connection.executemany(self.INSERT, rows)
+        if new_values and self.search is not None:
+            self.search.add(f_id, new_values)
+
+    def record_document(self, row: Tuple[Any, ...]):
+        """Index a frames row: its columns in order, with f_locals as JSON text."""
+        _, f_id, _, f_call_id, filename, funcname, _, f_locals = row
+        self.record(f_id, f_call_id, filename, funcname, dumps_each(json.loads(f_locals))[1])
+
+
+def build_history(
+    connection: sqlite3.Connection, run_id: int, changes: bool = True, search: bool = False
+) -> int:
+    """Index a run that was recorded without `history=True`, returns how many change points it has.
+
+    With `search`, the run's search index is built too (or with `changes=False`, only it, see SearchIndex).
+    Decodes every step of the run once. A partitioned run's changes are written to each of its segments.
+    """
+    # Imported here, goet.lib.db.search imports the navigator which imports this module.
+    from goet.lib.db.search import SearchIndex
+
+    paths = connection.execute(
+        "SELECT db_path FROM segments WHERE run_id = ? ORDER BY idx", (run_id,)
+    ).fetchall()
+    parts = [connection] if not paths else [sqlite3.connect(path) for (path,) in paths]
+    history = None
+    for part in parts:
+        if history is None:
+            index = SearchIndex(part, run_id) if search else None
+            history = History(part, run_id, changes, index)
+        else:
+            history.use(part)
+        if changes:
+            part.execute("DELETE FROM changes WHERE run_id = ?", (run_id,))
+        if search:
+            part.execute("DELETE FROM search WHERE run_id = ?", (run_id,))
+        decompressor = Decompressor(part)
+        for row in part.execute(
+            """
+            SELECT run_id, f_id, f_back_id, f_call_id, f_filename, f_funcname, f_lineno, f_locals
+            FROM frames WHERE run_id = ? ORDER BY f_id
+            """,
+            (run_id,),
+        ).fetchall():
+            history.record_document(row[:-1] + (decompressor.decompress(row[-1]),))
+        part.commit()
+    return 0 if history is None else history.count
+
+
+def code_ids(connection: sqlite3.Connection, filename: Optional[str], funcname: str) -> List[int]:
+    """Ids of `funcname` (in `filename`, or in any file)."""
+    if filename is None:
+        query, params = "SELECT id FROM codes WHERE f_funcname = ?", (funcname,)
+    else:
+        query = "SELECT id FROM codes WHERE f_filename = ? AND f_funcname = ?"
+        params = (filename, funcname)
+    return [code_id for (code_id,) in connection.execute(query, params)]
+
+
+def history(
+    connection: sqlite3.Connection,
+    run_id: int,
+    funcname: str,
+    name: str,
+    filename: Optional[str] = None,
+) -> List[Change]:
+    """Every change point of variable `name` in `funcname`, in step order."""
+    changes: List[Change] = []
+    for code_id in code_ids(connection, filename, funcname):
+        changes.extend(
+            connection.execute(
+                """
+                SELECT f_id, value_id FROM changes
+                WHERE run_id = ? AND code_id = ? AND name = ? ORDER BY f_id
+                """,
+                (run_id, code_id, name),
+            )
+        )
+    return sorted(changes)
+
+
+def last_change(
+    connection: sqlite3.Connection,
+    run_id: int,
+    funcname: str,
+    name: str,
+    f_id: int,
+    filename: Optional[str] = None,
+) -> Optional[Change]:
+    """The last change point of variable `name` in `funcname`, at or before step `f_id`."""
+    found: Iterable[Change] = (
+        connection.execute(
+            """
+            SELECT f_id, value_id FROM changes
+            WHERE run_id = ? AND code_id = ? AND name = ? AND f_id <= ? ORDER BY f_id DESC LIMIT 1
+            """,
+            (run_id, code_id, name, f_id),
+        ).fetchone()
+        for code_id in code_ids(connection, filename, funcname)
+    )
+    return max((change for change in found if change is not None), default=None)
@@ -0,0 +1,77 @@
+"""Compare finding a variable's history through the history index vs decoding every step.
+
+    python -m goet.lib.db.history_bench
+
+Records the same workload with and without history=True, and reports the recording overhead, then the time to
+list every value `total` took in `checkout`: by decoding every step, with Navigator.history, and the index
+lookup alone.
+"""
+import json
+import os
+import tempfile
+import time
+
+from goet.lib.db.history import history
+from goet.lib.db.navigator import Navigator
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+def checkout(prices):
+    # `total` only changes for the few discounted prices, most steps leave it as it was.
+    total = 0
+    seen = 0
+    for price in prices:
+        seen += 1
+        if price % 50 == 0:
+            total += price
+    return total
+
+
+def workload():
+    for order in range(20):
+        checkout(list(range(order, order + 400)))
+
+
+def record(path: str, history: bool) -> "tuple[int, float]":
+    tracer = SqlTracer(path, history=history)
+    start = time.perf_counter()
+    with tracer:
+        workload()
+    return tracer.run_id, time.perf_counter() - start
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "history_bench.sqlite3")
+    plain_id, plain = record(path, history=False)
+    indexed_id, indexed = record(path, history=True)
+    print(f"recording: {plain:.2f}s, with history=True {indexed:.2f}s (+{(indexed / plain - 1) * 100:.0f}%)")
+
+    connection = connect(path)
+    start = time.perf_counter()
+    totals = []
+    for f_locals, in connection.execute(
+        "SELECT f_locals FROM frames WHERE run_id = ? AND f_funcname = 'checkout' ORDER BY f_id",
+        (plain_id,),
+    ):
+        total = json.loads(f_locals).get("total")
+        if total is not None and (not totals or totals[-1] != total):
+            totals.append(total)
+    scan = time.perf_counter() - start
+
+    nav = Navigator(connection, indexed_id)
+    start = time.perf_counter()
+    indexed_totals = [value for _, value in nav.history("total", "checkout")]
+    lookup = time.perf_counter() - start
+    start = time.perf_counter()
+    changes = history(connection, indexed_id, "checkout", "total")
+    points = time.perf_counter() - start
+    assert indexed_totals == totals, (indexed_totals, totals)
+    print(
+        f"history of total ({len(totals)} values): decoding every step {scan * 1000:.1f}ms, "
+        f"Navigator.history {lookup * 1000:.1f}ms, change points only {points * 1000:.2f}ms ({len(changes)})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+
+from goet.lib.db.history import build_history, dumps_each, history
+from goet.lib.db.navigator import Navigator
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+def checkout(prices):
+    total = 0
+    for price in prices:
+        total += price
+        if total > 5:
+            discount = 1
+    del discount
+    return total
+
+
+def run():
+    checkout([1, 2, 3])
+    checkout([4, 4])
+    aliased()
+
+
+def aliased():
+    a = b = [1]
+    a = b = [2]
+    return a, b
+
+
+document = {"a": [1, {"b": "c"}], "é": None}
+assert dumps_each(document)[0] == json.dumps(document)
+
+path = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+indexed = SqlTracer(path, history=True)
+with indexed as t:
+    run()
+plain = SqlTracer(path, compress="zlib")
+with plain as t:
+    run()
+pickled = SqlTracer(path, pickle_values=True, history=True)
+with pickled as t:
+    run()
+connection = connect(path)
+
+nav = Navigator(connection, indexed.run_id)
+totals = [value for _, value in nav.history("total", "checkout")]
+print(totals)
+assert totals == [0, 1, 3, 6, 0, 4, 8]
+discounts = history(connection, indexed.run_id, "checkout", "discount", __file__)
+# Bound, then deleted, in each call.
+assert [value_id is None for _, value_id in discounts] == [False, True, False, True]
+assert nav.history("total", "checkout", "elsewhere.py") == []
+# b is written {"$ref": 0} at both steps, what it refers to changed.
+assert [value for _, value in nav.history("b", "aliased")] == [[1], [2]]
+
+# Indexed after the fact, the same change points.
+assert not history(connection, plain.run_id, "checkout", "total")
+assert build_history(connection, plain.run_id) > 0
+for name in ("total", "discount", "price"):
+    assert [
+        value_id for _, value_id in history(connection, plain.run_id, "checkout", name)
+    ] == [value_id for _, value_id in history(connection, indexed.run_id, "checkout", name)]
+assert [
+    value for _, value in Navigator(connection, plain.run_id).history("total", "checkout")
+] == totals
+
+# Pickled values are LazyValues.
+values = Navigator(connection, pickled.run_id).history("prices", "checkout")
+assert [lazy.value for _, lazy in values] == [[1, 2, 3], [4, 4]]
+
+# The last write before a step, in the current frame only.
+nav.continue_to(__file__, checkout.__code__.co_firstlineno + 6)
+nav.continue_to(__file__, checkout.__code__.co_firstlineno + 6)
+assert nav.locals()["total"] == 8
+changed = nav.last_change("total")
+assert changed.f_funcname == "checkout" and nav.locals(changed.f_id)["total"] == 8
+assert nav.locals(changed.f_id - 1)["total"] == 4
+assert nav.last_change("nope") is None
+
+# Steps holding only some locals would read as deletions.
+for capture_locals in ("changed", "args", ["total"]):
+    try:
+        SqlTracer(path, history=True, capture_locals=capture_locals)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError(capture_locals)
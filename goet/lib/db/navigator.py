@@ -0,0 +1,409 @@
+import json
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+import attr
+
+from goet.lib.db import history as history_index
+from goet.lib.db.pickles import PickleStore
+from goet.lib.db.runs import create_indexes, database_path
+from goet.lib.frame.frame import Loop
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Indexes the navigator needs on top of (run_id, f_id), see `index_run`. Partial, so only the run's own inserts
+# ever pay for maintaining them.
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS frames_run_{run_id}_f_call_id_idx ON frames (f_call_id, f_id) WHERE run_id = {run_id}",
+    "CREATE INDEX IF NOT EXISTS frames_run_{run_id}_location_idx ON frames (f_filename, f_lineno, f_id) "
+    "WHERE run_id = {run_id}",
+)
+
+# A page of the children of the value at a JSON path of a step's locals, from the stored document: name, path,
+# JSON type, value of scalars, and for containers their size and first PREVIEW_ITEMS children (as JSON).
+CHILDREN = """
+SELECT key, fullkey, type, atom,
+    CASE type
+        WHEN 'array' THEN json_array_length(value)
+        WHEN 'object' THEN (SELECT COUNT(*) FROM json_each(e.value))
+    END,
+    CASE WHEN type IN ('array', 'object') THEN (
+        SELECT CASE e.type WHEN 'array' THEN json_group_array(json(item)) ELSE json_group_object(name, json(item)) END
+        FROM (
+            SELECT key AS name,
+                CASE type WHEN 'text' THEN json_quote(value) WHEN 'true' THEN 'true' WHEN 'false' THEN 'false'
+                WHEN 'null' THEN 'null' ELSE value END AS item
+            FROM json_each(e.value) LIMIT ?
+        )
+    ) END
+FROM json_each(?, ?) AS e LIMIT ? OFFSET ?
+"""
+# Enough for reprlib's default previews (6 list items, 4 dict entries) to show there's more.
+PREVIEW_ITEMS = 7
+# Documents `children` doesn't read: references between objects need the whole document to resolve, pickles
+# need the store, escaped markers and NaN/Infinity (not JSON) would read back as something else.
+WHOLE_DOCUMENT_MARKERS = ('"$ref"', '"$pickle"', '"$dict"', "NaN", "Infinity")
+
+
+@attr.frozen
+class Child:
+    """A value inside a step's locals (see `Navigator.children`).
+
+    `value` is the value itself for scalars and {"$blob"}/{"$buffer"} summaries. For other containers it's a
+    preview: their first PREVIEW_ITEMS children, `size` is how many they have.
+    """
+
+    name: str
+    path: str
+    value: Any
+    size: Optional[int] = None
+
+    @property
+    def is_container(self) -> bool:
+        return self.size is not None
+
+
+class LRU(Generic[K, V]):
+    """A dict keeping only the `maxsize` most recently used keys."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.items: "OrderedDict[K, V]" = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+@attr.frozen
+class Step:
+    """One recorded line. `f_back_id` is the caller's step (None in the outermost traced frame), `f_call_id` is
+    shared by the steps of its frame only."""
+
+    f_id: int
+    f_back_id: Optional[int]
+    f_call_id: Optional[int]
+    f_filename: str
+    f_funcname: str
+    f_lineno: int
+
+
+class Navigator:
+    """Navigator steps through a recorded run, backwards as well as forwards.
+
+    >>> nav = Navigator(connection, tracer.run_id)
+    >>> nav.step_over(), nav.step_back(), nav.step_out()
+    >>> nav.reverse_continue_to("app.py", 42)
+    >>> nav.stack_at(nav.current.f_id), nav.locals()
+
+    `current` is the step the navigator is at, it starts at the first recorded one. Moves return the new current
+    step, or None when there's nowhere to go (and `current` stays put).
+
+    Steps of the same frame share their f_call_id, and link to their caller's step with f_back_id. So every move
+    is a handful of lookups in the run's indexes on (f_call_id, f_id) and (f_filename, f_lineno, f_id), whatever
+    the size of the run or of the calls stepped over.
+    Steps and their decoded locals are kept in LRUs of `cache_size` entries.
+
+    Those indexes are created first with `index_run` (unless `index=False`), which gives up rather than wait for a
+    run being recorded to the same database: navigating still works then, only slower.
+
+    Partitioned runs are read from their segment files, steps of dropped segments are skipped.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        run_id: int,
+        cache_size: int = 1024,
+        index: bool = True,
+    ):
+        self.run_id = int(run_id)
+        if index:
+            index_run(connection, self.run_id)
+        self.parts = self.open_parts(connection, run_id)
+        self.steps: LRU[int, Step] = LRU(cache_size)
+        self.states: LRU[int, Dict[str, Any]] = LRU(cache_size)
+        first = self.find("f_id > ?", (0,))
+        if first is None:
+            raise ValueError(f"Run {run_id} has no recorded steps")
+        self.current: Step = self.step(first)
+
+    @staticmethod
+    def open_parts(
+        connection: sqlite3.Connection, run_id: int
+    ) -> List[Tuple[int, sqlite3.Connection, PickleStore]]:
+        """(first f_id, connection, store to decode locals with) of each database holding the run's frames."""
+        paths = connection.execute(
+            "SELECT first_f_id, db_path FROM segments WHERE run_id = ? ORDER BY idx",
+            (run_id,),
+        ).fetchall()
+        connections = [(0, connection)] if not paths else [
+            (first_f_id, sqlite3.connect(path)) for first_f_id, path in paths
+        ]
+        return [(first_f_id, part, PickleStore(part)) for first_f_id, part in connections]
+
+    def part_for(self, f_id: int) -> int:
+        """Index in `parts` of the database holding step `f_id`."""
+        index = 0
+        for i, (first_f_id, _, _) in enumerate(self.parts):
+            if first_f_id <= f_id:
+                index = i
+        return index
+
+    def find(
+        self, where: str, params: Iterable[Any], after: int = 0, reverse: bool = False
+    ) -> Optional[int]:
+        """The first (or with `reverse`, last) f_id of the run's frames matching `where`, starting from the part
+        holding step `after`."""
+        order = "DESC" if reverse else "ASC"
+        # run_id is a literal, for the partial INDEXES to match.
+        query = f"SELECT f_id FROM frames WHERE run_id = {self.run_id} AND {where} ORDER BY f_id {order} LIMIT 1"
+        start = self.part_for(after)
+        parts = self.parts[start::-1] if reverse else self.parts[start:]
+        for _, connection, _ in parts:
+            row = connection.execute(query, tuple(params)).fetchone()
+            if row is not None:
+                return row[0]
+        return None
+
+    def filenames(self) -> Set[str]:
+        """The f_filename of every recorded step: each co_filename as the traced process saw it, maybe relative."""
+        return {
+            filename
+            for _, connection, _ in self.parts
+            for (filename,) in connection.execute(
+                f"SELECT DISTINCT f_filename FROM frames WHERE run_id = {self.run_id}"
+            )
+        }
+
+    def step(self, f_id: int) -> Optional[Step]:
+        """Step `f_id`, None when it wasn't recorded (or was dropped)."""
+        step = self.steps.get(f_id)
+        if step is not None:
+            return step
+        _, connection, _ = self.parts[self.part_for(f_id)]
+        row = connection.execute(
+            "SELECT f_id, f_back_id, f_call_id, f_filename, f_funcname, f_lineno FROM frames "
+            "WHERE run_id = ? AND f_id = ?",
+            (self.run_id, f_id),
+        ).fetchone()
+        if row is None:
+            return None
+        step = Step(*row)
+        self.steps.put(f_id, step)
+        return step
+
+    def locals(self, f_id: Optional[int] = None) -> Dict[str, Any]:
+        """The locals recorded at step `f_id` (by default the current one). Pickled values are LazyValues."""
+        f_id = self.current.f_id if f_id is None else f_id
+        state = self.states.get(f_id)
+        if state is not None:
+            return state
+        _, connection, pickles = self.parts[self.part_for(f_id)]
+        (f_locals,) = connection.execute(
+            "SELECT f_locals FROM frames WHERE run_id = ? AND f_id = ?",
+            (self.run_id, f_id),
+        ).fetchone()
+        state = pickles.decode(f_locals)
+        self.states.put(f_id, state)
+        return state
+
+    def children(self, f_id: int, path: str = "$", start: int = 0, count: int = 0) -> Optional[List[Child]]:
+        """A page of the children of the value at JSON `path` in the locals of step `f_id` (by default the locals
+        themselves), `count` of them (0 for all) from the `start`-th.
+
+        Read from the stored document with SQLite's JSON functions: nothing else in it is decoded. None for
+        documents that must be decoded whole (see `locals`): compressed, pickled, or with objects they share.
+        """
+        _, connection, _ = self.parts[self.part_for(f_id)]
+        markers = " OR ".join("instr(f_locals, ?)" for _ in WHOLE_DOCUMENT_MARKERS)
+        row = connection.execute(
+            f"SELECT f_locals FROM frames WHERE run_id = ? AND f_id = ? AND typeof(f_locals) = 'text' "
+            f"AND NOT ({markers})",
+            (self.run_id, f_id, *WHOLE_DOCUMENT_MARKERS),
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            rows = connection.execute(
+                CHILDREN, (PREVIEW_ITEMS, row[0], path, count or -1, start)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # e.g. JSON this SQLite can't read.
+            return None
+        children = []
+        for name, child_path, json_type, atom, size, preview in rows:
+            if json_type in ("true", "false"):
+                value = json_type == "true"
+            elif preview is None:
+                value = atom
+            else:
+                value = json.loads(preview)
+                if json_type == "object" and (value.keys() == {"$blob"} or value.keys() == {"$buffer"}):
+                    # A summary, read whole.
+                    size = None
+            children.append(Child(str(name), child_path, value, size))
+        return children
+
+    def elided(self, start: int, end: int) -> List[Loop]:
+        """Loops whose unrecorded iterations ran between steps `start` and `end`, e.g. after a move skipped them:
+        "loop ran {loop.elided} more times". Outermost first when they're nested."""
+        start, end = min(start, end), max(start, end)
+        loops = [
+            Loop(*row)
+            for _, connection, _ in self.parts
+            for row in connection.execute(
+                """
+                SELECT f_call_id, f_filename, f_funcname, f_lineno, first_f_id, last_f_id, iterations, elided
+                FROM loops WHERE run_id = ? AND first_f_id > ? AND first_f_id < ? AND last_f_id < ?
+                """,
+                (self.run_id, start, end, end),
+            )
+        ]
+        return sorted(loops, key=lambda loop: (loop.first_f_id, -loop.last_f_id))
+
+    def stack_at(self, f_id: int) -> List[Step]:
+        """The frames at step `f_id`, innermost first: the step, its caller's step, and so on.
+
+        Stops at the outermost traced frame, or at the first caller step that wasn't recorded.
+        """
+        stack = []
+        step = self.step(f_id)
+        while step is not None:
+            stack.append(step)
+            step = None if step.f_back_id is None else self.step(step.f_back_id)
+        return stack
+
+    def move(self, f_id: Optional[int]) -> Optional[Step]:
+        if f_id is None:
+            return None
+        self.current = self.step(f_id)
+        return self.current
+
+    def goto(self, f_id: int) -> Optional[Step]:
+        return self.move(f_id if self.step(f_id) is not None else None)
+
+    def step_forward(self) -> Optional[Step]:
+        """The next step, in whichever frame (step into)."""
+        f_id = self.current.f_id
+        return self.move(self.find("f_id > ?", (f_id,), after=f_id))
+
+    def step_back(self) -> Optional[Step]:
+        """The previous step, in whichever frame."""
+        f_id = self.current.f_id
+        return self.move(self.find("f_id < ?", (f_id,), after=f_id, reverse=True))
+
+    def next_in_frames(self, frames: List[Step]) -> Optional[int]:
+        """The first step after the current one in any of `frames` (steps of a frame share their f_call_id)."""
+        f_id = self.current.f_id
+        found = [
+            self.find("f_call_id IS ? AND f_id > ?", (frame.f_call_id, f_id), after=f_id)
+            for frame in frames
+        ]
+        return min((f for f in found if f is not None), default=None)
+
+    def step_over(self) -> Optional[Step]:
+        """The next step in this frame, or once it returned, in a caller."""
+        return self.move(self.next_in_frames(self.stack_at(self.current.f_id)))
+
+    def step_out(self) -> Optional[Step]:
+        """The next step in a caller, once this frame returned."""
+        return self.move(self.next_in_frames(self.stack_at(self.current.f_id)[1:]))
+
+    def continue_to(self, filename: str, lineno: int) -> Optional[Step]:
+        """The next time line `lineno` of `filename` runs."""
+        f_id = self.current.f_id
+        return self.move(
+            self.find(
+                "f_filename = ? AND f_lineno = ? AND f_id > ?",
+                (filename, lineno, f_id),
+                after=f_id,
+            )
+        )
+
+    def reverse_continue_to(self, filename: str, lineno: int) -> Optional[Step]:
+        """The last time line `lineno` of `filename` ran, before the current step."""
+        f_id = self.current.f_id
+        return self.move(
+            self.find(
+                "f_filename = ? AND f_lineno = ? AND f_id < ?",
+                (filename, lineno, f_id),
+                after=f_id,
+                reverse=True,
+            )
+        )
+
+    def history(
+        self, name: str, funcname: str, filename: Optional[str] = None
+    ) -> List[Tuple[Step, Any]]:
+        """Every value variable `name` of `funcname` took, with the step it was first seen at.
+
+        Needs the run's history index (recorded with history=True, or see `build_history`). Only the locals of
+        those steps are decoded. Deletions are left out.
+        """
+        changes = [
+            change
+            for _, connection, _ in self.parts
+            for change in history_index.history(
+                connection, self.run_id, funcname, name, filename
+            )
+        ]
+        return [
+            (self.step(f_id), self.locals(f_id)[name])
+            for f_id, value_id in sorted(changes)
+            if value_id is not None
+        ]
+
+    def last_change(self, name: str) -> Optional[Step]:
+        """The step at which variable `name` of the current frame got its current value (see `history`)."""
+        current = self.current
+        # The frame's first step.
+        start = self.find(
+            "f_call_id IS ? AND f_id > ?",
+            (current.f_call_id, current.f_call_id or 0),
+            after=current.f_call_id or 0,
+        )
+        found = [
+            history_index.last_change(
+                connection,
+                self.run_id,
+                current.f_funcname,
+                name,
+                current.f_id,
+                current.f_filename,
+            )
+            for _, connection, _ in self.parts[: self.part_for(current.f_id) + 1]
+        ]
+        change = max((change for change in found if change is not None), default=None)
+        if change is None or change[1] is None or change[0] < start:
+            return None
+        return self.step(change[0])
+
+
+def index_run(connection: sqlite3.Connection, run_id: int) -> bool:
+    """Create the indexes a Navigator moves through run `run_id` with, in each database holding its frames.
+
+    Each database is indexed on a connection of its own, `connection` is only read from. Returns False when some
+    couldn't be, e.g. while another connection is writing to it: see `create_indexes`.
+    """
+    paths = [
+        path
+        for (path,) in connection.execute(
+            "SELECT db_path FROM segments WHERE run_id = ? ORDER BY idx", (run_id,)
+        ).fetchall()
+    ] or [database_path(connection)]
+    statements = [index.format(run_id=int(run_id)) for index in INDEXES]
+    return all([create_indexes(path, statements) for path in paths])
@@ -0,0 +1,107 @@
+"""Measure how long each Navigator move takes on a large run.
+
+    python -m goet.lib.db.navigator_bench [steps]
+
+Builds a synthetic run of `steps` frames (1M by default): a main loop whose lines call a small function, and every
+so often a call of 10K steps. Then times each move from random steps, with cold caches, and reports milliseconds
+per move.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Iterator, Optional, Tuple
+
+from goet.lib.db.navigator import Navigator, index_run
+from goet.lib.db.runs import start_run
+from goet.lib.db.sqlite import connect
+
+MOVES = 2000
+FILENAME = "app.py"
+
+
+def frames(steps: int) -> Iterator[Tuple[int, Optional[int], str, int]]:
+    """(f_id, f_back_id, f_funcname, f_lineno) of a run with `steps` frames."""
+    f_id = 0
+
+    def line(f_back_id, funcname, lineno):
+        nonlocal f_id
+        f_id += 1
+        return (f_id, f_back_id, funcname, lineno)
+
+    while True:
+        row = line(None, "main", 1)
+        caller = row[0]
+        yield row
+        # Calls `work`, of 5 lines each calling `leaf` (2 lines), or every 100th line a loop of 10K steps.
+        if caller % 100:
+            for lineno in range(10, 15):
+                row = line(caller, "work", lineno)
+                yield row
+                yield line(row[0], "leaf", 20)
+                yield line(row[0], "leaf", 21)
+        else:
+            for _ in range(5000):
+                yield line(caller, "big", 30)
+                yield line(caller, "big", 31)
+        if f_id >= steps:
+            return
+
+
+def build(connection: sqlite3.Connection, steps: int) -> int:
+    run_id = start_run(connection)
+    connection.executemany(
+        """
+        INSERT INTO frames (run_id, f_id, f_back_id, f_call_id, f_filename, f_funcname, f_lineno, f_locals)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            # Each frame is called right after its caller's step: that's also its f_call_id.
+            (run_id, f_id, f_back_id, f_back_id, FILENAME, funcname, lineno, f'{{"i": {f_id}}}')
+            for f_id, f_back_id, funcname, lineno in frames(steps)
+        ),
+    )
+    connection.commit()
+    return run_id
+
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), "navigator_bench.sqlite3")
+    connection = connect(path)
+    start = time.perf_counter()
+    run_id = build(connection, steps)
+    print(f"{steps} steps written in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    assert index_run(connection, run_id)
+    print(f"Run indexed in {time.perf_counter() - start:.1f}s")
+    nav = Navigator(connection, run_id, index=False)
+
+    random.seed(0)
+    starts = [random.randrange(1, steps) for _ in range(MOVES)]
+    moves = {
+        "step_forward": lambda: nav.step_forward(),
+        "step_back": lambda: nav.step_back(),
+        "step_over": lambda: nav.step_over(),
+        "step_out": lambda: nav.step_out(),
+        "continue_to": lambda: nav.continue_to(FILENAME, 1),
+        "reverse_continue_to": lambda: nav.reverse_continue_to(FILENAME, 1),
+        "stack_at": lambda: nav.stack_at(nav.current.f_id),
+        "locals": lambda: nav.locals(),
+    }
+    for name, move in moves.items():
+        elapsed = 0.0
+        for f_id in starts:
+            nav = Navigator(connection, run_id, index=False)
+            nav.goto(f_id)
+            start = time.perf_counter()
+            move()
+            elapsed += time.perf_counter() - start
+        print(f"{name:>20}: {elapsed / MOVES * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
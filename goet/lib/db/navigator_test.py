@@ -0,0 +1,204 @@
+import os
+import tempfile
+import time
+
+from goet.lib.db.navigator import Navigator, index_run
+from goet.lib.db.runs import delete_run, run_index_prefix
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+def leaf(x):
+    y = x * 2
+    return y
+
+
+def middle(n):
+    total = 0
+    for i in range(n):
+        total += leaf(i)
+    return total
+
+
+def main():
+    a = middle(2)
+    b = a + 1
+    return b
+
+
+def at(step):
+    """Where `step` is: function name, and line relative to the function's def."""
+    fn = globals().get(step.f_funcname)
+    return step.f_funcname, step.f_lineno - fn.__code__.co_firstlineno if fn else None
+
+
+path = os.path.join(tempfile.mkdtemp(), "navigator.sqlite3")
+tracer = SqlTracer(path)
+with tracer as t:
+    main()
+
+# Opening a run doesn't wait for (nor commit on) a connection writing to the database, it's just not indexed yet.
+writer = connect(path)
+writer.execute("BEGIN IMMEDIATE")
+connection = connect(path)
+start = time.monotonic()
+nav = Navigator(connection, tracer.run_id)
+assert time.monotonic() - start < 5 and not connection.in_transaction
+assert not index_run(connection, tracer.run_id)
+writer.rollback()
+assert index_run(connection, tracer.run_id)
+indexes = "SELECT name FROM sqlite_master WHERE type = 'index' AND name GLOB ?"
+assert len(connection.execute(indexes, (run_index_prefix(tracer.run_id) + "*",)).fetchall()) == 2
+plan = connection.execute(
+    f"EXPLAIN QUERY PLAN SELECT f_id FROM frames WHERE run_id = {tracer.run_id} AND f_call_id IS ? AND f_id > ? "
+    "ORDER BY f_id LIMIT 1",
+    (1, 0),
+).fetchall()
+assert run_index_prefix(tracer.run_id) in str(plan), plan
+
+assert at(nav.current)[0] == "<module>" and nav.step_back() is None
+assert at(nav.step_forward()) == ("main", 1)
+assert at(nav.step_forward()) == ("middle", 1)
+assert at(nav.step_over()) == ("middle", 2)
+assert at(nav.step_over()) == ("middle", 3)
+# Over the call to leaf, to the loop header.
+assert at(nav.step_over()) == ("middle", 2)
+assert nav.locals() == {"n": 2, "total": 0, "i": 0}
+assert at(nav.step_back()) == ("leaf", 2)
+assert nav.locals() == {"x": 0, "y": 0}
+assert [at(step)[0] for step in nav.stack_at(nav.current.f_id)] == [
+    "leaf",
+    "middle",
+    "main",
+    "<module>",
+]
+# Out of leaf's last line, and back into it.
+assert at(nav.step_over()) == ("middle", 2)
+assert at(nav.continue_to(__file__, leaf.__code__.co_firstlineno + 1)) == ("leaf", 1)
+assert nav.locals() == {"x": 1}
+assert at(nav.step_out()) == ("middle", 2)
+assert nav.locals() == {"n": 2, "total": 2, "i": 1}
+assert at(nav.reverse_continue_to(__file__, leaf.__code__.co_firstlineno + 2)) == (
+    "leaf",
+    2,
+)
+assert nav.locals() == {"x": 1, "y": 2}
+assert at(nav.reverse_continue_to(__file__, leaf.__code__.co_firstlineno + 2)) == (
+    "leaf",
+    2,
+)
+assert nav.locals() == {"x": 0, "y": 0}
+current = nav.current
+assert nav.reverse_continue_to(__file__, leaf.__code__.co_firstlineno + 2) is None
+assert nav.current == current
+# Out of middle, then out of main.
+assert at(nav.step_out()) == ("middle", 2)
+assert at(nav.step_out()) == ("main", 2)
+# Only the `with` block's exit is left: a line of the module (not before 3.10), and the tracer's __exit__.
+out = nav.step_out()
+assert out is None or out.f_funcname == "<module>"
+while nav.step_forward() is not None:
+    pass
+assert nav.current.f_funcname == "__exit__"
+
+
+# Calls nested in, and next to, each other on one line: each frame's caller is the line that called it.
+def inner(x):
+    return x + 1
+
+
+def outer(x):
+    return x * 2
+
+
+def same_line():
+    z = outer(inner(1)) + outer(5)
+    return z
+
+
+calls = SqlTracer(path)
+with calls as t:
+    same_line()
+
+nav = Navigator(connect(path), calls.run_id)
+outer_line = outer.__code__.co_firstlineno + 1
+for x in (2, 5):
+    assert at(nav.continue_to(__file__, outer_line)) == ("outer", 1)
+    assert nav.locals() == {"x": x}
+    # Neither inner, which returned, nor the first outer are callers.
+    assert [at(step) for step in nav.stack_at(nav.current.f_id)][:2] == [("outer", 1), ("same_line", 1)]
+    assert [at(step)[0] for step in nav.stack_at(nav.current.f_id)][2:] == ["<module>"]
+nav.goto(nav.find("f_funcname = 'outer'", ()))
+# Out of the first outer, over the second one.
+assert at(nav.step_over()) == ("same_line", 2)
+
+# Pages of a step's locals are read from the stored document, unless it must be decoded whole.
+def values():
+    numbers = list(range(1000))
+    point = {"x": 1.5, "tags": ["a", "b"], "ok": True}
+    alias = point
+    return numbers
+
+
+pickled = SqlTracer(path, pickle_values=True)
+with pickled as t:
+    values()
+nav = Navigator(connect(path), pickled.run_id)
+assert nav.children(nav.find("f_funcname = 'values' AND f_lineno = ?", (values.__code__.co_firstlineno + 3,))) is None
+
+recorded = SqlTracer(path)
+with recorded as t:
+    values()
+nav = Navigator(connect(path), recorded.run_id)
+f_id = nav.find("f_funcname = 'values' AND f_lineno = ?", (values.__code__.co_firstlineno + 3,))
+numbers, point = nav.children(f_id, count=2)
+assert (numbers.name, numbers.size, numbers.value) == ("numbers", 1000, list(range(7)))
+assert [(child.path, child.value) for child in nav.children(f_id, numbers.path, start=500, count=2)] == [
+    ("$.numbers[500]", 500),
+    ("$.numbers[501]", 501),
+]
+assert point.value == {"x": 1.5, "tags": ["a", "b"], "ok": True} and point.size == 3
+assert [(child.name, child.value, child.size) for child in nav.children(f_id, point.path)] == [
+    ("x", 1.5, None),
+    ("tags", ["a", "b"], 2),
+    ("ok", True, None),
+]
+# Objects shared between locals need the whole document.
+aliased = nav.find("f_funcname = 'values' AND f_lineno = ?", (values.__code__.co_firstlineno + 4,))
+assert nav.children(aliased) is None and nav.locals(aliased)["alias"] is nav.locals(aliased)["point"]
+
+# Partitioned runs are read across their segments, and the caches stay bounded.
+from goet.lib.db.retention import Retention
+
+segmented = SqlTracer(
+    path,
+    partition=True,
+    partition_dir=tempfile.mkdtemp(),
+    retention=Retention(segment_bytes=200),
+)
+with segmented as t:
+    main()
+segmented.retention_worker.close(wait=True)
+
+nav = Navigator(connect(path), segmented.run_id, cache_size=4)
+assert len(nav.parts) > 1
+forward = [nav.current]
+while nav.step_forward() is not None:
+    forward.append(nav.current)
+backward = [nav.current]
+while nav.step_back() is not None:
+    backward.append(nav.current)
+first = forward[0].f_id
+assert [step.f_id for step in forward] == list(range(first, first + len(forward)))
+assert backward == forward[::-1]
+assert len(nav.steps) == 4
+print([at(step) for step in forward])
+
+nav.goto(forward[0].f_id)
+nav.continue_to(__file__, leaf.__code__.co_firstlineno + 2)
+assert at(nav.step_out()) == ("middle", 2)
+assert nav.locals() == {"n": 2, "total": 0, "i": 0}
+
+# The run's indexes go with it.
+delete_run(connection, tracer.run_id)
+assert not connection.execute(indexes, (run_index_prefix(tracer.run_id) + "*",)).fetchall()
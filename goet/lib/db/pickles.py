@@ -0,0 +1,146 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+from typing import Any, Dict, List, Mapping, Union
+
+from goet.lib.converter.converter import resolve_refs, unstructure_complex_types
+from goet.lib.db.compress import Decompressor
+
+# Buffers at least this big are stored out-of-band, straight from memory, instead of inside the pickle.
+OUT_OF_BAND_SIZE = 4096
+
+JSON_TYPES = (str, int, float, bool, type(None))
+BYTES_TYPES = (bytes, bytearray, memoryview)
+
+
+class OutOfBand:
+    """Pickles a bytes-like value through a PickleBuffer, so its payload can go out-of-band.
+
+    Unpickles back to bytes/bytearray (memoryviews come back as bytes, they can't be pickled).
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __reduce__(self):
+        typ = bytearray if type(self.value) is bytearray else bytes
+        return typ, (pickle.PickleBuffer(self.value),)
+
+
+class LazyValue:
+    """A recorded value that is only unpickled once inspected (`.value`)."""
+
+    __slots__ = ("store", "pickle_id", "_value")
+
+    MISSING = object()
+
+    def __init__(self, store: "PickleStore", pickle_id: int):
+        self.store = store
+        self.pickle_id = pickle_id
+        self._value = self.MISSING
+
+    @property
+    def value(self) -> Any:
+        if self._value is self.MISSING:
+            self._value = self.store.get(self.pickle_id)
+        return self._value
+
+    def __repr__(self) -> str:
+        return f"<LazyValue pickle_id={self.pickle_id}>"
+
+
+class PickleStore:
+    """PickleStore keeps recorded values as pickle (protocol 5) bytes, so they can be fully inspected later.
+
+    * identical pickles are stored once, keyed by their digest
+    * large buffers are stored out-of-band as raw blobs: PEP 574 aware objects (e.g. numpy arrays)
+      and bytes-like locals
+    * values that can't be pickled fall back to the converter's JSON, objects they share numbered across the
+      document (see `resolve_refs`)
+
+    In a locals document, a pickled value is written as {"$pickle": id}.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        # digest -> pickles.id, for pickles written by this store.
+        self.ids: Dict[bytes, int] = {}
+        self.decompressor = Decompressor(connection)
+
+    def put(self, value: Any) -> int:
+        buffers: List[pickle.PickleBuffer] = []
+
+        def out_of_band(buffer: pickle.PickleBuffer) -> bool:
+            if buffer.raw().nbytes < OUT_OF_BAND_SIZE:
+                return True
+            buffers.append(buffer)
+            return False
+
+        if type(value) in BYTES_TYPES:
+            value = OutOfBand(value)
+        data = pickle.dumps(value, protocol=5, buffer_callback=out_of_band)
+
+        digest = hashlib.blake2b(data, digest_size=16)
+        for buffer in buffers:
+            digest.update(buffer.raw())
+        digest = digest.digest()
+
+        pickle_id = self.ids.get(digest)
+        if pickle_id is not None:
+            return pickle_id
+
+        self.cursor.execute(
+            "INSERT OR IGNORE INTO pickles (digest, data) VALUES (?, ?)", (digest, data)
+        )
+        pickle_id = self.cursor.execute(
+            "SELECT id FROM pickles WHERE digest = ?", (digest,)
+        ).fetchone()[0]
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO pickle_buffers (pickle_id, idx, data) VALUES (?, ?, ?)",
+            # sqlite3 reads the memoryview directly, the buffer is never copied into a bytes object.
+            ((pickle_id, idx, buffer.raw()) for idx, buffer in enumerate(buffers)),
+        )
+        self.ids[digest] = pickle_id
+        return pickle_id
+
+    def get(self, pickle_id: int) -> Any:
+        (data,) = self.cursor.execute(
+            "SELECT data FROM pickles WHERE id = ?", (pickle_id,)
+        ).fetchone()
+        buffers = [
+            buffer
+            for (buffer,) in self.cursor.execute(
+                "SELECT data FROM pickle_buffers WHERE pickle_id = ? ORDER BY idx",
+                (pickle_id,),
+            )
+        ]
+        return pickle.loads(data, buffers=buffers)
+
+    def encode_value(self, value: Any, memo: dict) -> Any:
+        if type(value) in JSON_TYPES:
+            return value
+        try:
+            return {"$pickle": self.put(value)}
+        except Exception:
+            return unstructure_complex_types(value, memo)
+
+    def encode(self, f_locals: Mapping[str, Any]) -> str:
+        memo: dict = {}
+        return json.dumps(
+            {name: self.encode_value(value, memo) for name, value in f_locals.items()}
+        )
+
+    def decode(self, f_locals: Union[str, bytes]) -> Dict[str, Any]:
+        """Read a (possibly compressed) locals document back, with its {"$ref": n} resolved (see `resolve_refs`).
+        Pickled values are returned as LazyValues."""
+        document = resolve_refs(json.loads(self.decompressor.decompress(f_locals)))
+        return {
+            name: LazyValue(self, value["$pickle"])
+            if isinstance(value, dict) and value.keys() == {"$pickle"}
+            else value
+            for name, value in document.items()
+        }
@@ -0,0 +1,49 @@
+"""Compare recording locals as converter JSON vs PickleStore pickles.
+
+    python -m goet.lib.db.pickles_bench
+"""
+import json
+import sqlite3
+import timeit
+
+from goet.lib.converter.converter import converter
+from goet.lib.db.pickles import PickleStore
+from goet.tracer.capture_bench import many_locals
+
+N = 2_000
+
+
+class Order:
+    def __init__(self, order_id):
+        self.order_id = order_id
+        self.items = [{"sku": f"sku-{i}", "qty": i} for i in range(20)]
+        self.total = 12.5
+
+
+def main():
+    connection = sqlite3.connect(":memory:")
+    connection.executescript(
+        """
+        CREATE TABLE pickles (id INTEGER PRIMARY KEY, digest BLOB NOT NULL UNIQUE, data BLOB NOT NULL);
+        CREATE TABLE pickle_buffers (
+            pickle_id INTEGER NOT NULL, idx INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (pickle_id, idx)
+        );
+        """
+    )
+    store = PickleStore(connection)
+
+    cases = {
+        "many locals": dict(many_locals(1, 0).f_locals),
+        "objects": {"order": Order(1), "orders": [Order(i) for i in range(5)]},
+        "64KB bytearray": {"payload": bytearray(65536)},
+    }
+    for name, f_locals in cases.items():
+        as_json = lambda: json.dumps(converter.unstructure(f_locals))
+        as_pickle = lambda: store.encode(f_locals)
+        json_us = min(timeit.repeat(as_json, number=N, repeat=3)) / N * 1e6
+        pickle_us = min(timeit.repeat(as_pickle, number=N, repeat=3)) / N * 1e6
+        print(f"{name:<16} json {json_us:8.1f} us/line   pickle {pickle_us:8.1f} us/line")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import ast
+import hashlib
+import re
+import sqlite3
+from collections import Counter
+from typing import Any, Iterator, List, Optional, Set, Tuple
+
+from goet.lib.db.compress import Decompressor
+from goet.lib.db.navigator import Step
+from goet.lib.db.runs import create_indexes, database_path, run_index_prefix
+
+# Names a predicate can use for the frames columns.
+COLUMNS = {
+    "step": "f_id",
+    "caller": "f_back_id",
+    "file": "f_filename",
+    "func": "f_funcname",
+    "line": "f_lineno",
+}
+COLUMNS.update({column: column for column in COLUMNS.values()})
+
+OPERATORS = {
+    ast.Eq: "=",
+    ast.NotEq: "!=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+}
+
+KEY = re.compile(r"[A-Za-z_][A-Za-z0-9_]*\Z")
+
+# Only documents stored as JSON text can be indexed, compressed ones are read through DECOMPRESS.
+TEXT = "typeof(f_locals) = 'text'"
+DECOMPRESS = "goet_locals"
+
+# How many times find_steps compared each JSON path of a run's locals, by (database file, run_id, path), and the
+# ones indexed so far. Counted by this process only, nothing is written to the database for it.
+QUERIES: "Counter[Tuple[str, int, str]]" = Counter()
+INDEXED: Set[Tuple[str, int, str]] = set()
+
+
+class Predicate:
+    """Predicate compiles a Python expression over a step to a SQL condition on the frames table.
+
+    >>> Predicate("locals.retries > 3 and func == 'send'").sql
+    "(json_extract(f_locals, '$.retries') > ?) AND (f_funcname = ?)"
+
+    `locals.<name>` (and `locals["name"]`, `.attr`, `[index]` below it) is the recorded value of a local, the
+    frames columns are `step`, `caller`, `file`, `func` and `line`. Comparisons (chained too), `in` and `not in`
+    a list of constants, `is None`, `and`, `or`, `not` and `len()` of a list or string are supported.
+
+    Values are compared as SQLite sees them in the JSON document: a missing local is None, and pickled values or
+    objects written as {"$ref": n} (see resolve_refs) don't compare equal to what they stood for.
+    """
+
+    def __init__(self, where: str, document: str = "f_locals"):
+        self.where = where
+        self.document = document
+        self.params: List[Any] = []
+        # JSON paths compared by the predicate, they're the ones worth an index.
+        self.paths: List[str] = []
+        try:
+            tree = ast.parse(where.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid predicate {where!r}: {e.msg}") from None
+        self.sql = self.compile(tree.body)
+
+    def unsupported(self, node: ast.AST) -> ValueError:
+        source = ast.get_source_segment(self.where.strip(), node) or type(node).__name__
+        return ValueError(f"Unsupported in a predicate: {source!r}")
+
+    def compile(self, node: ast.AST) -> str:
+        if isinstance(node, ast.BoolOp):
+            op = " AND " if isinstance(node.op, ast.And) else " OR "
+            return op.join(f"({self.compile(value)})" for value in node.values)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return f"NOT ({self.compile(node.operand)})"
+        if isinstance(node, ast.Compare):
+            return " AND ".join(self.comparisons(node))
+        if isinstance(node, ast.Name):
+            if node.id not in COLUMNS:
+                raise self.unsupported(node)
+            return COLUMNS[node.id]
+        if isinstance(node, (ast.Attribute, ast.Subscript)):
+            path = self.path(node)
+            if path not in self.paths:
+                self.paths.append(path)
+            return f"json_extract({self.document}, {quote(path)})"
+        if isinstance(node, ast.Call):
+            if not (
+                isinstance(node.func, ast.Name)
+                and node.func.id == "len"
+                and len(node.args) == 1
+                and not node.keywords
+            ):
+                raise self.unsupported(node)
+            path = quote(self.path(node.args[0]))
+            return (
+                f"CASE json_type({self.document}, {path})"
+                f" WHEN 'array' THEN json_array_length({self.document}, {path})"
+                f" WHEN 'text' THEN length(json_extract({self.document}, {path})) END"
+            )
+        self.params.append(self.constant(node))
+        return "?"
+
+    def comparisons(self, node: ast.Compare) -> Iterator[str]:
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.Is, ast.IsNot, ast.Eq, ast.NotEq)) and is_none(right):
+                negate = isinstance(op, (ast.IsNot, ast.NotEq))
+                yield f"{self.compile(left)} IS {'NOT ' if negate else ''}NULL"
+            elif isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+                    raise self.unsupported(right)
+                sql = self.compile(left)
+                placeholders = ", ".join(self.compile(element) for element in right.elts)
+                negate = "NOT " if isinstance(op, ast.NotIn) else ""
+                yield f"{sql} {negate}IN ({placeholders})"
+            elif type(op) in OPERATORS:
+                yield f"{self.compile(left)} {OPERATORS[type(op)]} {self.compile(right)}"
+            else:
+                raise self.unsupported(node)
+            left = right
+
+    def path(self, node: ast.AST) -> str:
+        """The JSON path of `locals.<name>...` in the locals document."""
+        if isinstance(node, ast.Name) and node.id == "locals":
+            return "$"
+        if isinstance(node, ast.Attribute):
+            return self.path(node.value) + key(node.attr, node)
+        if isinstance(node, ast.Subscript):
+            index = self.constant(node.slice)
+            if isinstance(index, str):
+                return self.path(node.value) + key(index, node)
+            if isinstance(index, int) and not isinstance(index, bool):
+                return self.path(node.value) + (f"[{index}]" if index >= 0 else f"[#{index}]")
+        raise self.unsupported(node)
+
+    def constant(self, node: ast.AST) -> Any:
+        if isinstance(node, ast.Constant) and type(node.value) in (str, int, float, bool):
+            return node.value
+        if (
+            isinstance(node, ast.UnaryOp)
+            and isinstance(node.op, ast.USub)
+            and isinstance(node.operand, ast.Constant)
+            and type(node.operand.value) in (int, float)
+        ):
+            return -node.operand.value
+        raise self.unsupported(node)
+
+
+def is_none(node: ast.AST) -> bool:
+    return isinstance(node, ast.Constant) and node.value is None
+
+
+def key(name: str, node: ast.AST) -> str:
+    if KEY.match(name):
+        return f".{name}"
+    if '"' in name:
+        raise ValueError(f"Unsupported key in a predicate: {name!r}")
+    return f'."{name}"'
+
+
+def quote(path: str) -> str:
+    """`path` as a SQL string literal. Literal, not a parameter, so an index on the same expression matches."""
+    return "'" + path.replace("'", "''") + "'"
+
+
+def index_name(run_id: int, path: str) -> str:
+    digest = hashlib.blake2b(path.encode(), digest_size=6).hexdigest()
+    return f"{run_index_prefix(run_id)}locals_{digest}_idx"
+
+
+def index_paths(db_path: str, run_id: int, paths: List[str], index_after: int):
+    """Count a query on each of `paths` in run `run_id`'s frames of `db_path`, and index the ones queried
+    `index_after` times.
+
+    The indexes are partial, only the run's steps are in them, and created on a connection of their own (see
+    `create_indexes`): when another connection is writing to the database, the path is indexed by a later query.
+    """
+    for path in paths:
+        key = (db_path, run_id, path)
+        QUERIES[key] += 1
+        if QUERIES[key] < index_after or key in INDEXED:
+            continue
+        # run_id is in the key too, or without statistics SQLite prefers the (run_id, f_id) index.
+        statement = f"""
+            CREATE INDEX IF NOT EXISTS {index_name(run_id, path)}
+            ON frames (run_id, json_extract(f_locals, {quote(path)}), f_id) WHERE run_id = {run_id} AND {TEXT}
+        """
+        if create_indexes(db_path, [statement]):
+            INDEXED.add(key)
+
+
+def find_steps(
+    connection: sqlite3.Connection,
+    run_id: int,
+    where: str,
+    index_after: Optional[int] = 3,
+) -> Iterator[Step]:
+    """The steps of a run matching predicate `where` (see Predicate), in order.
+
+    >>> for step in find_steps(connection, run_id, "locals.retries > 3 and func == 'send'"):
+    ...     print(step.f_lineno, Navigator(connection, run_id).locals(step.f_id))
+
+    Steps are read from the cursor as they're iterated, not fetched up front. Once a local's path was queried
+    `index_after` times (None never), an expression index on it is created, so the next queries don't scan every
+    step of the run (see `index_paths`). Only ended runs are indexed, so recording never pays for them.
+    Compressed runs are decompressed step by step and are never indexed.
+
+    Raises ValueError right away for a predicate that can't be compiled.
+    """
+    Predicate(where)
+    run_id = int(run_id)
+    ended = connection.execute(
+        "SELECT ended_at IS NOT NULL FROM runs WHERE id = ?", (run_id,)
+    ).fetchone()
+    if not (ended and ended[0]):
+        index_after = None
+    paths = connection.execute(
+        "SELECT db_path FROM segments WHERE run_id = ? ORDER BY idx", (run_id,)
+    ).fetchall()
+    return steps(connection, run_id, where, [path for (path,) in paths], index_after)
+
+
+def steps(
+    connection: sqlite3.Connection,
+    run_id: int,
+    where: str,
+    paths: List[str],
+    index_after: Optional[int],
+) -> Iterator[Step]:
+    for path in paths or [None]:
+        part = connection if path is None else sqlite3.connect(path)
+        try:
+            yield from steps_in(part, path or database_path(connection), run_id, where, index_after)
+        finally:
+            if part is not connection:
+                part.close()
+
+
+def steps_in(
+    connection: sqlite3.Connection,
+    db_path: str,
+    run_id: int,
+    where: str,
+    index_after: Optional[int],
+) -> Iterator[Step]:
+    row = connection.execute(
+        "SELECT typeof(f_locals) FROM frames WHERE run_id = ? LIMIT 1", (run_id,)
+    ).fetchone()
+    if row is None:
+        return
+    if row[0] == "text":
+        predicate = Predicate(where)
+        if index_after is not None:
+            index_paths(db_path, run_id, predicate.paths, index_after)
+        condition = f"{TEXT} AND ({predicate.sql})"
+    else:
+        decompressor = Decompressor(connection)
+        connection.create_function(
+            DECOMPRESS, 1, decompressor.decompress, deterministic=True
+        )
+        predicate = Predicate(where, f"{DECOMPRESS}(f_locals)")
+        condition = predicate.sql
+
+    # run_id is a literal, for the run's partial indexes to match.
+    cursor = connection.execute(
+        f"""
+        SELECT f_id, f_back_id, f_call_id, f_filename, f_funcname, f_lineno FROM frames
+        WHERE run_id = {run_id} AND {condition} ORDER BY f_id
+        """,
+        predicate.params,
+    )
+    for row in cursor:
+        yield Step(*row)
+
+
+def explain(connection: sqlite3.Connection, run_id: int, where: str) -> List[Tuple[Any, ...]]:
+    """SQLite's query plan for `where` on an uncompressed run (e.g. to check it uses an index)."""
+    predicate = Predicate(where)
+    return connection.execute(
+        f"""
+        EXPLAIN QUERY PLAN SELECT f_id FROM frames
+        WHERE run_id = {int(run_id)} AND {TEXT} AND ({predicate.sql}) ORDER BY f_id
+        """,
+        predicate.params,
+    ).fetchall()
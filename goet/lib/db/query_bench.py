@@ -0,0 +1,42 @@
+"""Time find_steps on a run before and after the locals path it queries is indexed.
+
+    python -m goet.lib.db.query_bench
+
+The first queries scan every step of the run with json_extract, the third one creates the expression index, the
+ones after that are index lookups.
+"""
+import os
+import tempfile
+import time
+
+from goet.lib.db.query import find_steps
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+def send(retries):
+    sent = retries < 99_990
+    return sent
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "query_bench.sqlite3")
+    tracer = SqlTracer(path)
+    with tracer:
+        for retries in range(100_000):
+            send(retries)
+    connection = connect(path)
+    (steps,) = connection.execute(
+        "SELECT COUNT(*) FROM frames WHERE run_id = ?", (tracer.run_id,)
+    ).fetchone()
+    print(f"{steps} steps")
+
+    for query in range(1, 6):
+        start = time.perf_counter()
+        found = list(find_steps(connection, tracer.run_id, "locals.retries >= 99_995"))
+        elapsed = time.perf_counter() - start
+        print(f"query {query}: {elapsed * 1000:.1f}ms, {len(found)} steps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import tempfile
+import time
+import types
+
+from goet.lib.db.navigator import Navigator
+from goet.lib.db.query import Predicate, explain, find_steps, index_name
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+def send(message, retries):
+    attempt = {"retries": retries, "to": message["to"]}
+    sent = retries < 5
+    return sent
+
+
+def main():
+    for i in range(8):
+        send({"to": f"user{i}", "tags": ["a"] * i}, retries=i)
+
+
+RETURN = send.__code__.co_firstlineno + 3
+
+
+def at(steps):
+    return [(step.f_funcname, step.f_lineno - send.__code__.co_firstlineno) for step in steps]
+
+
+path = os.path.join(tempfile.mkdtemp(), "query.sqlite3")
+runs = {}
+for name, kwargs in {
+    "plain": {},
+    "compressed": {"compress": "zlib"},
+    "partitioned": {"partition": True},
+}.items():
+    tracer = SqlTracer(path, **kwargs)
+    with tracer:
+        main()
+    runs[name] = tracer.run_id
+connection = connect(path)
+
+# Compiling.
+predicate = Predicate("locals.retries > 3 and func == 'send'")
+assert predicate.sql == "(json_extract(f_locals, '$.retries') > ?) AND (f_funcname = ?)"
+assert predicate.params == [3, "send"] and predicate.paths == ["$.retries"]
+predicate = Predicate("""locals.message["to"] in ('user1', 'user2') and locals.message.tags[-1] is not None""")
+assert predicate.paths == ['$.message.to', "$.message.tags[#-1]"], predicate.paths
+predicate = Predicate("""locals["it's"] == 1""")
+assert predicate.paths == ["$.\"it's\""] and "$.\"it''s\"" in predicate.sql
+for invalid in ("locals.x +", "__import__('os')", "locals.x is 1", "locals", "func.x == 1", "locals.x in y"):
+    try:
+        find_steps(connection, runs["plain"], invalid)
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError(invalid)
+
+# Querying, whichever way the run was recorded.
+for name, run_id in runs.items():
+    found = list(find_steps(connection, run_id, f"locals.retries > 3 and func == 'send' and line == {RETURN}"))
+    assert len(found) == 4, (name, found)
+    nav = Navigator(connection, run_id)
+    assert [nav.locals(step.f_id)["retries"] for step in found] == [4, 5, 6, 7]
+    assert at(found) == [("send", 3)] * 4
+
+    found = list(find_steps(connection, run_id, "not locals.sent and locals.sent is not None"))
+    assert [nav.locals(step.f_id)["retries"] for step in found] == [5, 6, 7], name
+    found = find_steps(connection, run_id, "locals.message['to'] in ['user1', 'user6'] and len(locals.message.tags) >= 6")
+    assert {nav.locals(step.f_id)["retries"] for step in found} == {6}, name
+    found = find_steps(connection, run_id, "3 <= locals.attempt.retries < 5 and len(locals.attempt.to) == 5")
+    assert {nav.locals(step.f_id)["retries"] for step in found} == {3, 4}, name
+    assert not list(find_steps(connection, run_id, "locals.missing == 1 or step < 0"))
+
+# Streamed from the cursor.
+found = find_steps(connection, runs["plain"], "func == 'send'")
+assert isinstance(found, types.GeneratorType)
+first = next(found)
+assert first.f_funcname == "send"
+assert len(list(found)) + 1 == len(list(find_steps(connection, runs["plain"], "func == 'send'")))
+
+# A path queried 3 times is indexed, in the main database and in the segments of a partitioned run.
+for _ in range(2):
+    for run_id in (runs["plain"], runs["partitioned"]):
+        list(find_steps(connection, run_id, "locals.retries == 1"))
+indexes = lambda db: {name for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+assert index_name(runs["plain"], "$.retries") in indexes(connection)
+assert index_name(runs["plain"], "$.attempt.retries") not in indexes(connection)
+plan = " ".join(row[-1] for row in explain(connection, runs["plain"], "locals.retries > 3"))
+assert index_name(runs["plain"], "$.retries") in plan, plan
+(segment,) = connection.execute("SELECT db_path FROM segments WHERE run_id = ?", (runs["partitioned"],)).fetchone()
+assert index_name(runs["partitioned"], "$.retries") in indexes(sqlite3.connect(segment))
+# Indexes don't change the answers.
+assert len(list(find_steps(connection, runs["plain"], f"locals.retries > 3 and line == {RETURN}"))) == 4
+
+# No index without index_after.
+for _ in range(3):
+    list(find_steps(connection, runs["plain"], "locals.attempt.to == 'user1'", index_after=None))
+assert index_name(runs["plain"], "$.attempt.to") not in indexes(connection)
+
+# Querying doesn't wait for a connection writing to the database (here the caller's own), nor commit or roll it
+# back: the path is indexed by a later query.
+connection.execute("INSERT INTO codes (f_filename, f_funcname) VALUES ('pending.py', 'f')")
+start = time.monotonic()
+for _ in range(3):
+    list(find_steps(connection, runs["plain"], "locals.sent == 1"))
+assert time.monotonic() - start < 5 and connection.in_transaction
+assert index_name(runs["plain"], "$.sent") not in indexes(connection)
+connection.rollback()
+list(find_steps(connection, runs["plain"], "locals.sent == 1"))
+assert index_name(runs["plain"], "$.sent") in indexes(connection)
+
+# Runs still being recorded aren't indexed.
+connection.execute("UPDATE runs SET ended_at = NULL WHERE id = ?", (runs["plain"],))
+connection.commit()
+for _ in range(3):
+    list(find_steps(connection, runs["plain"], "locals.message.to == 'user1'"))
+assert index_name(runs["plain"], "$.message.to") not in indexes(connection)
@@ -0,0 +1,184 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+import attr
+
+from goet.lib.db.runs import delete_run, drop_segment
+
+
+@attr.frozen
+class Retention:
+    """How much recorded history to keep. Every limit is optional.
+
+    * `max_run_bytes`: per run, the oldest segments are dropped beyond this (the run keeps its most recent steps)
+    * `max_total_bytes`: the oldest runs are dropped beyond this
+    * `max_age`: runs that started more than this many seconds ago are dropped
+    * `keep_last`: only this many of the most recent runs are kept
+    * `stale_after`: runs never ended (their process crashed, or was killed) are dropped like the others once they
+      haven't written anything for this many seconds (see `last_write`). Until then they may still be recording.
+
+    Sizes are the bytes of recorded locals (runs.bytes, segments.bytes), not file sizes. A partitioned run rotates
+    to a new segment file every `segment_bytes`, by default a quarter of `max_run_bytes`.
+    """
+
+    max_run_bytes: Optional[int] = None
+    max_total_bytes: Optional[int] = None
+    max_age: Optional[float] = None
+    keep_last: Optional[int] = None
+    segment_bytes: Optional[int] = None
+    stale_after: float = 24 * 60 * 60
+
+    @property
+    def rotate_bytes(self) -> Optional[int]:
+        if self.segment_bytes is not None:
+            return self.segment_bytes
+        if self.max_run_bytes is not None:
+            return max(1, self.max_run_bytes // 4)
+        return None
+
+
+@attr.frozen
+class Eviction:
+    """What retention dropped: a whole run (`segment` is None), or one segment of a run."""
+
+    run_id: int
+    segment: Optional[int]
+    reason: str
+    bytes: int
+
+
+RUN_BYTES = """
+SELECT id, started_at, ended_at IS NULL, COALESCE((SELECT SUM(bytes) FROM segments WHERE run_id = runs.id), bytes, 0)
+FROM runs ORDER BY id DESC
+"""
+
+
+def enforce(
+    connection: sqlite3.Connection,
+    retention: Retention,
+    active: Optional[int] = None,
+    now: Optional[float] = None,
+) -> List[Eviction]:
+    """Drop what `retention` doesn't keep, except the `active` run and runs still being recorded (their old
+    segments can still go). Runs that weren't ended but are stale (see Retention) aren't spared.
+
+    Only deletes whole segment files, and rows for runs that aren't partitioned: never VACUUMs.
+    """
+    now = time.time() if now is None else now
+    evictions: List[Eviction] = []
+
+    if retention.max_run_bytes is not None:
+        runs = connection.execute(
+            "SELECT run_id FROM segments GROUP BY run_id HAVING SUM(bytes) > ?",
+            (retention.max_run_bytes,),
+        ).fetchall()
+        for (run_id,) in runs:
+            segments = connection.execute(
+                "SELECT id, idx, bytes FROM segments WHERE run_id = ? AND bytes IS NOT NULL ORDER BY idx",
+                (run_id,),
+            ).fetchall()
+            total = sum(nbytes for _, _, nbytes in segments)
+            # Never the last closed segment, the run keeps its most recent steps.
+            for segment_id, idx, nbytes in segments[:-1]:
+                if total <= retention.max_run_bytes:
+                    break
+                drop_segment(connection, segment_id)
+                connection.commit()
+                total -= nbytes
+                evictions.append(Eviction(run_id, idx, "max_run_bytes", nbytes))
+
+    runs = connection.execute(RUN_BYTES).fetchall()
+    total = sum(nbytes for _, _, _, nbytes in runs)
+    # Most recent first: the ones past `keep_last` go first, then too old, then the oldest while over size.
+    for position, (run_id, started_at, recording, nbytes) in reversed(list(enumerate(runs))):
+        if run_id == active:
+            continue
+        if recording and now - last_write(connection, run_id, started_at) <= retention.stale_after:
+            # Another process may still be writing to its files.
+            continue
+        if retention.keep_last is not None and position >= retention.keep_last:
+            reason = "keep_last"
+        elif retention.max_age is not None and now - started_at > retention.max_age:
+            reason = "max_age"
+        elif (
+            retention.max_total_bytes is not None
+            and total > retention.max_total_bytes
+        ):
+            reason = "max_total_bytes"
+        else:
+            continue
+        delete_run(connection, run_id)
+        total -= nbytes
+        evictions.append(Eviction(run_id, None, reason, nbytes))
+    return evictions
+
+
+def last_write(connection: sqlite3.Connection, run_id: int, started_at: float) -> float:
+    """When run `run_id` last wrote: the latest change to its segment files, or when it started."""
+    times = [started_at]
+    for (db_path,) in connection.execute("SELECT db_path FROM segments WHERE run_id = ?", (run_id,)):
+        for path in (db_path, f"{db_path}-wal"):
+            try:
+                times.append(os.path.getmtime(path))
+            except OSError:
+                pass
+    return max(times)
+
+
+class RetentionWorker:
+    """RetentionWorker enforces a Retention in a background thread, with its own connection to `db_path`.
+
+    The traced thread only queues a `check`; evictions are reported to `on_evict` (from the worker thread)
+    and kept in `evicted`. It also checks every `interval` seconds, so `max_age` applies to an idle process too.
+    """
+
+    STOP = object()
+
+    def __init__(
+        self,
+        db_path: str,
+        retention: Retention,
+        on_evict: Optional[Callable[[Eviction], None]] = None,
+        interval: Optional[float] = 60.0,
+    ):
+        self.db_path = db_path
+        self.retention = retention
+        self.on_evict = on_evict
+        self.interval = interval
+        self.evicted: List[Eviction] = []
+        self.queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self.thread = threading.Thread(
+            target=self.run, name="goet-retention", daemon=True
+        )
+        self.thread.start()
+
+    def check(self, active: Optional[int] = None):
+        """Enforce retention soon, sparing the `active` run."""
+        self.queue.put(active)
+
+    def close(self, wait: bool = False):
+        self.queue.put(self.STOP)
+        if wait:
+            self.thread.join()
+
+    def run(self):
+        # Waits (up to `timeout`) for the tracer's short transactions on the main database.
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                try:
+                    active = self.queue.get(timeout=self.interval)
+                except queue.Empty:
+                    active = None
+                if active is self.STOP:
+                    return
+                for eviction in enforce(connection, self.retention, active):
+                    self.evicted.append(eviction)
+                    if self.on_evict is not None:
+                        self.on_evict(eviction)
+        finally:
+            connection.close()
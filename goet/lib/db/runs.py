@@ -0,0 +1,257 @@
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Iterable, List, Mapping, Optional
+
+import attr
+
+from goet.lib.db.schema import SCHEMA
+
+# Tables holding a run's events, by run_id. Pickles, blobs and codes are content addressed and shared between runs.
+# search is only created once a run is indexed for it (see SearchIndex).
+RUN_TABLES = ("frames", "exceptions", "logs", "loops", "dictionaries", "changes", "search")
+
+
+@attr.frozen
+class Run:
+    id: int
+    uuid: str
+    started_at: float
+    ended_at: Optional[float]
+    argv: List[str]
+    pid: int
+    python_version: str
+    frames: Optional[int]
+    exceptions: Optional[int]
+    logs: Optional[int]
+    bytes: Optional[int]
+    db_path: Optional[str]
+
+    @classmethod
+    def from_row(cls, row) -> "Run":
+        row = list(row)
+        row[4] = json.loads(row[4])
+        return cls(*row)
+
+
+def start_run(
+    connection: sqlite3.Connection,
+    run_uuid: Optional[str] = None,
+    db_path: Optional[str] = None,
+) -> int:
+    """Record that a run of this process starts now, returns its runs.id."""
+    cursor = connection.execute(
+        """
+        INSERT INTO runs (uuid, started_at, argv, pid, python_version, db_path)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            run_uuid or str(uuid.uuid4()),
+            time.time(),
+            json.dumps(sys.argv),
+            os.getpid(),
+            platform.python_version(),
+            db_path,
+        ),
+    )
+    return cursor.lastrowid
+
+
+def end_run(
+    connection: sqlite3.Connection,
+    run_id: int,
+    counts: Mapping[str, int],
+    nbytes: int,
+):
+    """`counts` maps frames/exceptions/logs to how many were recorded, `nbytes` is the size of the recorded locals."""
+    connection.execute(
+        """
+        UPDATE runs SET ended_at = ?, frames = ?, exceptions = ?, logs = ?, bytes = ?
+        WHERE id = ?
+        """,
+        (
+            time.time(),
+            counts.get("frames", 0),
+            counts.get("exceptions", 0),
+            counts.get("logs", 0),
+            nbytes,
+            run_id,
+        ),
+    )
+
+
+def list_runs(connection: sqlite3.Connection) -> List[Run]:
+    """Every run, most recent first. Only reads the runs table."""
+    return [
+        Run.from_row(row)
+        for row in connection.execute(
+            f"SELECT {', '.join(attr.fields_dict(Run))} FROM runs ORDER BY id DESC"
+        )
+    ]
+
+
+def database_path(connection: sqlite3.Connection) -> str:
+    """The file of `connection`'s main database, "" when it's in memory."""
+    return next(
+        path
+        for _, name, path in connection.execute("PRAGMA database_list")
+        if name == "main"
+    )
+
+
+def run_db_path(
+    connection: sqlite3.Connection, run_uuid: str, directory: Optional[str] = None
+) -> str:
+    """Where a partitioned run is stored: `directory`, or a runs/ directory next to the main database."""
+    if directory is None:
+        main = database_path(connection)
+        if not main:
+            raise ValueError(
+                "An in-memory database needs a directory for partitioned runs"
+            )
+        directory = os.path.join(os.path.dirname(main), "runs")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{run_uuid}.sqlite3")
+
+
+def segment_path(db_path: str, idx: int) -> str:
+    """run.sqlite3, run.1.sqlite3, run.2.sqlite3, ..."""
+    if not idx:
+        return db_path
+    base, ext = os.path.splitext(db_path)
+    return f"{base}.{idx}{ext}"
+
+
+def add_segment(
+    connection: sqlite3.Connection, run_id: int, idx: int, db_path: str, first_f_id: int
+) -> int:
+    cursor = connection.execute(
+        "INSERT INTO segments (run_id, idx, db_path, first_f_id) VALUES (?, ?, ?, ?)",
+        (run_id, idx, db_path, first_f_id),
+    )
+    return cursor.lastrowid
+
+
+def close_segment(
+    connection: sqlite3.Connection, segment_id: int, last_f_id: int, nbytes: int
+):
+    connection.execute(
+        "UPDATE segments SET last_f_id = ?, bytes = ? WHERE id = ?",
+        (last_f_id, nbytes, segment_id),
+    )
+
+
+def unlink_db(db_path: str):
+    for path in (db_path, f"{db_path}-journal", f"{db_path}-wal", f"{db_path}-shm"):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def drop_segment(connection: sqlite3.Connection, segment_id: int):
+    """Delete a segment's file, and the events in it."""
+    run_id, idx, db_path = connection.execute(
+        "SELECT run_id, idx, db_path FROM segments WHERE id = ?", (segment_id,)
+    ).fetchone()
+    detach(connection, f"run_{run_id}_{idx}")
+    unlink_db(db_path)
+    connection.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+
+
+def run_index_prefix(run_id: int) -> str:
+    """Indexes on a single run's events (partial, WHERE run_id = `run_id`) are named with this prefix."""
+    return f"frames_run_{int(run_id)}_"
+
+
+def create_indexes(path: str, statements: Iterable[str]) -> bool:
+    """Run the CREATE INDEX `statements` on a connection of their own to the database file at `path`.
+
+    Never waits for a lock: while another connection is writing to it, or when it's read-only (or in memory),
+    nothing more is created and it returns False.
+    """
+    if not path:
+        return False
+    try:
+        connection = sqlite3.connect(path, timeout=0)
+    except sqlite3.OperationalError:
+        return False
+    try:
+        with connection:
+            for statement in statements:
+                connection.execute(statement)
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def create_run_db(path: str) -> sqlite3.Connection:
+    """A database file holding a single (partitioned) run's events."""
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def attach_run(connection: sqlite3.Connection, run_id: int) -> List[str]:
+    """The schema names to query a run's events with, e.g. f"SELECT * FROM {schema}.frames", in f_id order.
+
+    ["main"] unless the run is partitioned. Each segment of a partitioned run is attached to `connection` the
+    first time it's asked for (SQLite attaches 10 databases at most by default).
+    """
+    (db_path,) = connection.execute(
+        "SELECT db_path FROM runs WHERE id = ?", (run_id,)
+    ).fetchone()
+    if db_path is None:
+        return ["main"]
+
+    attached = {name for _, name, _ in connection.execute("PRAGMA database_list")}
+    schemas = []
+    for idx, path in connection.execute(
+        "SELECT idx, db_path FROM segments WHERE run_id = ? ORDER BY idx", (run_id,)
+    ).fetchall():
+        schema = f"run_{run_id}_{idx}"
+        if schema not in attached:
+            connection.execute("ATTACH DATABASE ? AS ?", (path, schema))
+        schemas.append(schema)
+    return schemas
+
+
+def detach(connection: sqlite3.Connection, schema: str):
+    attached = {name for _, name, _ in connection.execute("PRAGMA database_list")}
+    if schema in attached:
+        connection.execute("DETACH DATABASE ?", (schema,))
+
+
+def delete_run(connection: sqlite3.Connection, run_id: int):
+    """Delete a run and its events. A partitioned run is deleted by unlinking its segment files."""
+    row = connection.execute(
+        "SELECT db_path FROM runs WHERE id = ?", (run_id,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(run_id)
+
+    (db_path,) = row
+    if db_path is None:
+        tables = {
+            name for (name,) in connection.execute("SELECT name FROM sqlite_master")
+        }
+        for table in [table for table in RUN_TABLES if table in tables]:
+            connection.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+        for (index,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name GLOB ?",
+            (run_index_prefix(run_id) + "*",),
+        ).fetchall():
+            connection.execute(f"DROP INDEX IF EXISTS {index}")
+    else:
+        for (segment_id,) in connection.execute(
+            "SELECT id FROM segments WHERE run_id = ?", (run_id,)
+        ).fetchall():
+            drop_segment(connection, segment_id)
+    connection.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+    connection.commit()
@@ -0,0 +1,166 @@
+# One row per recorded run. Events of a run reference runs.id, they live either in this database or, for a
+# partitioned run, in its segment files (see `attach_run`).
+RUNS_SCHEMA = """
+    DROP TABLE IF EXISTS runs;
+
+    -- argv is a JSON list. Counts and bytes are only set once the run ends.
+    -- db_path is only set for partitioned runs, it's the path of their first segment.
+    CREATE TABLE runs (
+        id INTEGER PRIMARY KEY,
+        uuid TEXT NOT NULL UNIQUE,
+        started_at REAL NOT NULL,
+        ended_at REAL,
+        argv TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        python_version TEXT NOT NULL,
+        frames INTEGER,
+        exceptions INTEGER,
+        logs INTEGER,
+        bytes INTEGER,
+        db_path TEXT
+    );
+
+    DROP TABLE IF EXISTS segments;
+
+    -- Database files a partitioned run is written to, in order. A new one is started once the current one holds
+    -- enough bytes (see Retention), so old ones can be dropped whole. Bytes and last_f_id are set once closed.
+    CREATE TABLE segments (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        idx INTEGER NOT NULL,
+        db_path TEXT NOT NULL,
+        first_f_id INTEGER NOT NULL,
+        last_f_id INTEGER,
+        bytes INTEGER,
+        UNIQUE (run_id, idx)
+    );
+"""
+
+# Recorded events: in the main database, and in each partitioned run's own file.
+# snapshot consists of all the frames + all the variables
+SCHEMA = """
+    DROP TABLE IF EXISTS frames;
+
+    -- run_id is runs.id (in the main database).
+    -- f_back_id is the caller's step. f_call_id is the last step recorded when the frame was called: its steps
+    -- share it, no other frame's do.
+    -- f_locals is a JSON document, or a BLOB when the tracer compresses locals (see Decompressor).
+    CREATE TABLE frames (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        f_id INTEGER NOT NULL,
+        f_back_id INTEGER,
+        f_call_id INTEGER,
+        f_filename TEXT NOT NULL,
+        f_funcname TEXT NOT NULL,
+        f_lineno INTEGER NOT NULL,
+        f_locals TEXT NOT NULL
+    );
+    CREATE INDEX frames_run_id_f_id_idx ON frames (run_id, f_id);
+
+    DROP TABLE IF EXISTS exceptions;
+
+    -- tb_f_ids is a JSON list of frames.f_id, outermost level first.
+    -- f_locals is only set at the raise site when the tracer captures exception locals.
+    CREATE TABLE exceptions (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        f_id INTEGER,
+        exc_type TEXT NOT NULL,
+        exc_message TEXT NOT NULL,
+        tb_f_ids TEXT NOT NULL,
+        f_locals TEXT
+    );
+    CREATE INDEX exceptions_run_id_idx ON exceptions (run_id, exc_type);
+
+    DROP TABLE IF EXISTS pickles;
+
+    -- Values recorded with pickle_values=True, deduplicated by digest (see PickleStore).
+    CREATE TABLE pickles (
+        id INTEGER PRIMARY KEY,
+        digest BLOB NOT NULL UNIQUE,
+        data BLOB NOT NULL
+    );
+
+    DROP TABLE IF EXISTS pickle_buffers;
+
+    -- Out-of-band buffers of a pickle, in the order pickle.loads expects them.
+    CREATE TABLE pickle_buffers (
+        pickle_id INTEGER NOT NULL,
+        idx INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (pickle_id, idx)
+    );
+
+    DROP TABLE IF EXISTS blobs;
+
+    -- Raw bytes of large bytes-like locals (and of buffers with store_buffers=True), keyed by the digest in
+    -- their {"$blob"} or {"$buffer"} summary.
+    CREATE TABLE blobs (
+        id INTEGER PRIMARY KEY,
+        digest TEXT NOT NULL UNIQUE,
+        data BLOB NOT NULL
+    );
+
+    DROP TABLE IF EXISTS dictionaries;
+
+    -- Compression dictionaries trained on the first locals of a run (see Compressor).
+    CREATE TABLE dictionaries (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL
+    );
+
+    DROP TABLE IF EXISTS codes;
+
+    -- Functions the changes table refers to.
+    CREATE TABLE codes (
+        id INTEGER PRIMARY KEY,
+        f_filename TEXT NOT NULL,
+        f_funcname TEXT NOT NULL,
+        UNIQUE (f_filename, f_funcname)
+    );
+
+    DROP TABLE IF EXISTS changes;
+
+    -- Steps at which a variable of a function got a new value (see History), only with history=True.
+    -- value_id is a digest of the recorded value, NULL when the variable was deleted.
+    CREATE TABLE changes (
+        run_id INTEGER NOT NULL,
+        code_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        f_id INTEGER NOT NULL,
+        value_id INTEGER
+    );
+    CREATE INDEX changes_run_id_code_id_name_idx ON changes (run_id, code_id, name, f_id);
+
+    DROP TABLE IF EXISTS loops;
+
+    -- Iterations of hot loops that weren't recorded (see Loops): steps first_f_id to last_f_id of the loop
+    -- starting at f_lineno, in the frame whose steps share f_call_id, are only in frames when sampled.
+    CREATE TABLE loops (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        f_call_id INTEGER,
+        f_filename TEXT NOT NULL,
+        f_funcname TEXT NOT NULL,
+        f_lineno INTEGER NOT NULL,
+        first_f_id INTEGER NOT NULL,
+        last_f_id INTEGER NOT NULL,
+        iterations INTEGER NOT NULL,
+        elided INTEGER NOT NULL
+    );
+    CREATE INDEX loops_run_id_first_f_id_idx ON loops (run_id, first_f_id);
+
+    DROP TABLE IF EXISTS logs;
+
+    CREATE TABLE logs (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        f_filename TEXT NOT NULL,
+        f_funcname TEXT NOT NULL,
+        f_lineno INTEGER NOT NULL,
+        message TEXT NOT NULL
+    );
+"""
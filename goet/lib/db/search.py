@@ -0,0 +1,113 @@
+import json
+import sqlite3
+from typing import Any, Iterator, List, Optional, Tuple
+
+from goet.lib.converter.converter import ESCAPED, MARKERS
+from goet.lib.db.navigator import Step
+
+# Created the first time a run is indexed (see SearchIndex), not with the rest of the schema: it needs FTS5.
+SEARCH_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+        text, run_id UNINDEXED, f_id UNINDEXED, name UNINDEXED
+    )
+"""
+
+
+def leaves(value: Any) -> Iterator[str]:
+    """The strings in a recorded value, depth first."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            yield from leaves(item)
+    elif isinstance(value, dict):
+        if len(value) == 1 and next(iter(value)) in MARKERS:
+            # Strings in markers aren't the value's, except in an escaped dict.
+            if ESCAPED not in value:
+                return
+            value = value[ESCAPED]
+        for item in value.values():
+            yield from leaves(item)
+
+
+class SearchIndex:
+    """SearchIndex indexes the strings in each local's values, for full-text `search`.
+
+    A value is indexed at its change points only (see History), the steps it's still the local's value at aren't
+    indexed again. Fed by History, with SqlTracer(search=True) or build_history(search=True).
+    """
+
+    INSERT = "INSERT INTO search (text, run_id, f_id, name) VALUES (?, ?, ?, ?)"
+
+    def __init__(self, connection: sqlite3.Connection, run_id: int):
+        self.run_id = run_id
+        self.use(connection)
+
+    def use(self, connection: sqlite3.Connection):
+        connection.execute(SEARCH_SCHEMA)
+        self.connection = connection
+
+    def add(self, f_id: int, values: List[Tuple[str, str]]):
+        """Index the new values of step `f_id`: (name, recorded JSON) pairs."""
+        rows = []
+        for name, dumped in values:
+            text = "\n".join(leaves(json.loads(dumped)))
+            if text:
+                rows.append((text, self.run_id, f_id, name))
+        if rows:
+            self.connection.executemany(self.INSERT, rows)
+
+
+def phrase(text: str) -> str:
+    """`text` as an FTS5 query matching its words in order."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search(
+    connection: sqlite3.Connection,
+    run_id: int,
+    text: str,
+    query: bool = False,
+) -> Iterator[Tuple[Step, str]]:
+    """(step, local name) of each change point at which a local took a value containing `text`, in order.
+
+    >>> for step, name in search(connection, run_id, "ORD-2024-0017"):
+    ...     print(step.f_funcname, step.f_lineno, name)
+
+    `text` matches whole words, in order: "ORD-2024-0017" or "connection reset", not "2024-001". With `query`,
+    `text` is an FTS5 query instead, e.g. "timeout OR reset", or "ORD*" for words starting with ORD.
+
+    Needs the run's search index (recorded with search=True, or see `build_history`). Steps are read from the
+    cursor as they're iterated.
+    """
+    match = text if query else phrase(text)
+    paths = connection.execute(
+        "SELECT db_path FROM segments WHERE run_id = ? ORDER BY idx", (run_id,)
+    ).fetchall()
+    return hits(connection, run_id, match, [path for (path,) in paths])
+
+
+def hits(
+    connection: sqlite3.Connection, run_id: int, match: str, paths: List[Optional[str]]
+) -> Iterator[Tuple[Step, str]]:
+    for path in paths or [None]:
+        part = connection if path is None else sqlite3.connect(path)
+        try:
+            exists = part.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'search'"
+            ).fetchone()
+            if exists is None:
+                continue
+            for name, *step in part.execute(
+                """
+                SELECT search.name, f_id, f_back_id, f_call_id, f_filename, f_funcname, f_lineno
+                FROM search JOIN frames USING (run_id, f_id)
+                WHERE search MATCH ? AND search.run_id = ?
+                ORDER BY search.rowid
+                """,
+                (match, run_id),
+            ):
+                yield Step(*step), name
+        finally:
+            if part is not connection:
+                part.close()
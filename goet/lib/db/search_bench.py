@@ -0,0 +1,49 @@
+"""Time full-text search for a value in a run of about a million steps.
+
+    python -m goet.lib.db.search_bench [orders]
+
+Records `orders` orders (4 steps each) with search=True, then looks for one order id, and for an error string
+that shows up in a few hundred of them.
+"""
+import os
+import sys
+import tempfile
+import time
+
+from goet.lib.db.search import search
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+def charge(order_id, amount):
+    status = "pending"
+    if amount % 997 == 0:
+        status = "failed: card declined by issuer"
+    return status
+
+
+def main(orders: int):
+    path = os.path.join(tempfile.mkdtemp(), "search_bench.sqlite3")
+    tracer = SqlTracer(path, search=True)
+    start = time.perf_counter()
+    with tracer:
+        for i in range(orders):
+            charge(f"ORD-{i:08d}", i)
+    recorded = time.perf_counter() - start
+    connection = connect(path)
+    (steps,) = connection.execute(
+        "SELECT COUNT(*) FROM frames WHERE run_id = ?", (tracer.run_id,)
+    ).fetchone()
+    (rows,) = connection.execute("SELECT COUNT(*) FROM search").fetchone()
+    print(f"{steps} steps, {rows} indexed values, recorded in {recorded:.1f}s")
+
+    for text in (f"ORD-{orders // 2:08d}", "card declined", "no such value"):
+        for attempt in ("cold", "warm"):
+            start = time.perf_counter()
+            hits = list(search(connection, tracer.run_id, text))
+            elapsed = time.perf_counter() - start
+            print(f"{text!r} ({attempt}): {elapsed * 1000:.2f}ms, {len(hits)} hits")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 250_000)
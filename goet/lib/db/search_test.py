@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import tempfile
+
+from goet.lib.db.history import build_history
+from goet.lib.db.runs import delete_run
+from goet.lib.db.search import leaves, search
+from goet.lib.db.sqlite import connect
+from goet.tracer.sql import SqlTracer
+
+
+class Order:
+    def __init__(self, order_id, items):
+        self.order_id = order_id
+        self.items = items
+
+
+def charge(order):
+    status = "pending"
+    try:
+        if order.order_id == "ORD-2024-0017":
+            raise ConnectionError("connection reset by peer")
+        status = "charged"
+    except ConnectionError as e:
+        status = f"failed: {e}"
+    return status
+
+
+def main():
+    shared = ["gift wrap"]
+    for i in range(10, 20):
+        charge(Order(f"ORD-2024-00{i}", [{"sku": f"SKU{i}", "note": shared}]))
+
+
+def at(step):
+    return step.f_funcname, step.f_lineno - charge.__code__.co_firstlineno
+
+
+assert list(leaves({"a": ["x", {"b": "y"}, 1, None], "c": {"$ref": 0}, "d": {"$blob": {"sha": "z"}}})) == ["x", "y"]
+assert list(leaves({"$dict": {"$ref": "w"}})) == ["w"]
+
+path = os.path.join(tempfile.mkdtemp(), "search.sqlite3")
+runs = {}
+for name, kwargs in {
+    "indexed": {"search": True},
+    "partitioned": {"search": True, "partition": True},
+    "compressed": {"compress": "zlib"},
+    "plain": {},
+}.items():
+    tracer = SqlTracer(path, **kwargs)
+    with tracer:
+        main()
+    runs[name] = tracer.run_id
+connection = connect(path)
+
+# Not indexed: no hits.
+assert list(search(connection, runs["plain"], "ORD-2024-0017")) == []
+assert build_history(connection, runs["compressed"], changes=False, search=True) > 0
+assert not connection.execute("SELECT 1 FROM changes WHERE run_id = ?", (runs["compressed"],)).fetchall()
+
+for name in ("indexed", "partitioned", "compressed"):
+    run_id = runs[name]
+    hits = list(search(connection, run_id, "ORD-2024-0017"))
+    # Where the order id was passed around, once per change (not on every line of charge).
+    assert [(step.f_funcname, name) for step, name in hits] == [
+        ("__init__", "order_id"),
+        ("__init__", "self"),
+        ("charge", "order"),
+    ], hits
+    assert at(hits[-1][0]) == ("charge", 1)
+
+    # Words, in order.
+    hits = list(search(connection, run_id, "connection reset"))
+    assert [name for step, name in hits if step.f_funcname == "charge"] == ["status"], hits
+    assert list(search(connection, run_id, "reset connection")) == []
+    assert len(list(search(connection, run_id, "gift wrap"))) > 0
+    assert list(search(connection, run_id, 'say "hi"')) == []
+
+    # FTS5 queries.
+    hits = list(search(connection, run_id, "ORD* AND 0019", query=True))
+    assert {name for _, name in hits} >= {"order", "order_id"}, hits
+    try:
+        list(search(connection, run_id, "AND OR", query=True))
+    except sqlite3.OperationalError:
+        pass
+    else:
+        raise AssertionError("invalid FTS5 query")
+
+# Deleting a run deletes its search rows.
+delete_run(connection, runs["indexed"])
+assert connection.execute("SELECT COUNT(*) FROM search WHERE run_id = ?", (runs["indexed"],)).fetchone() == (0,)
+assert len(list(search(connection, runs["compressed"], "ORD-2024-0017"))) == 3
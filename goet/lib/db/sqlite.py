@@ -1,33 +1,74 @@
+import os
+import re
 import sqlite3
-from pathlib import Path
+from typing import Optional, Union
 
-from goet.lib.path.get_root_dir import get_root_dir
+from goet.lib.db.schema import RUNS_SCHEMA, SCHEMA
 
-ROOT_DIR = get_root_dir(__file__)
-DB_NAME = "test.rdb.sqlite3"
-connection = sqlite3.connect(Path(ROOT_DIR / DB_NAME))
+# Where the default database is: a path, or a "file:" URI (e.g. "file:/dev/shm/goet.sqlite3").
+ENV_VAR = "GOET_DB"
+# The default database when GOET_DB isn't set, in the current directory.
+DB_NAME = "goet.sqlite3"
 
+# A path or a "file:" URI.
+Database = Union[str, "os.PathLike[str]"]
 
-def seed_db():
-    cursor = connection.cursor()
+# The same tables, created only when missing: opening a database never drops recorded runs.
+CREATE_SCHEMA = re.sub(
+    r"CREATE (TABLE|INDEX) ",
+    r"CREATE \1 IF NOT EXISTS ",
+    re.sub(r"DROP TABLE IF EXISTS \w+;", "", RUNS_SCHEMA + SCHEMA),
+)
 
-    # snapshot consists of all the frames + all the variables
-    sql = """
-    DROP TABLE IF EXISTS frames;
+# Opened the first time `connection` is imported, not when this module is.
+_connection: Optional[sqlite3.Connection] = None
 
-    CREATE TABLE frames (
-        id INTEGER PRIMARY KEY,
-        run_id TEXT NOT NULL,
-        f_id INTEGER NOT NULL,
-        f_back_id INTEGER,
-        f_filename TEXT NOT NULL,
-        f_funcname TEXT NOT NULL,
-        f_lineno INTEGER NOT NULL,
-        f_locals TEXT NOT NULL
-    );
+
+def default_database() -> str:
+    return os.environ.get(ENV_VAR) or DB_NAME
+
+
+def connect(
+    database: Optional[Database] = None, check_same_thread: bool = True
+) -> sqlite3.Connection:
+    """Open `database` (by default $GOET_DB, or goet.sqlite3), creating its tables if they don't exist yet.
+
+    File databases are put in WAL mode, so runs can be read (and retention enforced) while another connection
+    writes, and writers wait for each other instead of failing with "database is locked".
     """
+    database = os.fspath(database) if database is not None else default_database()
+    connection = sqlite3.connect(
+        database,
+        timeout=30,
+        uri=database.startswith("file:"),
+        check_same_thread=check_same_thread,
+    )
+    if connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'runs'"
+    ).fetchone():
+        # Already set up, opening it doesn't need to wait for a writer.
+        return connection
+    if database != ":memory:" and "mode=memory" not in database:
+        connection.execute("PRAGMA journal_mode=WAL")
+    # One transaction, so processes opening a new database at the same time don't interleave.
+    connection.executescript(f"BEGIN IMMEDIATE; {CREATE_SCHEMA} COMMIT;")
+    return connection
+
+
+def seed_db(connection: Optional[sqlite3.Connection] = None):
+    """(Re)create the tables, dropping any recorded runs. Seeds the default database without a `connection`."""
+    (connection or get_connection()).executescript(RUNS_SCHEMA + SCHEMA)
+
 
-    cursor.executescript(sql)
+def get_connection() -> sqlite3.Connection:
+    """The default database (see `connect`), as recorded so far."""
+    global _connection
+    if _connection is None:
+        _connection = connect()
+    return _connection
 
 
-seed_db()
+def __getattr__(name: str):
+    if name == "connection":
+        return get_connection()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
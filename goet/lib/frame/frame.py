@@ -1,4 +1,6 @@
-from typing import Any, Dict, Tuple
+from inspect import CO_NEWLOCALS, CO_VARARGS, CO_VARKEYWORDS
+from types import CodeType
+from typing import Any, ClassVar, Dict, List, Optional, Tuple
 
 import attr
 
@@ -44,9 +46,9 @@ class Code:
     """
 
     co_name: str
-    # co_argcount: int
+    co_argcount: int
     # co_posonlyargcount: int
-    # co_kwonlyargcount: int
+    co_kwonlyargcount: int
     # co_nlocals: int
     co_varnames: Tuple[str]
     co_cellvars: Tuple[str]
@@ -58,15 +60,34 @@ class Code:
     co_firstlineno: int
     # co_lnotab: bytes
     co_stacksize: int
-    # co_flags: int
+    co_flags: int
+
+    @property
+    def argnames(self) -> Tuple[str, ...]:
+        """Names of the arguments, including *args and **kwargs."""
+        count = self.co_argcount + self.co_kwonlyargcount
+        count += bool(self.co_flags & CO_VARARGS) + bool(self.co_flags & CO_VARKEYWORDS)
+        return self.co_varnames[:count]
+
+    @property
+    def localnames(self) -> Tuple[str, ...]:
+        """Names of every local, cell and free variable (cells for arguments are listed once)."""
+        return tuple(
+            dict.fromkeys(self.co_varnames + self.co_cellvars + self.co_freevars)
+        )
+
+    @property
+    def is_function(self) -> bool:
+        """Module and class bodies look up locals in a dict rather than by co_varnames."""
+        return bool(self.co_flags & CO_NEWLOCALS)
 
     @classmethod
     def from_syscode(cls, syscode):
         return cls(
             co_name=syscode.co_name,
-            # co_argcount=syscode.co_argcount,
+            co_argcount=syscode.co_argcount,
             # co_posonlyargcount=syscode.co_posonlyargcount,
-            # co_kwonlyargcount=syscode.co_kwonlyargcount,
+            co_kwonlyargcount=syscode.co_kwonlyargcount,
             # co_nlocals=syscode.co_nlocals,
             co_varnames=syscode.co_varnames,
             co_cellvars=syscode.co_cellvars,
@@ -78,9 +99,20 @@ class Code:
             co_firstlineno=syscode.co_firstlineno,
             # co_lnotab=syscode.co_lnotab,
             co_stacksize=syscode.co_stacksize,
-            # co_flags=syscode.co_flags,
+            co_flags=syscode.co_flags,
         )
 
+    @classmethod
+    def for_syscode(cls, syscode):
+        """Code objects are immutable, so only one Code is built per code object."""
+        code = CODES.get(syscode)
+        if code is None:
+            code = CODES[syscode] = cls.from_syscode(syscode)
+        return code
+
+
+CODES: Dict[CodeType, Code] = {}
+
 
 @attr.frozen
 class Frame:
@@ -106,7 +138,8 @@ class Frame:
     """
 
     f_id: int
-    f_back_id: int
+    f_back_id: Optional[int]
+    f_call_id: Optional[int]
     f_filename: str
     f_funcname: str
 
@@ -123,10 +156,11 @@ class Frame:
     f_lineno: int
 
     @classmethod
-    def from_sysframe(cls, sysframe, f_id, f_back_id):
+    def from_sysframe(cls, sysframe, f_id, f_back_id, f_call_id=None):
         return cls(
             f_id=f_id,
             f_back_id=f_back_id,
+            f_call_id=f_call_id,
             f_filename=sysframe.f_code.co_filename,
             f_funcname=sysframe.f_code.co_name,
             # f_back=None,
@@ -143,5 +177,145 @@ class Frame:
         )
 
 
+class FrameRecord:
+    """FrameRecord is the hot-path form of a Frame, built for every traced line.
+
+    Building a frozen attrs Frame runs its generated __init__ for every line, so tracers record these instead:
+    plain slots, no validation, and recycled through a small free list once written (see `release`).
+    `to_frame` builds the public Frame view when one is actually needed.
+    """
+
+    __slots__ = ("f_id", "f_back_id", "f_call_id", "f_filename", "f_funcname", "f_lineno", "f_locals")
+
+    # Released records, reused by `from_sysframe`.
+    free: ClassVar[List["FrameRecord"]] = []
+    FREE_LIST_SIZE: ClassVar[int] = 64
+
+    f_id: int
+    f_back_id: Optional[int]
+    f_call_id: Optional[int]
+    f_filename: str
+    f_funcname: str
+    f_lineno: int
+    f_locals: Optional[Dict[str, Any]]
+
+    @classmethod
+    def from_sysframe(cls, sysframe, f_id, f_back_id, f_call_id=None, f_locals=None):
+        """`f_locals` defaults to all of `sysframe.f_locals` (see LocalsCapture to record fewer)."""
+        # Shared by every tracer: another thread may take the last one between a check and the pop.
+        try:
+            record = cls.free.pop()
+        except IndexError:
+            record = object.__new__(cls)
+        code = sysframe.f_code
+        record.f_id = f_id
+        record.f_back_id = f_back_id
+        record.f_call_id = f_call_id
+        record.f_filename = code.co_filename
+        record.f_funcname = code.co_name
+        record.f_lineno = sysframe.f_lineno
+        record.f_locals = sysframe.f_locals if f_locals is None else f_locals
+        return record
+
+    def release(self):
+        """Hand the record back for reuse. It must not be used after this."""
+        self.f_locals = None
+        free = self.free
+        if len(free) < self.FREE_LIST_SIZE:
+            free.append(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def to_frame(self) -> Frame:
+        return Frame(**self.to_dict())
+
+
+@attr.frozen
+class Traceback:
+    """Traceback objects represent a stack trace of an exception.
+
+    When the search for an exception handler unwinds the execution stack, at each unwound level a traceback object is
+    inserted in front of the current traceback. The tracer sees this as one "exception" event per unwound frame.
+
+    Special read-only attributes:
+        tb_frame points to the execution frame of the current level
+        tb_lineno gives the line number where the exception occurred
+        # tb_lasti indicates the precise instruction
+        tb_next is the next level in the stack trace (towards the frame where the exception occurred), or None if there is no next level
+
+    Rather than re-serializing every tb_frame, a recorded traceback keeps only the f_id of each level (`tb_f_ids`),
+    pointing at the last recorded line of that frame. Levels that were never recorded (e.g. untraced code) are None.
+    `f_locals` is only captured at the raise site, and only when asked for.
+    """
+
+    f_id: Optional[int]
+    exc_type: str
+    exc_message: str
+    tb_f_ids: Tuple[Optional[int], ...]
+    f_locals: Optional[Dict[str, Any]]
+
+    @property
+    def is_raise_site(self) -> bool:
+        return len(self.tb_f_ids) == 1
+
+    @classmethod
+    def from_exc_info(cls, sysframe, exc_info, f_id, prev=None, capture_locals=False):
+        """Build a traceback for the "exception" event fired in `sysframe`.
+
+        `prev` is the traceback recorded for the previous exception event. If it belongs to the same exception one
+        level deeper, its `tb_f_ids` are reused instead of walking the (already unwound) frames again.
+        """
+        exc_type, exc_value, tb = exc_info
+
+        depth = 0
+        while tb is not None:
+            depth += 1
+            tb = tb.tb_next
+
+        if prev is not None and len(prev.tb_f_ids) == depth - 1:
+            tb_f_ids = (f_id,) + prev.tb_f_ids
+        else:
+            tb_f_ids = (f_id,) + (None,) * (depth - 1)
+
+        return cls(
+            f_id=f_id,
+            exc_type=exc_type.__qualname__,
+            exc_message=str(exc_value),
+            tb_f_ids=tb_f_ids,
+            f_locals=sysframe.f_locals if capture_locals and depth == 1 else None,
+        )
+
+
+@attr.frozen
+class Log:
+    """A message recorded by a logpoint, in place of a full Frame snapshot."""
+
+    f_filename: str
+    f_funcname: str
+    f_lineno: int
+    message: str
+
+
+@attr.frozen
+class Loop:
+    """Iterations of a hot loop that weren't recorded, in place of their steps (see Loops).
+
+    The loop starts at line `f_lineno` of the frame whose steps share `f_call_id`. Its first and last iterations
+    (and samples in between) are recorded as usual, the `elided` others ran steps `first_f_id` to `last_f_id`
+    (inclusive) that aren't in the frames table. `iterations` is how many times the loop jumped back to its
+    first line: for a `for` loop, how many items it went through.
+    """
+
+    f_call_id: Optional[int]
+    f_filename: str
+    f_funcname: str
+    f_lineno: int
+    first_f_id: int
+    last_f_id: int
+    iterations: int
+    elided: int
+
+
 # Must be called after Frame is defined to resolve the `f_back: Frame` field.
 attr.resolve_types(Frame, globals(), locals())
@@ -0,0 +1,49 @@
+"""Compare building an attrs Frame vs a FrameRecord for every traced line.
+
+    python -m goet.lib.frame.frame_bench
+"""
+import sys
+import timeit
+import tracemalloc
+
+from goet.lib.frame.frame import Frame, FrameRecord
+
+N = 100_000
+
+
+def build_frames(sysframe):
+    for f_id in range(N):
+        Frame.from_sysframe(sysframe, f_id, None)
+
+
+def build_records(sysframe):
+    for f_id in range(N):
+        FrameRecord.from_sysframe(sysframe, f_id, None).release()
+
+
+def retained(build, sysframe) -> int:
+    """Bytes held by N records kept alive, like the black box does."""
+    tracemalloc.start()
+    records = [build(sysframe, f_id, None) for f_id in range(N)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def main():
+    sysframe = sys._getframe()
+    for name, fn in (("Frame", build_frames), ("FrameRecord", build_records)):
+        seconds = min(timeit.repeat(lambda: fn(sysframe), number=1, repeat=5))
+        print(f"{name:<12} {seconds / N * 1e9:8.1f} ns/line")
+
+    FrameRecord.free.clear()
+    for name, build in (
+        ("Frame", Frame.from_sysframe),
+        ("FrameRecord", FrameRecord.from_sysframe),
+    ):
+        print(f"{name:<12} {retained(build, sysframe) / N:8.1f} bytes/line retained")
+
+
+if __name__ == "__main__":
+    main()
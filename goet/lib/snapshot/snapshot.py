@@ -0,0 +1,96 @@
+import json
+import pickle
+from typing import Any, Dict, List, Mapping, Tuple
+
+from goet.lib.converter.converter import converter, unstructure_snapshot
+
+IMMUTABLE_TYPES = (str, int, float, bool, type(None), bytes, complex)
+SHALLOW_COPY_TYPES = (list, dict, set, bytearray)
+
+
+class Pickled:
+    """A value snapshotted as pickle bytes, restored in the process that serializes it."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __reduce__(self):
+        return (Pickled, (self.data,))
+
+
+def is_immutable(value: Any) -> bool:
+    typ = type(value)
+    if typ in IMMUTABLE_TYPES:
+        return True
+    if typ in (tuple, frozenset):
+        return all(is_immutable(item) for item in value)
+    return False
+
+
+def snapshot_value(value: Any, memo: Dict[int, Any]) -> Any:
+    """Cheaply freeze `value` as it is now, so it can be serialized later (and elsewhere).
+
+    * immutable values (primitives, and tuples/frozensets of them) are kept by reference
+    * list, dict, set and bytearray are shallow copied
+    * anything else is pickled
+    * anything that can't be pickled is converted right away
+    """
+    if is_immutable(value):
+        return value
+
+    # Locals sharing an object share its snapshot, so aliasing survives serialization.
+    seen = memo.get(id(value))
+    if seen is not None:
+        return seen
+
+    typ = type(value)
+    if typ in SHALLOW_COPY_TYPES:
+        snapped = typ(value)
+    else:
+        try:
+            snapped = Pickled(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            snapped = converter.unstructure(value)
+    memo[id(value)] = snapped
+    return snapped
+
+
+def snapshot(f_locals: Mapping[str, Any]) -> Dict[str, Any]:
+    """Snapshot every local of a line (see `snapshot_value` for what is guaranteed to be faithful).
+
+    Faithful: immutable values, pickled objects, and shallow-copied containers whose items are immutable.
+    Not faithful: mutable items *inside* a shallow-copied container (e.g. the dicts in a list of dicts) are only
+    captured when the snapshot is pickled on its way to a worker, so later mutations may leak in.
+    """
+    memo: Dict[int, Any] = {}
+    return {name: snapshot_value(value, memo) for name, value in f_locals.items()}
+
+
+def restore(value: Any) -> Any:
+    if type(value) is not Pickled:
+        return value
+    try:
+        return pickle.loads(value.data)
+    except Exception as e:
+        # e.g. the class is defined somewhere this process can't import.
+        return f"<unpicklable {type(e).__name__}: {e}>"
+
+
+def serialize(f_locals: Mapping[str, Any]) -> str:
+    # A Pickled shared by several locals is restored once, to the same object.
+    restored: Dict[int, Any] = {}
+    for value in f_locals.values():
+        if id(value) not in restored:
+            restored[id(value)] = restore(value)
+    return json.dumps(
+        unstructure_snapshot(
+            {name: restored[id(value)] for name, value in f_locals.items()}
+        )
+    )
+
+
+def serialize_batch(batch: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    """Serialize the snapshot at the end of each row. Runs in a worker process."""
+    return [row[:-1] + (serialize(row[-1]),) for row in batch]
@@ -0,0 +1,41 @@
+import json
+
+from goet.lib.snapshot.snapshot import Pickled, serialize, snapshot
+
+
+class A:
+    def __init__(self, x):
+        self.x = x
+
+
+a = A(x=[1])
+xs = [1, 2]
+d = {"k": [1]}
+f_locals = {"i": 1, "s": "s", "t": (1, "2"), "xs": xs, "d": d, "a": a, "f": lambda: 1}
+f_locals["alias"] = a
+
+snap = snapshot(f_locals)
+
+# Immutable values are kept by reference, containers are shallow copies, objects are pickled.
+assert snap["s"] is f_locals["s"]
+assert snap["t"] is f_locals["t"]
+assert snap["xs"] == xs and snap["xs"] is not xs
+assert type(snap["a"]) is Pickled
+assert snap["f"] == "<function <lambda>>"
+
+# Mutations after the snapshot don't leak in, except inside shallow copies.
+xs.append(3)
+a.x.append(2)
+d["k"].append(2)
+
+print(serialize(snap))
+assert json.loads(serialize(snap)) == {
+    "i": 1,
+    "s": "s",
+    "t": [1, "2"],
+    "xs": [1, 2],
+    "d": {"k": [1, 2]},
+    "a": {"x": [1]},
+    "f": "<function <lambda>>",
+    "alias": {"$ref": 4},
+}
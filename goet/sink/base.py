@@ -0,0 +1,119 @@
+import json
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from goet.lib.converter.converter import unstructure_snapshot
+from goet.lib.converter.summarizers import Blobs
+from goet.lib.frame.frame import FrameRecord, Log, Loop, Traceback
+from goet.tracer.black_box import Record
+
+# Columns of each kind of event, in the order of an event's values (and of the sqlite tables).
+COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "frames": (
+        "run_id",
+        "f_id",
+        "f_back_id",
+        "f_call_id",
+        "f_filename",
+        "f_funcname",
+        "f_lineno",
+        "f_locals",
+    ),
+    "exceptions": ("run_id", "f_id", "exc_type", "exc_message", "tb_f_ids", "f_locals"),
+    "logs": ("run_id", "f_filename", "f_funcname", "f_lineno", "message"),
+    "loops": (
+        "run_id",
+        "f_call_id",
+        "f_filename",
+        "f_funcname",
+        "f_lineno",
+        "first_f_id",
+        "last_f_id",
+        "iterations",
+        "elided",
+    ),
+}
+# Columns holding an already encoded JSON document.
+JSON_COLUMNS = frozenset(("f_locals", "tb_f_ids"))
+
+# (kind, values): a record encoded once, shared by every sink.
+# Events carry the run's uuid as their run_id, SqliteSink swaps it for the runs.id it allocates.
+Event = Tuple[str, Tuple[Any, ...]]
+
+
+class Sink(Protocol):
+    """A Sink receives encoded events in batches, in the order they were recorded."""
+
+    def write_events(self, batch: List[Event]):
+        raise NotImplementedError
+
+    def flush(self):
+        """Make everything written so far durable (or visible)."""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+def encode_locals(
+    f_locals: Optional[Dict[str, Any]], blobs: Optional[Blobs] = None
+) -> Optional[str]:
+    if f_locals is None or isinstance(f_locals, str):
+        # Or already encoded (see Loops).
+        return f_locals
+    return json.dumps(unstructure_snapshot(f_locals, blobs))
+
+
+def encode(record: Record, run_uuid: str, blobs: Optional[Blobs] = None) -> Event:
+    if type(record) is FrameRecord:
+        return (
+            "frames",
+            (
+                run_uuid,
+                record.f_id,
+                record.f_back_id,
+                record.f_call_id,
+                record.f_filename,
+                record.f_funcname,
+                record.f_lineno,
+                encode_locals(record.f_locals, blobs),
+            ),
+        )
+    elif isinstance(record, Traceback):
+        return (
+            "exceptions",
+            (
+                run_uuid,
+                record.f_id,
+                record.exc_type,
+                record.exc_message,
+                json.dumps(record.tb_f_ids),
+                encode_locals(record.f_locals, blobs),
+            ),
+        )
+    elif isinstance(record, Log):
+        return (
+            "logs",
+            (
+                run_uuid,
+                record.f_filename,
+                record.f_funcname,
+                record.f_lineno,
+                record.message,
+            ),
+        )
+    elif isinstance(record, Loop):
+        return (
+            "loops",
+            (
+                run_uuid,
+                record.f_call_id,
+                record.f_filename,
+                record.f_funcname,
+                record.f_lineno,
+                record.first_f_id,
+                record.last_f_id,
+                record.iterations,
+                record.elided,
+            ),
+        )
+    raise TypeError(f"Can't encode {type(record).__name__}")
@@ -0,0 +1,115 @@
+import gzip
+import io
+import json
+import os
+import time
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from goet.sink.base import COLUMNS, JSON_COLUMNS, Event
+
+Target = Union[str, "os.PathLike[str]", int]
+
+
+def to_line(kind: str, values) -> str:
+    """One event as a JSON object. Already encoded JSON columns are spliced in as-is, not encoded twice."""
+    fields = {"kind": kind}
+    documents = []
+    for column, value in zip(COLUMNS[kind], values):
+        if column in JSON_COLUMNS and value is not None:
+            documents.append(f',"{column}":{value}')
+        else:
+            fields[column] = value
+    line = json.dumps(fields, separators=(",", ":"))
+    if documents:
+        line = line[:-1] + "".join(documents) + "}"
+    return line + "\n"
+
+
+def segment_path(path: str, segment: int) -> str:
+    """trace.jsonl.gz, trace.1.jsonl.gz, trace.2.jsonl.gz, ..."""
+    if not segment:
+        return path
+    directory, name = os.path.split(path)
+    stem, dot, suffixes = name.partition(".")
+    return os.path.join(directory, f"{stem}.{segment}{dot}{suffixes}")
+
+
+class JsonlSink:
+    """JsonlSink writes one compact JSON object per event, with a "kind" field (frames, exceptions, logs or loops).
+
+    * `target` is a path, or a file descriptor (e.g. 2 for stderr) which is left open on close
+    * writes go through a `buffering` bytes buffer, so the stream isn't written to for every event
+    * with `compress=True` the stream is gzipped
+    * with `max_bytes`, a path target is rotated once a file holds that many bytes of JSON (before compression):
+      trace.jsonl, then trace.1.jsonl, trace.2.jsonl, ...
+
+    `events` and `bytes` count what was written so far, see `stats` for rates.
+    """
+
+    def __init__(
+        self,
+        target: Target,
+        buffering: int = 1 << 20,
+        compress: bool = False,
+        max_bytes: Optional[int] = None,
+    ):
+        if max_bytes is not None and isinstance(target, int):
+            raise ValueError("Only a path can be rotated, not a file descriptor")
+        self.target = target if isinstance(target, int) else os.fspath(target)
+        self.buffering = buffering
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.segment = 0
+        self.segment_bytes = 0
+        self.events = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.open()
+
+    def open(self):
+        if isinstance(self.target, int):
+            raw = open(self.target, "wb", buffering=0, closefd=False)
+        else:
+            raw = open(segment_path(self.target, self.segment), "wb", buffering=0)
+        # Closed last to first.
+        self.files: List[BinaryIO] = [raw]
+        if self.compress:
+            self.files.append(gzip.GzipFile(fileobj=raw, mode="wb"))
+        self.file = io.BufferedWriter(self.files[-1], buffer_size=self.buffering)
+        self.files.append(self.file)
+
+    def close_files(self):
+        for file in reversed(self.files):
+            file.close()
+
+    def write_events(self, batch: List[Event]):
+        data = "".join([to_line(kind, values) for kind, values in batch]).encode()
+        self.file.write(data)
+        self.events += len(batch)
+        self.bytes += len(data)
+        self.segment_bytes += len(data)
+        if self.max_bytes is not None and self.segment_bytes >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.close_files()
+        self.segment += 1
+        self.segment_bytes = 0
+        self.open()
+
+    def stats(self) -> Dict[str, float]:
+        seconds = time.perf_counter() - self.started
+        return {
+            "events": self.events,
+            "bytes": self.bytes,
+            "seconds": seconds,
+            "events_per_sec": self.events / seconds,
+            "bytes_per_sec": self.bytes / seconds,
+        }
+
+    def flush(self):
+        for file in reversed(self.files):
+            file.flush()
+
+    def close(self):
+        self.close_files()
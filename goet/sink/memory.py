@@ -0,0 +1,19 @@
+from typing import List
+
+from goet.sink.base import Event
+
+
+class MemorySink:
+    """MemorySink keeps every event in a list, e.g. for tests or to post-process a short run."""
+
+    def __init__(self):
+        self.events: List[Event] = []
+
+    def write_events(self, batch: List[Event]):
+        self.events.extend(batch)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,389 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from goet.lib.converter.converter import unstructure_snapshot
+from goet.lib.db.blobs import BlobStore
+from goet.lib.db.compress import Compressor
+from goet.lib.db.history import History, dumps_each
+from goet.lib.db.pickles import PickleStore
+from goet.lib.db.retention import Eviction, Retention, RetentionWorker
+from goet.lib.db.runs import (
+    add_segment,
+    close_segment,
+    create_run_db,
+    database_path,
+    drop_segment,
+    end_run,
+    run_db_path,
+    segment_path,
+    start_run,
+)
+from goet.lib.db.search import SearchIndex
+from goet.lib.db.sqlite import Database, connect, default_database
+from goet.lib.frame.frame import FrameRecord
+from goet.sink.base import COLUMNS, Event
+from goet.tracer.black_box import Record
+
+INSERTS: Dict[str, str] = {
+    kind: f"INSERT INTO {kind} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for kind, columns in COLUMNS.items()
+}
+
+
+def event_key(event: Event) -> Tuple[str, str]:
+    """(kind, run uuid)"""
+    return event[0], event[1][0]
+
+
+class SqliteRun:
+    """Where the events of one run go: the main database, or the run's own segment files when partitioned.
+
+    Pickle ids, blobs, compression dictionaries and the history index live next to the events, so they're
+    opened again for each segment.
+
+    Events are held in `pending` until the sink writes them (see SqliteSink), indexed, compressed and inserted
+    in one transaction, so the database is only locked while that runs.
+    """
+
+    def __init__(self, sink: "SqliteSink", connection: sqlite3.Connection, run_id: int, db_path: Optional[str]):
+        self.sink = sink
+        # The main database, as opened by the thread that started the run.
+        self.connection = connection
+        self.run_id = run_id
+        self.db_path = db_path
+        self.counts = dict.fromkeys(COLUMNS, 0)
+        self.nbytes = 0
+        self.history: Optional[History] = None
+        # Current segment of a partitioned run: (segments.id, idx), and the bytes written to it.
+        self.segment: Optional[Tuple[int, int]] = None
+        self.segment_nbytes = 0
+        # Last step written, the next segment starts after it.
+        self.last_f_id = 0
+        # (kind, rows) not written yet, how many rows, and the bytes of their locals.
+        self.pending: List[Tuple[str, List[Tuple[Any, ...]]]] = []
+        self.pending_count = 0
+        self.pending_nbytes = 0
+        self.written_at = time.monotonic()
+        self.open_segment(0)
+
+    def open_segment(self, idx: int):
+        """Point the stores at the run's events database: the main one, or a new segment file."""
+        sink = self.sink
+        if self.db_path is None:
+            # Events are inserted through the connection of the thread writing them.
+            self.events: Optional[sqlite3.Connection] = None
+            run_connection = self.connection
+        else:
+            path = segment_path(self.db_path, idx)
+            self.events = run_connection = create_run_db(path)
+            segment_id = add_segment(self.connection, self.run_id, idx, path, self.last_f_id + 1)
+            self.connection.commit()
+            self.segment = (segment_id, idx)
+            self.segment_nbytes = 0
+
+        self.pickles = PickleStore(run_connection) if sink.pickle_values else None
+        self.blobs = BlobStore(run_connection, buffers=sink.store_buffers)
+        if sink.history or sink.search:
+            if self.history is None:
+                search = SearchIndex(run_connection, self.run_id) if sink.search else None
+                self.history = History(run_connection, self.run_id, sink.history, search)
+            else:
+                self.history.use(run_connection)
+        self.compressor = (
+            Compressor(
+                run_connection,
+                self.run_id,
+                codec=None if sink.compress is True else sink.compress,
+            )
+            if sink.compress
+            else None
+        )
+
+    def close_segment(self):
+        if self.segment is None:
+            return
+        self.write()
+        self.events.commit()
+        self.events.close()
+        if self.segment_nbytes == 0 and self.segment[1] > 0:
+            # Rotated just before the run ended, don't leave an empty segment behind.
+            drop_segment(self.connection, self.segment[0])
+        else:
+            close_segment(self.connection, self.segment[0], self.last_f_id, self.segment_nbytes)
+        self.connection.commit()
+
+    def rotate(self):
+        self.close_segment()
+        self.open_segment(self.segment[1] + 1)
+        self.sink.retention_worker.check(self.run_id)
+
+    def encode_locals(self, f_locals: Any) -> Any:
+        """A frame's locals document. With a history, also each value's JSON: (document, values)."""
+        if isinstance(f_locals, (str, tuple)):
+            # Already encoded when it was recorded (see Loops).
+            return f_locals
+        if self.pickles is not None:
+            return self.pickles.encode(f_locals)
+        document = unstructure_snapshot(f_locals, self.blobs)
+        if self.history is not None:
+            return dumps_each(document)
+        return json.dumps(document)
+
+    def frame_row(self, row: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        """Index a frames row in the history, and compress its locals."""
+        f_locals = row[-1]
+        history = self.history
+        if type(f_locals) is tuple:
+            f_locals, values = f_locals
+            history.record(row[1], *row[3:6], values)
+            row = row[:-1] + (f_locals,)
+        elif history is not None:
+            history.record_document(row)
+        if self.compressor is not None:
+            f_locals = self.compressor.compress(f_locals)
+            row = row[:-1] + (f_locals,)
+        self.last_f_id = max(self.last_f_id, row[1])
+        nbytes = len(f_locals)
+        self.nbytes += nbytes
+        self.segment_nbytes += nbytes
+        return row
+
+    def add(self, kind: str, rows: List[Tuple[Any, ...]]):
+        """Hold `rows` until the next `write`."""
+        pending = self.pending
+        if pending and pending[-1][0] == kind:
+            pending[-1][1].extend(rows)
+        else:
+            pending.append((kind, rows))
+        self.pending_count += len(rows)
+        if kind == "frames":
+            for row in rows:
+                f_locals = row[-1]
+                self.pending_nbytes += len(f_locals[0] if type(f_locals) is tuple else f_locals)
+
+    def write(self):
+        """Write the pending events, committed when the sink commits (see SqliteSink)."""
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = []
+        self.pending_count = self.pending_nbytes = 0
+        events = self.events if self.events is not None else self.sink.connection
+        for kind, rows in pending:
+            if kind == "frames":
+                rows = [self.frame_row(row) for row in rows]
+            events.executemany(INSERTS[kind], rows)
+            self.counts[kind] += len(rows)
+        if self.sink.commits:
+            events.commit()
+        self.written_at = time.monotonic()
+
+    def end(self):
+        if self.events is None:
+            self.write()
+            self.sink.connection.commit()
+        self.close_segment()
+        end_run(self.connection, self.run_id, self.counts, self.nbytes)
+        self.connection.commit()
+        if self.sink.retention_worker is not None:
+            self.sink.retention_worker.check(self.run_id)
+
+
+class SqliteSink:
+    """SqliteSink inserts events into the tables created by `seed_db`, one executemany per run of same-kind events.
+
+    `target` is a connection, or a path or "file:" URI (by default $GOET_DB, see `connect`).
+
+    Each run (event run_id, a uuid) gets a row in the runs table the first time it's seen, `runs` maps it to
+    runs.id, and a SqliteRun writing its events. Runs are ended, and everything committed, on `close`. With a
+    path, each thread writing to the sink gets a connection of its own (closed on `close`).
+
+    Locals go through the run's stores, as the records are encoded (see `blobs_for` and `prepare`):
+
+    * large bytes-like locals are stored as raw blobs, with `store_buffers=True` so are the contents of buffer
+      locals (numpy arrays, ...), which are otherwise only summarized (see BlobStore)
+    * with `pickle_values=True`, locals are pickled so they can be fully inspected later (see PickleStore)
+    * with `compress=True` (or "zlib"/"zstd"), locals are stored compressed (see Compressor and Decompressor)
+    * with `history=True`, the steps at which each variable changed are indexed (see History, it needs every
+      local of each step), with `search=True` so are the strings in their new values, for full-text search
+      (see SearchIndex)
+
+    With `partition=True`, each run's events are written to a database file of its own (in `partition_dir`, by
+    default runs/ next to the main database), so deleting the run is a file unlink (see `attach_run`). With a
+    `retention` (partitioned runs only), runs rotate to a new segment file every so many bytes, and a background
+    thread drops old segments and runs past the limits, reporting each Eviction to `on_evict`.
+
+    Events are written once `commit_every` of a run's events are pending, or `commit_interval` seconds after its
+    last write, and before a partitioned run's segment would be full. Without either, every batch is written.
+    Each write is committed with a path, or when a `commit_every`/`commit_interval` is given; otherwise (on a
+    connection) only on `flush`. SQLite has a single writer: other writers only wait for one write, held events
+    aren't in the database yet and don't lock it.
+
+    Options that keep state per run (pickles, compression, history) expect each run to be written by one thread.
+    """
+
+    def __init__(
+        self,
+        target: Union[sqlite3.Connection, Database, None] = None,
+        pickle_values: bool = False,
+        store_buffers: bool = False,
+        compress: Union[bool, str] = False,
+        partition: bool = False,
+        partition_dir: Optional[str] = None,
+        retention: Optional[Retention] = None,
+        on_evict: Optional[Callable[[Eviction], None]] = None,
+        history: bool = False,
+        search: bool = False,
+        commit_every: Optional[int] = None,
+        commit_interval: Optional[float] = None,
+    ):
+        if retention is not None and not partition:
+            # The main database can't be cleaned up while a run holds a write transaction on it.
+            raise ValueError("retention needs partition=True")
+        if target is None:
+            target = default_database()
+        self.owns_connections = not isinstance(target, sqlite3.Connection)
+        self.target = os.fspath(target) if self.owns_connections else target
+        self.pickle_values = pickle_values
+        self.store_buffers = store_buffers
+        self.compress = compress
+        self.partition = partition
+        self.partition_dir = partition_dir
+        self.history = history
+        self.search = search
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        # Every batch is written, unless it's bounded otherwise.
+        self.batched = commit_every is None and commit_interval is None
+        self.commits = self.owns_connections or not self.batched
+        self.local = threading.local()
+        self.connections: List[sqlite3.Connection] = []
+        self.runs: Dict[str, int] = {}
+        # Held while runs are started or written, so threads writing the same run don't interleave.
+        self.lock = threading.RLock()
+        # Runs not ended yet, by runs.id.
+        self.open_runs: Dict[int, SqliteRun] = {}
+
+        self.rotate_bytes = None
+        self.retention_worker = None
+        if retention is not None:
+            self.rotate_bytes = retention.rotate_bytes
+            self.retention_worker = RetentionWorker(
+                database_path(self.connection), retention, on_evict
+            )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if not self.owns_connections:
+            return self.target
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # Closed by whichever thread closes the sink.
+            connection = self.local.connection = connect(
+                self.target, check_same_thread=False
+            )
+            self.connections.append(connection)
+        return connection
+
+    def run(self, run_uuid: str) -> SqliteRun:
+        """The run with this uuid, started the first time it's asked for."""
+        run_id = self.runs.get(run_uuid)
+        if run_id is not None:
+            return self.open_runs[run_id]
+
+        with self.lock:
+            run_id = self.runs.get(run_uuid)
+            if run_id is not None:
+                return self.open_runs[run_id]
+            connection = self.connection
+            db_path = (
+                run_db_path(connection, run_uuid, self.partition_dir) if self.partition else None
+            )
+            run_id = start_run(connection, run_uuid, db_path)
+            run = self.open_runs[run_id] = SqliteRun(self, connection, run_id, db_path)
+            # Visible to other connections (e.g. retention) from now on.
+            connection.commit()
+            self.runs[run_uuid] = run_id
+            return run
+
+    def run_id(self, run_uuid: str) -> int:
+        return self.run(run_uuid).run_id
+
+    def blobs_for(self, run_uuid: str) -> BlobStore:
+        """Where the raw bytes of the run's large bytes-like locals go, in whichever database it's writing to."""
+        return self.run(run_uuid).blobs
+
+    def prepare(self, event: Event, record: Record) -> Event:
+        """Adapt an event encoded once for every sink (see FanoutTracer), its blobs already in `blobs_for`.
+
+        Only with `pickle_values` are a frame's locals encoded again: pickles are made from the live values.
+        """
+        if not self.pickle_values or type(record) is not FrameRecord or isinstance(record.f_locals, (str, tuple)):
+            return event
+        kind, values = event
+        return kind, values[:-1] + (self.run(values[0]).encode_locals(record.f_locals),)
+
+    def write_events(self, batch: List[Event]):
+        with self.lock:
+            if len(batch) == 1:
+                # e.g. from SqlTracer, which hands over events one at a time.
+                ((kind, values),) = batch
+                run = self.run(values[0])
+                run.add(kind, [(run.run_id,) + values[1:]])
+                runs: Iterable[SqliteRun] = (run,)
+            else:
+                runs = {}
+                for (kind, run_uuid), events in groupby(batch, key=event_key):
+                    run = self.run(run_uuid)
+                    run.add(kind, [(run.run_id,) + values[1:] for _, values in events])
+                    runs[run] = None
+            rotate_bytes = self.rotate_bytes
+            for run in runs:
+                if not self.due(run):
+                    continue
+                run.write()
+                # Only between batches: the batch's blobs and pickles were stored in the segment it was encoded for.
+                if rotate_bytes is not None and run.segment_nbytes >= rotate_bytes:
+                    run.rotate()
+
+    def due(self, run: SqliteRun) -> bool:
+        """Whether `run`'s pending events should be written now."""
+        if self.batched:
+            return True
+        if self.rotate_bytes is not None and run.segment_nbytes + run.pending_nbytes >= self.rotate_bytes:
+            return True
+        if self.commit_every is not None and run.pending_count >= self.commit_every:
+            return True
+        return (
+            self.commit_interval is not None
+            and time.monotonic() - run.written_at >= self.commit_interval
+        )
+
+    def flush(self):
+        with self.lock:
+            for run in self.open_runs.values():
+                run.write()
+                if run.events is not None:
+                    run.events.commit()
+            if not self.owns_connections:
+                self.target.commit()
+            for connection in self.connections:
+                connection.commit()
+
+    def close(self):
+        with self.lock:
+            for run in self.open_runs.values():
+                run.end()
+            self.open_runs.clear()
+        if self.retention_worker is not None:
+            self.retention_worker.close()
+        self.flush()
+        for connection in self.connections:
+            connection.close()
+        self.connections.clear()
+        self.local = threading.local()
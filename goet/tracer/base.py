@@ -1,8 +1,29 @@
 import abc
 from enum import Enum, unique
+import inspect
+import json
 import sys
-from typing import ContextManager, Literal, Protocol, Union
-from goet.lib.frame.frame import Frame
+from types import CodeType
+from typing import (
+    Any,
+    ContextManager,
+    FrozenSet,
+    Iterable,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+)
+from goet.lib.converter.converter import register_opaque, unstructure_snapshot
+from goet.lib.frame.frame import Frame, FrameRecord, Traceback
+from goet.tracer.black_box import BlackBox, Record
+from goet.tracer.breakpoint import Breakpoints
+from goet.tracer.capture import Locals, LocalsCapture
+from goet.tracer.loops import LoopLimits, Loops
+from goet.tracer.watch import Watch
 from contextlib import contextmanager
 
 Event = Union[
@@ -15,26 +36,102 @@ Event = Union[
 
 
 class Tracer(Protocol):
-    def dispatch_call(self, frame: Frame):
+    def dispatch_call(self, frame: Frame, arg):
         raise NotImplementedError
 
     def dispatch_line(self, frame: Frame):
         raise NotImplementedError
 
-    def dispatch_return(self, frame: Frame):
+    def dispatch_return(self, frame: Frame, arg):
         raise NotImplementedError
 
-    def dispatch_exception(self, frame: Frame):
+    def dispatch_exception(self, frame: Frame, arg):
         raise NotImplementedError
 
     def dispatch_opcode(self, frame: Frame):
         raise NotImplementedError
 
 
+def to_code(trigger: Any) -> CodeType:
+    """Functions, methods and (decorated) callables are matched by their code object."""
+    if isinstance(trigger, CodeType):
+        return trigger
+    return inspect.unwrap(trigger).__code__
+
+
 class BaseTracer(abc.ABC, Tracer):
-    """Tracer is used to record Python runtime."""
+    """Tracer is used to record Python runtime.
+
+    * `capture_exception_locals` also captures f_locals at the raise site of exceptions
+    * `black_box` only writes calls that raise (see BlackBox)
+    * `watch` only records lines where a watched expression changed (see Watch)
+    * `breakpoints`/`logpoints` only record those locations (see Breakpoints)
+    * `triggers` keeps the tracer idle until one of the trigger functions is entered
+    * `capture_locals` picks which locals each line records: "all", "args", "changed", "watched"
+      or a list of names (see LocalsCapture)
+    * `loops` only records the first and last iterations of loops, and samples in between (see Loops)
+    """
+
+    # When set, records are held in memory and only written for calls that raise.
+    black_box: Optional[BlackBox] = None
+    # When set, lines are only dispatched when a watched expression changed.
+    watch: Optional[Watch] = None
+    # When set, only lines at breakpoints are dispatched, and logpoints are recorded.
+    breakpoints: Optional[Breakpoints] = None
+    # When set, lines record only some of their locals.
+    locals_capture: Optional[LocalsCapture] = None
+    # When set, records of loop iterations past the first ones go through it, most are dropped.
+    loops: Optional[Loops] = None
+    # When set, the tracer is armed but idle until one of these code objects is entered.
+    triggers: Optional[FrozenSet[CodeType]] = None
+    # How many calls deep we are since a trigger was entered; 0 while idle.
+    armed_depth: int = 0
+    # sys.monitoring tool id used to watch for triggers (Python 3.12+), if any.
+    monitoring_tool: Optional[int] = None
+
+    def __init__(
+        self,
+        capture_exception_locals: bool = False,
+        black_box: bool = False,
+        watch: Optional[Iterable[str]] = None,
+        breakpoints: Optional[Mapping[str, Optional[str]]] = None,
+        logpoints: Optional[Mapping[str, str]] = None,
+        triggers: Optional[Iterable[Any]] = None,
+        capture_locals: Locals = "all",
+        loops: Optional[LoopLimits] = None,
+    ):
+        # Only serialize f_locals for exceptions at the raise site, and only when asked to.
+        self.capture_exception_locals = capture_exception_locals
+        # (id(exc_value), traceback) of the last exception event, to link tracebacks while unwinding.
+        self.exception: Optional[Tuple[int, Traceback]] = None
+        # Steps recorded so far. For each frame on the stack: its caller's step, the last step recorded anywhere
+        # when it was called (which only its own steps share), and its last step.
+        self.f_id = 0
+        self.f_back_ids: List[Optional[int]] = [None]
+        self.f_call_ids: List[Optional[int]] = [None]
+        self.frame_ids: List[Optional[int]] = [None]
+        self.black_box = BlackBox() if black_box else None
+        self.watch = Watch(watch) if watch else None
+        self.breakpoints = (
+            Breakpoints(breakpoints, logpoints) if breakpoints or logpoints else None
+        )
+        self.triggers = (
+            frozenset(to_code(trigger) for trigger in triggers) if triggers else None
+        )
+        if capture_locals == "watched":
+            if self.watch is None:
+                raise ValueError('capture_locals="watched" needs watch=[...]')
+            capture_locals = self.watch.names
+        if capture_locals != "all":
+            self.locals_capture = LocalsCapture(capture_locals)
+        if loops is not None:
+            self.loops = Loops(loops, self.store, self.encode_locals)
 
     def __enter__(self):
+        if self.triggers is not None:
+            self.arm()
+            return
+
         # Set tracefunc manually on previous frame to start tracing immediately.
         # May want to set on all previous frames as well like ipdb.
         frame = sys._getframe()
@@ -44,8 +141,151 @@ class BaseTracer(abc.ABC, Tracer):
 
     def __exit__(self, *exc):
         sys.settrace(None)
+        self.disarm()
+        if self.loops is not None:
+            self.loops.close_all()
+        if self.black_box is not None:
+            # An exception escaping the `with` block never sees a "return" event.
+            records = self.black_box.drain()
+            if exc[0] is not None:
+                for record in records:
+                    self.write(record)
+
+    def dispatch_call(self, frame, arg):
+        # The caller's last step: other frames may have run since (e.g. `h` in `f(h(1))`), and returned.
+        self.f_back_ids.append(self.frame_ids[-1])
+        self.f_call_ids.append(self.f_id)
+        self.frame_ids.append(None)
+
+    # Called from the trace function, which Python doesn't trace: no need to pause tracing (sys.settrace is slow,
+    # twice per line it cost more than recording it).
+    def dispatch_line(self, sysframe):
+        self.f_id += 1
+        self.frame_ids[-1] = self.f_id
+        frame = FrameRecord.from_sysframe(
+            sysframe,
+            self.f_id,
+            self.f_back_ids[-1],
+            self.f_call_ids[-1],
+            self.capture_locals(sysframe),
+        )
+        self.record(frame)
+
+    def dispatch_return(self, frame, arg):
+        # Frames entered before tracing started return without a "call" event.
+        if len(self.f_back_ids) > 1:
+            self.f_back_ids.pop()
+            self.f_call_ids.pop()
+            self.frame_ids.pop()
+
+    def dispatch_exception(self, sysframe, arg):
+        exc_id = id(arg[1])
+        prev = None
+        if self.exception is not None and self.exception[0] == exc_id:
+            prev = self.exception[1]
+
+        traceback = Traceback.from_exc_info(
+            sysframe,
+            arg,
+            self.frame_ids[-1],
+            prev=prev,
+            capture_locals=self.capture_exception_locals,
+        )
+        self.exception = (exc_id, traceback)
+        self.record(traceback)
+
+    def dispatch_opcode(self, frame):
+        pass
+
+    def record(self, record: Record):
+        if self.loops is not None:
+            self.loops.add(record)
+        else:
+            self.store(record)
+
+    def store(self, record: Record):
+        """Write `record`, or hold it in the black box."""
+        if self.black_box is None:
+            self.write(record)
+            if type(record) is FrameRecord:
+                record.release()
+        else:
+            self.black_box.append(record)
+
+    def write(self, record: Record):
+        raise NotImplementedError
+
+    def encode_locals(self, f_locals: Mapping[str, Any]) -> Any:
+        """A frame's locals as they'll be written, for records held before they are (see Loops). Sinks write the
+        encoded locals as they are."""
+        return json.dumps(unstructure_snapshot(f_locals))
+
+    def capture_locals(self, sysframe):
+        """The locals to record for a line. None records all of them."""
+        if self.locals_capture is None:
+            return None
+        return self.locals_capture.capture(sysframe)
+
+    def arm(self):
+        """Wait for a trigger function to be entered before recording anything.
+
+        On Python 3.12+ only the trigger code objects are instrumented (sys.monitoring), so idle code runs untraced.
+        Otherwise a global trace function returns early for every call that is not a trigger.
+        """
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None:
+            tool = monitoring.DEBUGGER_ID
+            try:
+                monitoring.use_tool_id(tool, "goet")
+            except ValueError:
+                # Someone else (e.g. a debugger) is using it; fall back to sys.settrace.
+                pass
+            else:
+                self.monitoring_tool = tool
+                events = monitoring.events.PY_START | monitoring.events.PY_RESUME
+                for event in (monitoring.events.PY_START, monitoring.events.PY_RESUME):
+                    monitoring.register_callback(tool, event, self.trigger)
+                for code in self.triggers:
+                    monitoring.set_local_events(tool, code, events)
+                return
+
+        sys.settrace(self.tracefunc)
+
+    def disarm(self):
+        tool = self.monitoring_tool
+        if tool is not None:
+            self.monitoring_tool = None
+            monitoring = sys.monitoring
+            for code in self.triggers:
+                monitoring.set_local_events(tool, code, 0)
+            # free_tool_id keeps the callbacks, and with them this tracer.
+            for event in (monitoring.events.PY_START, monitoring.events.PY_RESUME):
+                monitoring.register_callback(tool, event, None)
+            monitoring.free_tool_id(tool)
+
+    def trigger(self, code: CodeType, instruction_offset: int):
+        """sys.monitoring callback for when a trigger starts (or resumes) running."""
+        if self.armed_depth:
+            # Already recording, sys.settrace sees this call.
+            return
+
+        sys.settrace(self.tracefunc)
+        self.tracefunc(sys._getframe(1), "call", None)
 
     def tracefunc(self, frame: Frame, event: Event, arg):
+        triggers = self.triggers
+        if triggers is not None:
+            if not self.armed_depth and (
+                event != "call" or frame.f_code not in triggers
+            ):
+                # Idle: don't trace lines in this frame.
+                frame.f_trace = None
+                return
+            if event == "call":
+                self.armed_depth += 1
+            elif event == "return":
+                self.armed_depth -= 1
+
         mapping = {
             "call": self.dispatch_call,
             "line": self.dispatch_line,
@@ -59,7 +299,71 @@ class BaseTracer(abc.ABC, Tracer):
         frame.f_trace = self.tracefunc
         frame.f_trace_lines = True
         frame.f_trace_opcodes = False
-        fn(frame)
+        black_box = self.black_box
+        if black_box is not None:
+            if event == "call":
+                black_box.call()
+            elif event == "line":
+                black_box.line()
+
+        breakpoints = self.breakpoints
+        if breakpoints is not None and event == "line":
+            capture, log = breakpoints.hit(frame)
+            if log is not None:
+                self.record(log)
+            if not capture:
+                return
+
+        locals_capture = self.locals_capture
+        if locals_capture is not None:
+            if event == "call":
+                locals_capture.call()
+            elif event == "return":
+                locals_capture.return_()
+
+        watch = self.watch
+        if watch is not None:
+            if event == "call":
+                watch.call()
+            elif event == "return":
+                watch.return_()
+            elif event == "line" and not watch.changed(frame):
+                return
+
+        loops = self.loops
+        if loops is not None:
+            if event == "call":
+                loops.call()
+            elif event == "return":
+                loops.return_()
+            elif event == "line":
+                loops.line(frame)
+
+        # Like bdb, only call/return/exception events carry a meaningful `arg`.
+        if event in ("call", "return", "exception"):
+            fn(frame, arg)
+        else:
+            fn(frame)
+
+        if black_box is not None:
+            if event == "exception":
+                black_box.exception()
+            elif event == "return":
+                records = black_box.return_()
+                if records:
+                    with self.pause_tracing():
+                        for record in records:
+                            self.write(record)
+                            if type(record) is FrameRecord:
+                                record.release()
+
+        if (
+            triggers is not None
+            and not self.armed_depth
+            and self.monitoring_tool is not None
+        ):
+            # Back to idle, sys.monitoring will tell us about the next trigger.
+            sys.settrace(None)
 
     @contextmanager
     def pause_tracing(self):
@@ -68,3 +372,6 @@ class BaseTracer(abc.ABC, Tracer):
             yield
         finally:
             sys.settrace(self.tracefunc)
+
+
+register_opaque(BaseTracer)
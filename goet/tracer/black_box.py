@@ -0,0 +1,71 @@
+from typing import List, Optional, Union
+
+import attr
+
+from goet.lib.frame.frame import FrameRecord, Log, Loop, Traceback
+
+Record = Union[FrameRecord, Traceback, Log, Loop]
+
+
+def hold(record: Record) -> Record:
+    """`record`, safe to write later. Locals keep changing after the event, so hold a shallow copy of them.
+
+    Locals already encoded (str or tuple, see Loops) are held as they are.
+    """
+    f_locals = getattr(record, "f_locals", None)
+    if isinstance(f_locals, (str, tuple)):
+        return record
+    if type(record) is FrameRecord:
+        record.f_locals = dict(record.f_locals)
+    elif f_locals is not None:
+        record = attr.evolve(record, f_locals=dict(record.f_locals))
+    return record
+
+
+class BlackBox:
+    """BlackBox holds recorded events in memory until we know a call failed.
+
+    Events are kept unserialized, one list per in-flight call (index 0 is the frame that entered the tracer).
+    When a call returns, its events are folded into its caller's list. When an outermost call returns normally
+    everything is dropped; if an exception propagated out of it, everything is handed back to be written.
+
+    >>> with SqlTracer(connection, black_box=True) as t:
+    ...     fn()
+    """
+
+    def __init__(self):
+        self.calls: List[List[Record]] = [[]]
+        # Whether an exception is propagating through the call at each depth.
+        self.unwinding: List[bool] = [False]
+
+    def append(self, record: Record):
+        self.calls[-1].append(hold(record))
+
+    def call(self):
+        self.calls.append([])
+        self.unwinding.append(False)
+
+    def line(self):
+        # A line after an exception event means it was handled in this frame.
+        self.unwinding[-1] = False
+
+    def exception(self):
+        self.unwinding[-1] = True
+
+    def return_(self) -> Optional[List[Record]]:
+        """Pop the returning call. Returns the records to write if it was an outermost call that failed."""
+        records = self.calls.pop()
+        failed = self.unwinding.pop()
+        self.calls[-1].extend(records)
+
+        if len(self.calls) > 1:
+            return None
+
+        records, self.calls[0] = self.calls[0], []
+        return records if failed else None
+
+    def drain(self) -> List[Record]:
+        records = [record for call in self.calls for record in call]
+        self.calls = [[]]
+        self.unwinding = [False]
+        return records
@@ -0,0 +1,129 @@
+import os
+from types import CodeType
+from typing import Dict, Mapping, Optional, Tuple
+
+import attr
+
+from goet.lib.frame.frame import Log
+
+Location = Tuple[str, int]
+
+
+def parse_location(location: str) -> Location:
+    """Parse "handlers.py:120" into a (normalized filename, lineno) key, see `matches` for how it's compared."""
+    filename, _, lineno = location.rpartition(":")
+    if not filename or not lineno.isdigit():
+        raise ValueError(f"Expected <filename>:<lineno>, got {location!r}")
+    return os.path.normpath(filename), int(lineno)
+
+
+def matches(co_filename: str, filename: str) -> bool:
+    """Whether a code object's file is the one a location names.
+
+    An absolute filename is compared with the absolute co_filename. A relative one matches any co_filename ending
+    with it, so "handlers.py" and "app/handlers.py" both name "/srv/app/handlers.py" wherever the tracer runs.
+    """
+    co_filename = os.path.normpath(co_filename)
+    if os.path.isabs(filename):
+        return os.path.abspath(co_filename) == filename
+    return co_filename == filename or co_filename.endswith(os.sep + filename)
+
+
+@attr.frozen
+class Breakpoint:
+    # Capture locals only when this evaluates truthy. None always captures.
+    condition: Optional[CodeType]
+    # f-string template to log instead of capturing locals.
+    message: Optional[CodeType]
+    # Whether it's a breakpoint, rather than only a logpoint.
+    capture: bool
+
+
+class Breakpoints:
+    """Breakpoints only let through lines at configured locations.
+
+    * a breakpoint captures the line, optionally only when its condition is truthy
+    * a logpoint records a formatted message instead of a full snapshot
+
+    Conditions and messages are compiled once. Locations are matched against each co_filename the first time
+    it's seen, then indexed by (co_filename, lineno), so every other line costs a dict lookup and a dict miss.
+
+    >>> with SqlTracer(
+    ...     connection,
+    ...     breakpoints={"handlers.py:120": "user_id == 42"},
+    ...     logpoints={"handlers.py:130": "total={order.total}"},
+    ... ) as t:
+    ...     fn()
+    """
+
+    def __init__(
+        self,
+        breakpoints: Optional[Mapping[str, Optional[str]]] = None,
+        logpoints: Optional[Mapping[str, str]] = None,
+    ):
+        conditions: Dict[Location, Optional[CodeType]] = {}
+        for location, condition in (breakpoints or {}).items():
+            conditions[parse_location(location)] = (
+                None
+                if condition is None
+                else compile(condition, f"<breakpoint {location}>", "eval")
+            )
+
+        messages: Dict[Location, CodeType] = {}
+        for location, message in (logpoints or {}).items():
+            messages[parse_location(location)] = compile(
+                f"f{message!r}", f"<logpoint {location}>", "eval"
+            )
+
+        self.locations: Dict[Location, Breakpoint] = {
+            location: Breakpoint(
+                condition=conditions.get(location),
+                message=messages.get(location),
+                capture=location in conditions,
+            )
+            for location in {**conditions, **messages}
+        }
+        # Breakpoints by line, for each co_filename seen so far.
+        self.files: Dict[str, Dict[int, Breakpoint]] = {}
+
+    def lines_for(self, co_filename: str) -> Dict[int, Breakpoint]:
+        lines = self.files.get(co_filename)
+        if lines is None:
+            lines = self.files[co_filename] = {
+                lineno: breakpoint
+                for (filename, lineno), breakpoint in self.locations.items()
+                if matches(co_filename, filename)
+            }
+        return lines
+
+    def hit(self, sysframe) -> Tuple[bool, Optional[Log]]:
+        """Returns whether to capture the line, and the logpoint message to record (if any)."""
+        code = sysframe.f_code
+        breakpoint = self.lines_for(code.co_filename).get(sysframe.f_lineno)
+        if breakpoint is None:
+            return False, None
+
+        f_globals = sysframe.f_globals
+        f_locals = sysframe.f_locals
+
+        log = None
+        if breakpoint.message is not None:
+            try:
+                message = eval(breakpoint.message, f_globals, f_locals)
+            except Exception as e:
+                message = f"<{type(e).__name__}: {e}>"
+            log = Log(
+                f_filename=code.co_filename,
+                f_funcname=code.co_name,
+                f_lineno=sysframe.f_lineno,
+                message=message,
+            )
+
+        capture = breakpoint.capture
+        if capture and breakpoint.condition is not None:
+            try:
+                capture = bool(eval(breakpoint.condition, f_globals, f_locals))
+            except Exception:
+                capture = False
+
+        return capture, log
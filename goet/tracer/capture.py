@@ -0,0 +1,104 @@
+import dis
+from types import CodeType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from goet.lib.frame.frame import Code
+from goet.tracer.watch import UNSET, fingerprint
+
+Locals = Union[str, Iterable[str]]
+
+
+class LocalsCapture:
+    """LocalsCapture decides which locals a traced line records.
+
+    * "all": every local (the default, no LocalsCapture is used)
+    * "args": only the function's arguments
+    * "changed": only locals whose value changed since the frame's previous line
+    * an iterable of names: only those locals (e.g. the roots of watched expressions)
+
+    On Python 3.13+ `f_locals` is a FrameLocalsProxy (PEP 667) that reads fast locals directly, so picking a few
+    names never builds a dict of every local. Older Pythons sync the whole dict on `f_locals` regardless, but only
+    the picked names reach the (much more expensive) converter.
+
+    Names to read are resolved once per code object from its (cached) Code. "changed" reads every local of a
+    function by name, and in module and class bodies the names their own code binds (see `bound_names`).
+    Values are compared by `fingerprint`, which misses some in-place mutations: of large containers, nested
+    ones, and those swapping an item for an equal one.
+    """
+
+    def __init__(self, locals: Locals):
+        self.mode: Optional[str] = locals if isinstance(locals, str) else None
+        if self.mode not in (None, "args", "changed"):
+            raise ValueError(f"Unknown locals capture {locals!r}")
+        self.names: Tuple[str, ...] = () if self.mode else tuple(locals)
+        self.codes: Dict[CodeType, Optional[Tuple[str, ...]]] = {}
+        # Last fingerprints of every local, for each frame on the stack ("changed" only).
+        self.fingerprints: List[Dict[str, Any]] = [{}]
+
+    def call(self):
+        self.fingerprints.append({})
+
+    def return_(self):
+        self.fingerprints.pop()
+
+    def names_for(self, syscode: CodeType) -> Optional[Tuple[str, ...]]:
+        """Names of the locals to read in frames of `syscode`, None for any name in the locals dict."""
+        if syscode in self.codes:
+            return self.codes[syscode]
+
+        code = Code.for_syscode(syscode)
+        if self.mode == "args":
+            names = code.argnames
+        elif self.mode == "changed":
+            names = code.localnames if code.is_function else bound_names(syscode)
+        elif code.is_function:
+            localnames = set(code.localnames)
+            names = tuple(name for name in self.names if name in localnames)
+        else:
+            # Module/class bodies: any name may be bound in their locals dict.
+            names = self.names
+        self.codes[syscode] = names
+        return names
+
+    def capture(self, sysframe) -> Mapping[str, Any]:
+        f_locals = sysframe.f_locals
+        names = self.names_for(sysframe.f_code)
+        if self.mode == "changed":
+            return self.changed(f_locals, names)
+
+        return {name: f_locals[name] for name in names if name in f_locals}
+
+    def changed(self, f_locals: Mapping[str, Any], names: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+        previous = self.fingerprints[-1]
+        fingerprints = {}
+        changed = {}
+        for name in f_locals if names is None else names:
+            try:
+                value = f_locals[name]
+            except KeyError:
+                # Not bound yet (or deleted).
+                continue
+            fingerprints[name] = current = fingerprint(value)
+            last = previous.get(name, UNSET)
+            if last is not current and last != current:
+                changed[name] = value
+        self.fingerprints[-1] = fingerprints
+        return changed
+
+
+# Opcodes binding a name in a module or class body's locals dict.
+BINDING_OPCODES = frozenset({"STORE_NAME", "DELETE_NAME", "STORE_GLOBAL", "DELETE_GLOBAL"})
+
+
+def bound_names(syscode: CodeType) -> Optional[Tuple[str, ...]]:
+    """Names a module or class body binds itself, None when it can bind any (`from m import *`).
+
+    Names bound from elsewhere, e.g. a function's `global` or `globals()[name] = ...`, aren't among them.
+    """
+    names = {}
+    for instruction in dis.get_instructions(syscode):
+        if instruction.opname in BINDING_OPCODES:
+            names[instruction.argval] = None
+        elif instruction.opname == "IMPORT_STAR" or instruction.argrepr == "INTRINSIC_IMPORT_STAR":
+            return None
+    return tuple(names)
@@ -0,0 +1,52 @@
+"""Compare the cost of capturing and serializing locals per line for each capture mode.
+
+    python -m goet.tracer.capture_bench
+"""
+import json
+import sys
+import timeit
+
+from goet.lib.converter.converter import converter
+from goet.tracer.capture import LocalsCapture
+
+N = 10_000
+
+
+def many_locals(order_id, retries):
+    # ~50 locals of assorted types.
+    v00 = v01 = v02 = v03 = v04 = v05 = v06 = v07 = v08 = v09 = list(range(10))
+    v10 = v11 = v12 = v13 = v14 = v15 = v16 = v17 = v18 = v19 = {"a": 1, "b": [1, 2]}
+    v20 = v21 = v22 = v23 = v24 = v25 = v26 = v27 = v28 = v29 = "x" * 20
+    v30 = v31 = v32 = v33 = v34 = v35 = v36 = v37 = v38 = v39 = 3.14
+    v40 = v41 = v42 = v43 = v44 = v45 = v46 = v47 = v48 = 1
+    return sys._getframe()
+
+
+def serialize(f_locals):
+    return json.dumps(converter.unstructure(f_locals))
+
+
+def main():
+    # A finished frame still answers f_locals, which is all the capture needs.
+    # Nothing changes between lines, so "changed" measures the fingerprint check alone.
+    sysframe = many_locals(1, 0)
+
+    def capture_all():
+        serialize(sysframe.f_locals)
+
+    print(f"{sys.version.split()[0]}")
+    seconds = min(timeit.repeat(capture_all, number=N, repeat=3))
+    print(f"{'all':<22} {seconds / N * 1e6:8.2f} us/line")
+
+    for mode in ("args", "changed", ["order_id", "v00"]):
+        capture = LocalsCapture(mode)
+
+        def capture_some():
+            serialize(capture.capture(sysframe))
+
+        seconds = min(timeit.repeat(capture_some, number=N, repeat=3))
+        print(f"{str(mode):<22} {seconds / N * 1e6:8.2f} us/line")
+
+
+if __name__ == "__main__":
+    main()
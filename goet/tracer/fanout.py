@@ -0,0 +1,135 @@
+import sys
+import uuid
+from typing import Any, Iterable, List, Optional
+
+from goet.lib.converter.summarizers import Blobs
+from goet.lib.frame.frame import FrameRecord
+from goet.sink.base import Event, Sink, encode
+from goet.tracer.base import BaseTracer
+from goet.tracer.black_box import Record
+from goet.tracer.offload import Offload
+
+
+class SharedBlobs:
+    """Blobs of the events shared by several sinks: raw bytes go to `blobs` (if any) and to each of `sinks`."""
+
+    def __init__(self, blobs: Optional[Blobs], sinks: List[Sink], run_uuid: str):
+        self.blobs = blobs
+        self.sinks = sinks
+        self.run_uuid = run_uuid
+
+    def stores(self) -> List[Blobs]:
+        # Looked up every time: a partitioned run's store changes with its segment.
+        stores = [sink.blobs_for(self.run_uuid) for sink in self.sinks]
+        return stores if self.blobs is None else [self.blobs] + stores
+
+    @property
+    def buffers(self) -> bool:
+        return any(store.buffers for store in self.stores())
+
+    def put(self, digest: str, buffer: Any):
+        for store in self.stores():
+            store.put(digest, buffer)
+
+
+class FanoutTracer(BaseTracer):
+    """FanoutTracer records Python runtime into one or more sinks.
+
+    Each event is captured and encoded once, then handed to every sink in batches of `batch_size`.
+    Large bytes-like locals are stored in `blobs` and in the blob store of each sink with a `blobs_for(run_uuid)`
+    method (e.g. SqliteSink), and recorded as {"$blob": summary} for every sink. Sinks with a
+    `prepare(event, record)` method adapt the shared event (SqliteSink pickles locals, with `pickle_values`).
+    Sinks are flushed and closed when tracing stops.
+
+    With `workers=N`, frame locals are snapshotted in the traced thread and serialized by N processes
+    (see Offload), for every sink.
+
+    >>> with FanoutTracer([SqliteSink("trace.sqlite3"), JsonlSink("trace.jsonl")]) as t:
+    ...     fn()
+
+    See BaseTracer for the recording options (`black_box`, `watch`, `breakpoints`, ...).
+    """
+
+    def __init__(
+        self,
+        sinks: Iterable[Sink],
+        batch_size: int = 256,
+        blobs: Optional[Blobs] = None,
+        workers: int = 0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.sinks = list(sinks)
+        # Each sink's own post-processing of the shared events, None for the sinks taking them as they are.
+        self.preparers = [getattr(sink, "prepare", None) for sink in self.sinks]
+        self.batch_size = batch_size
+        self.batches: List[List[Event]] = [[] for _ in self.sinks]
+        self.batched = 0
+        self.uuid = str(uuid.uuid4())
+        stores = [sink for sink in self.sinks if hasattr(sink, "blobs_for")]
+        self.blobs = SharedBlobs(blobs, stores, self.uuid) if stores else blobs
+        self.offload = Offload(workers) if workers else None
+
+    def __exit__(self, *exc):
+        sys.settrace(None)
+        val = super().__exit__(*exc)
+        if self.offload is not None:
+            for rows in self.offload.close():
+                self.add_frames(rows)
+        self.write_batch()
+        for sink in self.sinks:
+            sink.flush()
+            sink.close()
+        return val
+
+    def write(self, record: Record):
+        offload = self.offload
+        if offload is not None:
+            if type(record) is FrameRecord and not isinstance(record.f_locals, (str, tuple)):
+                offload.submit(
+                    (
+                        self.uuid,
+                        record.f_id,
+                        record.f_back_id,
+                        record.f_call_id,
+                        record.f_filename,
+                        record.f_funcname,
+                        record.f_lineno,
+                    ),
+                    record.f_locals,
+                )
+                for rows in offload.ready():
+                    self.add_frames(rows)
+                return
+            # Wait for the frames before it, so sinks still get events in order.
+            offload.flush()
+            for rows in offload.ready(wait=True):
+                self.add_frames(rows)
+
+        event = self.encode(record)
+        for batch, prepare in zip(self.batches, self.preparers):
+            batch.append(event if prepare is None else prepare(event, record))
+        self.added(1)
+
+    def encode(self, record: Record) -> Event:
+        """The event every sink gets for `record` (after its `prepare`, if any)."""
+        return encode(record, self.uuid, self.blobs)
+
+    def add_frames(self, rows: List[tuple]):
+        """Hand every sink the frames serialized by the offload workers."""
+        events = [("frames", row) for row in rows]
+        for batch in self.batches:
+            batch.extend(events)
+        self.added(len(events))
+
+    def added(self, n: int):
+        self.batched += n
+        if self.batched >= self.batch_size:
+            self.write_batch()
+
+    def write_batch(self):
+        if self.batched:
+            self.batched = 0
+            for sink, batch in zip(self.sinks, self.batches):
+                sink.write_events(batch)
+            self.batches = [[] for _ in self.sinks]
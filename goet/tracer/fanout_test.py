@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+
+from goet.lib.db.sqlite import connect, seed_db
+from goet.sink.binary import BinarySink, read_events
+from goet.sink.jsonl import JsonlSink
+from goet.sink.memory import MemorySink
+from goet.sink.sqlite import SqliteSink
+from goet.tracer.fanout import FanoutTracer
+
+
+class A:
+    def __init__(self, x):
+        self.x = x
+
+
+def fn():
+    a = A(1)
+    try:
+        fn2()
+    except ValueError:
+        pass
+    b = [a, a]
+    return b
+
+
+def fn2():
+    c = "raise site"
+    raise ValueError(c)
+
+
+directory = tempfile.mkdtemp()
+# A database of the test's own, never the default one.
+connection = connect(os.path.join(directory, "fanout_test.sqlite3"))
+seed_db(connection)
+jsonl_path = os.path.join(directory, "trace.jsonl")
+binary_path = os.path.join(directory, "trace.bin")
+memory = MemorySink()
+sqlite = SqliteSink(connection)
+
+tracer = FanoutTracer(
+    [memory, sqlite, JsonlSink(jsonl_path), BinarySink(binary_path)],
+    batch_size=4,
+)
+with tracer as t:
+    fn()
+
+print([(kind, values[1]) for kind, values in memory.events])
+
+# Every sink saw the same events, in the same order.
+assert list(read_events(binary_path)) == memory.events
+
+with open(jsonl_path) as f:
+    lines = [json.loads(line) for line in f]
+assert [line["kind"] for line in lines] == [kind for kind, _ in memory.events]
+frames = [line for line in lines if line.get("f_funcname") == fn.__name__]
+assert frames[0]["f_locals"] == {}
+assert frames[-1]["f_locals"] == {"a": {"x": 1}, "b": [{"$ref": 0}, {"$ref": 0}]}
+
+cursor = connection.cursor()
+run_id = sqlite.runs[tracer.uuid]
+for kind in ("frames", "exceptions"):
+    (count,) = cursor.execute(
+        f"select count(*) from {kind} where run_id = ?;", (run_id,)
+    ).fetchone()
+    assert count == sum(1 for k, _ in memory.events if k == kind), kind
+    (recorded,) = cursor.execute(
+        f"select {kind} from runs where id = ?;", (run_id,)
+    ).fetchone()
+    assert recorded == count, kind
+print(
+    cursor.execute(
+        "select f_id, tb_f_ids from exceptions where run_id = ?;", (run_id,)
+    ).fetchall()
+)
+
+
+# A sink given a path opens a connection for each thread writing to it.
+import threading
+
+sqlite_path = os.path.join(directory, "trace.sqlite3")
+by_path = SqliteSink(sqlite_path)
+frames = [event for event in memory.events if event[0] == "frames"]
+writers = [
+    threading.Thread(target=by_path.write_events, args=(frames,)) for _ in range(2)
+]
+for writer in writers:
+    writer.start()
+for writer in writers:
+    writer.join()
+assert len(by_path.connections) == 2
+by_path.close()
+
+(count,) = connect(sqlite_path).execute("select count(*) from frames;").fetchone()
+assert count == 2 * len(frames)
+
+
+# Encoded once for every sink: SqliteSink keeps the raw bytes of large bytes-like locals, all sinks get their summary.
+def fn3():
+    payload = bytes(range(256)) * 8
+    return payload
+
+
+blob_path = os.path.join(directory, "blobs.jsonl")
+sqlite = SqliteSink(connection)
+tracer = FanoutTracer([sqlite, JsonlSink(blob_path)])
+with tracer as t:
+    fn3()
+
+with open(blob_path) as f:
+    (summary,) = [
+        line["f_locals"]["payload"]["$blob"]
+        for line in map(json.loads, f)
+        if line.get("f_funcname") == fn3.__name__ and line["f_locals"]
+    ]
+(data,) = cursor.execute("select data from blobs where digest = ?;", (summary["hash"],)).fetchone()
+assert data == bytes(range(256)) * 8
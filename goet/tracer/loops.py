@@ -0,0 +1,246 @@
+import dis
+import json
+from collections import deque
+from types import CodeType
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+import attr
+
+from goet.lib.converter.converter import unstructure_snapshot
+from goet.lib.frame.frame import FrameRecord, Log, Loop, Traceback
+from goet.tracer.black_box import Record
+
+
+@attr.frozen
+class LoopLimits:
+    """How much of each hot loop to record.
+
+    * `first`: the first iterations, recorded as they run (at least 1, the loop is only noticed once it jumps back)
+    * `last`: the last iterations, held in memory until the loop ends
+    * `sample_every`: in between, every so many-th iteration is recorded anyway (0 never)
+    """
+
+    first: int = 10
+    last: int = 10
+    sample_every: int = 1000
+
+    def __attrs_post_init__(self):
+        if self.first < 1 or self.last < 0 or self.sample_every < 0:
+            raise ValueError(f"Invalid {self!r}")
+
+
+def loop_ends(code: CodeType) -> Dict[int, int]:
+    """Last line of each loop in `code`, by the line it jumps back to.
+
+    A loop is the span of bytecode between a backward jump and its target, it starts at its lowest line.
+    """
+    starts = dict(dis.findlinestarts(code))
+    lines: Dict[int, int] = {}
+    jumps: List[Tuple[int, int]] = []
+    line = code.co_firstlineno
+    for instruction in dis.get_instructions(code):
+        line = starts.get(instruction.offset) or line
+        lines[instruction.offset] = line
+        target = instruction.argval
+        if (
+            (instruction.opcode in dis.hasjrel or instruction.opcode in dis.hasjabs)
+            and isinstance(target, int)
+            and target <= instruction.offset
+        ):
+            jumps.append((target, instruction.offset))
+
+    ends: Dict[int, int] = {}
+    for target, offset in jumps:
+        span = [line for at, line in lines.items() if target <= at <= offset]
+        head = min(span)
+        ends[head] = max(ends.get(head, head), max(span))
+    return ends
+
+
+class LoopState:
+    """A loop running in a frame on the stack."""
+
+    def __init__(self, depth: int, head: int, end: int, filename: str, funcname: str):
+        self.depth = depth
+        # Lines of the loop: it jumps back to `head` from up to `end`.
+        self.head = head
+        self.end = end
+        self.filename = filename
+        self.funcname = funcname
+        # Set from the loop's first recorded line.
+        self.f_call_id: Optional[int] = None
+        self.started = False
+        # The first iteration ran before the loop was noticed.
+        self.iterations = 1
+        # Records of the running iteration, None while they're written as they come.
+        self.current: Optional[List[Record]] = None
+        # (iteration, records) of the last ones.
+        self.tail: Deque[Tuple[int, List[Record]]] = deque()
+        self.first_f_id: Optional[int] = None
+        self.last_f_id: Optional[int] = None
+        self.elided = 0
+
+
+class Loops:
+    """Loops records only the first and last iterations of hot loops, and samples in between.
+
+    A line running before the line the frame ran last is a jump back to the start of a loop. Every iteration
+    after the `first` ones is held in memory, its locals already encoded (by `encode_locals`, as they'll be
+    written) since the loop can still change the objects in them. When more than `last` are, the oldest is
+    dropped (or written, every `sample_every`-th). Once the loop is done (a line past its end, a jump back to an
+    enclosing loop, or the frame returning), the held iterations are written, and a Loop record tells how many
+    weren't.
+
+    Calls made by a loop belong to the iteration that made them, their loops are compressed within it.
+    Exceptions and logs of dropped iterations are still written.
+
+    >>> with SqlTracer(connection, loops=LoopLimits(first=10, last=10)) as t:
+    ...     fn()
+    """
+
+    def __init__(
+        self,
+        limits: LoopLimits,
+        store: Callable[[Record], None],
+        encode_locals: Callable[[Mapping[str, Any]], Any],
+    ):
+        self.limits = limits
+        # Where records go once the loops are done with them.
+        self.store = store
+        self.encode_locals = encode_locals
+        # Last line of each frame on the stack, 0 before its first one.
+        self.lines: List[int] = [0]
+        # Loops running in the frames on the stack, outermost first.
+        self.active: List[LoopState] = []
+        # loop_ends of the code objects seen so far.
+        self.ends: Dict[CodeType, Dict[int, int]] = {}
+
+    def call(self):
+        self.lines.append(0)
+
+    def return_(self):
+        depth = len(self.lines)
+        active = self.active
+        while active and active[-1].depth == depth:
+            self.close(active.pop())
+        self.lines.pop()
+        if not self.lines:
+            # Returned from the frame tracing started in.
+            self.lines.append(0)
+
+    def line(self, sysframe):
+        """Called before the line's records, which then belong to the iteration it starts or continues."""
+        lineno = sysframe.f_lineno
+        depth = len(self.lines)
+        last = self.lines[-1]
+        self.lines[-1] = lineno
+        if not last:
+            return
+
+        active = self.active
+        if lineno <= last:
+            # Jumped back: the loops of this frame starting after `lineno` are done.
+            while active and active[-1].depth == depth and active[-1].head > lineno:
+                self.close(active.pop())
+            if active and active[-1].depth == depth and active[-1].head == lineno:
+                loop = active[-1]
+                loop.end = max(loop.end, last)
+                self.next_iteration(loop)
+            else:
+                code = sysframe.f_code
+                ends = self.ends.get(code)
+                if ends is None:
+                    ends = self.ends[code] = loop_ends(code)
+                # The line it jumped back from isn't the last of the loop when it ended an inner loop, or on `continue`.
+                end = max(last, ends.get(lineno, 0))
+                loop = LoopState(depth, lineno, end, code.co_filename, code.co_name)
+                active.append(loop)
+                self.next_iteration(loop)
+        else:
+            while active and active[-1].depth == depth and lineno > active[-1].end:
+                self.close(active.pop())
+
+    def next_iteration(self, loop: LoopState):
+        if loop.current is not None:
+            loop.tail.append((loop.iterations, loop.current))
+            if len(loop.tail) > self.limits.last:
+                self.evict(loop, self.active.index(loop) - 1)
+        loop.iterations += 1
+        loop.current = [] if loop.iterations > self.limits.first else None
+
+    def evict(self, loop: LoopState, level: int):
+        """Drop (or write, if it's a sample) the oldest held iteration of `loop`."""
+        iteration, records = loop.tail.popleft()
+        every = self.limits.sample_every
+        if every and iteration % every == 0:
+            for record in records:
+                self.add(record, level)
+            return
+
+        loop.elided += 1
+        for record in records:
+            if type(record) is FrameRecord:
+                if loop.first_f_id is None:
+                    loop.first_f_id = record.f_id
+                loop.last_f_id = record.f_id
+                record.release()
+            elif isinstance(record, (Traceback, Log)):
+                self.add(record, level)
+
+    def close(self, loop: LoopState):
+        """Write what's held of a loop that's done (it was popped from `active`)."""
+        if loop.current is not None:
+            # The iteration the loop was left in (often only the check ending it), on top of the `last` ones.
+            loop.tail.append((loop.iterations, loop.current))
+            loop.current = None
+        level = len(self.active) - 1
+        if loop.elided:
+            self.add(
+                Loop(
+                    f_call_id=loop.f_call_id,
+                    f_filename=loop.filename,
+                    f_funcname=loop.funcname,
+                    f_lineno=loop.head,
+                    first_f_id=loop.first_f_id,
+                    last_f_id=loop.last_f_id,
+                    iterations=loop.iterations - 1,
+                    elided=loop.elided,
+                ),
+                level,
+            )
+        for _, records in loop.tail:
+            for record in records:
+                self.add(record, level)
+        loop.tail.clear()
+
+    def close_all(self):
+        while self.active:
+            self.close(self.active.pop())
+        self.lines = [0]
+
+    def add(self, record: Record, level: Optional[int] = None):
+        """Hold `record` in the innermost loop (at or below `level`) whose iteration is held, or store it."""
+        active = self.active
+        if level is None:
+            level = len(active) - 1
+            if level >= 0 and not active[-1].started and type(record) is FrameRecord:
+                # The loop's first line: the frame's steps share this f_call_id.
+                active[-1].started = True
+                active[-1].f_call_id = record.f_call_id
+        while level >= 0:
+            current = active[level].current
+            if current is not None:
+                current.append(self.hold(record))
+                return
+            level -= 1
+        self.store(record)
+
+    def hold(self, record: Record) -> Record:
+        """`record` with its locals encoded now. Exceptions' locals are always JSON, sinks encode the rest."""
+        if type(record) is FrameRecord:
+            record.f_locals = self.encode_locals(record.f_locals)
+        elif getattr(record, "f_locals", None) is not None:
+            record = attr.evolve(
+                record, f_locals=json.dumps(unstructure_snapshot(record.f_locals))
+            )
+        return record
@@ -0,0 +1,39 @@
+"""Compare recording a hot loop whole vs with loop limits.
+
+    python -m goet.tracer.loops_bench [n]
+
+Records a loop of `n` iterations with and without `loops=LoopLimits()`, and reports the time, the steps written
+and the size of the database.
+"""
+import os
+import sys
+import tempfile
+import time
+
+from goet.lib.db.sqlite import connect
+from goet.tracer.loops import LoopLimits
+from goet.tracer.sql import SqlTracer
+
+
+def checksum(n):
+    total = 0
+    for i in range(n):
+        total = (total * 31 + i) % 65521
+    return total
+
+
+def main(n: int):
+    for name, kwargs in {"whole": {}, "limited": {"loops": LoopLimits()}}.items():
+        path = os.path.join(tempfile.mkdtemp(), "loops_bench.sqlite3")
+        tracer = SqlTracer(path, **kwargs)
+        start = time.perf_counter()
+        with tracer:
+            checksum(n)
+        elapsed = time.perf_counter() - start
+        (steps,) = connect(path).execute("SELECT COUNT(*) FROM frames").fetchone()
+        size = os.path.getsize(path)
+        print(f"{name}: {elapsed * 1000:.0f}ms, {steps} steps, {size / 1024:.0f}KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
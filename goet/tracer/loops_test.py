@@ -0,0 +1,175 @@
+import os
+import tempfile
+
+from goet.lib.db.navigator import Navigator
+from goet.lib.db.sqlite import connect
+from goet.sink.memory import MemorySink
+from goet.tracer.fanout import FanoutTracer
+from goet.tracer.loops import LoopLimits, loop_ends
+from goet.tracer.sql import SqlTracer
+
+
+def hot(n):
+    total = 0
+    for i in range(n):
+        total += i
+    done = True
+    return total
+
+
+def square(x):
+    y = x * x
+    return y
+
+
+def nested(n):
+    squares = []
+    for i in range(n):
+        squares.append(square(i))
+        for j in range(n):
+            pass
+    return squares
+
+
+def flaky(n):
+    errors = 0
+    for i in range(n):
+        try:
+            if i == n // 2:
+                raise ValueError(i)
+        except ValueError:
+            errors += 1
+    return errors
+
+
+def accumulate(n):
+    acc = []
+    for i in range(n):
+        acc.append(i)
+    return acc
+
+
+def values(connection, run_id, funcname, name):
+    """`name`'s recorded values in `funcname`, in step order, without repeats."""
+    nav = Navigator(connection, run_id)
+    found = []
+    for (f_id,) in connection.execute(
+        "SELECT f_id FROM frames WHERE run_id = ? AND f_funcname = ? ORDER BY f_id", (run_id, funcname)
+    ):
+        value = nav.locals(f_id).get(name)
+        if value is not None and (not found or found[-1] != value):
+            found.append(value)
+    return found
+
+
+def loops(connection, run_id):
+    return connection.execute(
+        """
+        SELECT f_funcname, f_lineno, first_f_id, last_f_id, iterations, elided FROM loops
+        WHERE run_id = ? ORDER BY first_f_id
+        """,
+        (run_id,),
+    ).fetchall()
+
+
+def record(fn, *args, **kwargs):
+    tracer = SqlTracer(path, **kwargs)
+    with tracer:
+        fn(*args)
+    return tracer.run_id
+
+
+# The inner loop's lines are part of the outer one.
+first = nested.__code__.co_firstlineno
+assert loop_ends(nested.__code__) == {first + 2: first + 5, first + 4: first + 5}
+
+path = os.path.join(tempfile.mkdtemp(), "loops.sqlite3")
+connection = connect(path)
+limits = LoopLimits(first=3, last=2, sample_every=0)
+
+# The first 3 and last 2 iterations are recorded, the others are counted.
+# (The `for` line starting an iteration still shows the previous `i`.)
+run_id = record(hot, 1000, loops=limits)
+assert values(connection, run_id, "hot", "i") == [0, 1, 2, 997, 998, 999]
+((funcname, lineno, first_f_id, last_f_id, iterations, elided),) = loops(connection, run_id)
+assert (funcname, lineno - hot.__code__.co_firstlineno) == ("hot", 2)
+assert iterations == 1000 and elided == 995
+# The loop's 2 lines run in each of them, none is recorded.
+assert last_f_id - first_f_id + 1 == 2 * elided
+(missing,) = connection.execute(
+    "SELECT COUNT(*) FROM frames WHERE run_id = ? AND f_id BETWEEN ? AND ?", (run_id, first_f_id, last_f_id)
+).fetchone()
+assert missing == 0
+assert values(connection, run_id, "hot", "done") == [True]
+totals = values(connection, run_id, "hot", "total")
+assert totals == [0, 1] + [sum(range(k)) for k in (998, 999, 1000)], totals
+
+# Short loops are recorded whole, without a loops row.
+plain = record(hot, 5)
+short = record(hot, 5, loops=limits)
+count = lambda run_id: connection.execute("SELECT COUNT(*) FROM frames WHERE run_id = ?", (run_id,)).fetchone()[0]
+assert count(short) == count(plain) and not loops(connection, short)
+
+# Calls belong to their iteration, nested loops are compressed within the iterations that are recorded.
+run_id = record(nested, 50, loops=limits)
+assert values(connection, run_id, "square", "x") == [0, 1, 2, 48, 49]
+found = loops(connection, run_id)
+outer = [row for row in found if row[1] == nested.__code__.co_firstlineno + 2]
+inner = [row for row in found if row[1] == nested.__code__.co_firstlineno + 4]
+assert len(outer) == 1 and outer[0][-1] == outer[0][-2] - 5
+# One per recorded iteration of the outer loop.
+assert len(inner) == 5 and all(row[-1] == row[-2] - 5 for row in inner)
+assert values(connection, run_id, "nested", "squares")[-1] == [i * i for i in range(50)]
+
+# Held iterations are written as they were, not as the loop left the objects they show.
+for kwargs in ({}, {"history": True}, {"pickle_values": True}):
+    run_id = record(accumulate, 50, loops=LoopLimits(first=2, last=2, sample_every=0), **kwargs)
+    nav = Navigator(connection, run_id)
+    lines = connection.execute(
+        "SELECT f_id, f_lineno FROM frames WHERE run_id = ? AND f_funcname = 'accumulate'", (run_id,)
+    ).fetchall()
+    # Pickled values are LazyValues.
+    unpickle = lambda state: {name: getattr(value, "value", value) for name, value in state.items()}
+    states = [(lineno, unpickle(nav.locals(f_id))) for f_id, lineno in lines]
+    append = accumulate.__code__.co_firstlineno + 3
+    assert (append, {"n": 50, "acc": list(range(48)), "i": 48}) in states, (kwargs, states)
+    assert all(state["acc"] == list(range(len(state["acc"]))) for _, state in states if "acc" in state)
+
+# Samples, and exceptions of iterations that aren't recorded.
+run_id = record(flaky, 1000, loops=LoopLimits(first=3, last=2, sample_every=100))
+# Iterations 100, 200, ... 900 are sampled, 1000 is one of the last.
+sampled = [i for k in range(100, 1000, 100) for i in (k - 2, k - 1)]
+assert values(connection, run_id, "flaky", "i") == [0, 1, 2] + sampled + [997, 998, 999]
+assert connection.execute(
+    "SELECT exc_type FROM exceptions WHERE run_id = ?", (run_id,)
+).fetchall() == [("ValueError",)]
+((_, _, first_f_id, last_f_id, iterations, elided),) = loops(connection, run_id)
+assert iterations == 1000 and elided == iterations - 5 - 9
+
+# The navigator tells which iterations a move went past.
+run_id = record(hot, 1000, loops=limits)
+nav = Navigator(connection, run_id)
+while nav.current.f_funcname != "hot" or nav.locals().get("i") != 2:
+    nav.step_forward()
+start = nav.current.f_id
+nav.step_over()
+nav.step_over()
+assert nav.locals()["i"] == 998
+(loop,) = nav.elided(start, nav.current.f_id)
+assert loop.f_funcname == "hot" and loop.elided == loop.iterations - 5
+assert nav.elided(start, start + 1) == [] and nav.elided(nav.current.f_id, start) == [loop]
+
+# Other tracers get a loops event.
+memory = MemorySink()
+with FanoutTracer([memory], loops=limits):
+    hot(100)
+(event,) = [values for kind, values in memory.events if kind == "loops"]
+assert event[3:5] == ("hot", hot.__code__.co_firstlineno + 2), event
+print(len(memory.events), "events")
+
+try:
+    LoopLimits(first=0)
+except ValueError:
+    pass
+else:
+    raise AssertionError("first=0")
@@ -0,0 +1,53 @@
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Iterator, List, Mapping, Tuple
+
+from goet.lib.snapshot.snapshot import serialize_batch, snapshot
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+Row = Tuple[Any, ...]
+
+
+class Offload:
+    """Offload serializes locals in worker processes instead of the traced thread.
+
+    The traced thread only takes a cheap snapshot of each line's locals (see `snapshot`), rows are batched
+    and serialized by a ProcessPoolExecutor. Batches come back in the order they were submitted.
+
+    >>> with SqlTracer(connection, workers=2) as t:
+    ...     fn()
+    """
+
+    def __init__(self, workers: int, batch_size: int = 256):
+        self.batch_size = batch_size
+        self.batch: List[Row] = []
+        self.pending: "Deque[Future]" = deque()
+        # Imported here, process pools are heavy to import and most runs don't use one.
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # Start the workers now: forking from a traced thread would carry the trace function along.
+        self.executor.submit(int).result()
+
+    def submit(self, row: Row, f_locals: Mapping[str, Any]):
+        """Queue `row` with a snapshot of `f_locals`; it comes back with the serialized locals appended."""
+        self.batch.append(row + (snapshot(f_locals),))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.pending.append(self.executor.submit(serialize_batch, self.batch))
+            self.batch = []
+
+    def ready(self, wait: bool = False) -> Iterator[List[Row]]:
+        """Serialized batches, in order. Stops at the first unfinished batch unless `wait`."""
+        pending = self.pending
+        while pending and (wait or pending[0].done()):
+            yield pending.popleft().result()
+
+    def close(self) -> Iterator[List[Row]]:
+        self.flush()
+        yield from self.ready(wait=True)
+        self.executor.shutdown()
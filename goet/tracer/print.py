@@ -1,14 +1,15 @@
 import sys
 import json
-from typing import List, Optional
-from goet.lib.converter.converter import converter
-from goet.lib.frame.frame import Frame
+import uuid
+from typing import Optional
+from goet.lib.converter.converter import converter, unstructure_snapshot
+from goet.lib.frame.frame import FrameRecord, Log
+from goet.sink.base import encode
+from goet.sink.jsonl import JsonlSink, Target
 from goet.tracer.base import BaseTracer
+from goet.tracer.black_box import Record
 from pprint import pprint
 
-CURR_FRAME_ID: int = 0
-PREV_FRAME_IDS: List[Optional[int]] = [None]
-
 
 class PrintTracer(BaseTracer):
     """PrintTracer is used to record Python runtime.
@@ -35,29 +36,48 @@ class PrintTracer(BaseTracer):
           x
       x x x x x
     x x x x x x
-    """
-
-    def dispatch_call(self, frame):
-        PREV_FRAME_IDS.append(CURR_FRAME_ID)
-        # print(f"dispatch_call: {frame=}")
-
-    def dispatch_line(self, sysframe):
-        # print(f"dispatch_line: {sysframe=}")
 
-        with self.pause_tracing():
-            global CURR_FRAME_ID
-            CURR_FRAME_ID += 1
-            frame = Frame.from_sysframe(sysframe, CURR_FRAME_ID, PREV_FRAME_IDS[-1])
-            pprint(converter.unstructure(frame), indent=4)
+    With `output` (a path or a file descriptor), events are streamed there as compact JSON lines instead of
+    pretty-printed to stdout. `compress` and `max_bytes` gzip and rotate the stream (see JsonlSink), whose
+    counters are in `self.sink.stats()`.
 
-    def dispatch_return(self, frame):
-        PREV_FRAME_IDS.pop()
-        # print(f"dispatch_return: {frame=}")
-
-    def dispatch_exception(self, frame):
-        # print(f"dispatch_exception: {frame=}")
-        pass
+    >>> with PrintTracer(output="trace.jsonl.gz", compress=True) as t:
+    ...     fn()
+    """
 
-    def dispatch_opcode(self, frame):
-        # print(f"dispatch_opcode: {frame=}")
-        pass
+    def __init__(
+        self,
+        output: Optional[Target] = None,
+        compress: bool = False,
+        max_bytes: Optional[int] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.uuid = str(uuid.uuid4())
+        self.sink = (
+            None
+            if output is None
+            else JsonlSink(output, compress=compress, max_bytes=max_bytes)
+        )
+
+    def __exit__(self, *exc):
+        sys.settrace(None)
+        val = super().__exit__(*exc)
+        if self.sink is not None:
+            self.sink.close()
+        return val
+
+    def write(self, record: Record):
+        if self.sink is not None:
+            self.sink.write_events([encode(record, self.uuid)])
+        elif type(record) is FrameRecord:
+            # Only the locals need the converter, the rest is already plain data.
+            frame = record.to_dict()
+            frame["f_locals"] = (
+                json.loads(record.f_locals)
+                if isinstance(record.f_locals, str)
+                else unstructure_snapshot(record.f_locals)
+            )
+            pprint(frame, indent=4)
+        else:
+            pprint(converter.unstructure(record), indent=4)
@@ -26,9 +26,17 @@ def fn():
 
 def fn2():
     a = 3
+    try:
+        fn3()
+    except ValueError:
+        pass
     return a
 
 
+def fn3():
+    raise ValueError("fn3")
+
+
 # from pprint import pprint
 # import json
 # import ipdb; ipdb.set_trace()
@@ -37,3 +45,44 @@ def fn2():
 
 with PrintTracer() as t:
     fn()
+
+
+# Streaming: compact JSON lines, gzipped and rotated.
+import glob
+import gzip
+import json
+import os
+import tempfile
+
+from goet.sink.jsonl import segment_path
+
+directory = tempfile.mkdtemp()
+streamed = PrintTracer(
+    output=os.path.join(directory, "trace.jsonl.gz"), compress=True, max_bytes=1024
+)
+with streamed as t:
+    fn()
+
+stats = streamed.sink.stats()
+segments = streamed.sink.segment + 1
+assert segments > 1 and len(glob.glob(os.path.join(directory, "*.gz"))) == segments
+lines = []
+for segment in range(segments):
+    path = segment_path(streamed.sink.target, segment)
+    with gzip.open(path, "rt") as f:
+        lines += [json.loads(line) for line in f]
+assert len(lines) == stats["events"] and stats["events_per_sec"] > 0
+assert [line["f_lineno"] for line in lines if line.get("f_funcname") == "fn3"] == [
+    fn3.__code__.co_firstlineno + 1
+]
+assert [line["kind"] for line in lines].count("exceptions") == 2
+
+# To a file descriptor, left open.
+path = os.path.join(directory, "trace.jsonl")
+fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+with PrintTracer(output=fd) as t:
+    fn2()
+os.fstat(fd)
+os.close(fd)
+with open(path) as f:
+    assert any(json.loads(line).get("f_funcname") == "fn2" for line in f)
@@ -1,67 +1,114 @@
-import json
-import uuid
 import sqlite3
-import sys
-from typing import List, Optional
+from typing import Any, Callable, Dict, Mapping, Optional, Union
 
-from goet.lib.converter.converter import converter
-from goet.lib.frame.frame import Frame
-from goet.tracer.base import BaseTracer
+from goet.lib.db.retention import Eviction, Retention, RetentionWorker
+from goet.lib.db.sqlite import Database
+from goet.lib.frame.frame import FrameRecord
+from goet.sink.base import Event, encode
+from goet.sink.sqlite import SqliteRun, SqliteSink
+from goet.tracer.black_box import Record
+from goet.tracer.fanout import FanoutTracer
 
-CURR_FRAME_ID: int = 0
-PREV_FRAME_IDS: List[Optional[int]] = [None]
 
-
-class SqlTracer(BaseTracer):
+class SqlTracer(FanoutTracer):
     """SqlTracer is used to record Python runtime.
 
-    >>> with SqlTracer.trace_manager() as t:
+    >>> with SqlTracer("trace.sqlite3") as t:
     ...     fn()
+
+    It's a FanoutTracer writing to a single SqliteSink, see SqliteSink for the storage options (`pickle_values`,
+    `store_buffers`, `compress`, `history`, `search`, `partition`, `retention`, ...).
+    With `workers=N`, locals are snapshotted in the traced thread and serialized by N processes (see Offload).
+    Events go to the sink as they're recorded (`batch_size=1`), which writes them every 256 events or every second.
+
+    Each run gets a row in the runs table, `run_id` is its id, started when the tracer is created.
+
+    `database` is a connection, or a path or "file:" URI (by default $GOET_DB, see `connect`). A path opens a
+    connection for this tracer only, closed when tracing stops, so several traced processes (or threads) can
+    each record to a database of their own.
+
+    See BaseTracer for the recording options (`black_box`, `watch`, `breakpoints`, ...).
     """
 
-    def __init__(self, connection: sqlite3.Connection):
-        self.connection = connection
-        self.cursor = connection.cursor()
-        self.run_id = str(uuid.uuid4())
-
-    def __exit__(self, *exc):
-        sys.settrace(None)
-        val = super().__exit__(*exc)
-        self.connection.commit()
-        return val
-
-    def dispatch_call(self, frame):
-        PREV_FRAME_IDS.append(CURR_FRAME_ID)
-
-    def dispatch_line(self, sysframe):
-        with self.pause_tracing():
-            global CURR_FRAME_ID
-            CURR_FRAME_ID += 1
-
-            frame = Frame.from_sysframe(sysframe, CURR_FRAME_ID, PREV_FRAME_IDS[-1])
-
-            sql = f"""
-            INSERT INTO frames (run_id, f_id, f_back_id, f_filename, f_funcname, f_lineno, f_locals)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """
-            args = (
-                self.run_id,
-                frame.f_id,
-                frame.f_back_id,
-                frame.f_filename,
-                frame.f_funcname,
-                frame.f_lineno,
-                json.dumps(converter.unstructure(frame.f_locals)),
+    def __init__(
+        self,
+        database: Union[sqlite3.Connection, Database, None] = None,
+        workers: int = 0,
+        pickle_values: bool = False,
+        store_buffers: bool = False,
+        compress: Union[bool, str] = False,
+        partition: bool = False,
+        partition_dir: Optional[str] = None,
+        retention: Optional[Retention] = None,
+        on_evict: Optional[Callable[[Eviction], None]] = None,
+        history: bool = False,
+        search: bool = False,
+        batch_size: int = 1,
+        **kwargs,
+    ):
+        if workers and pickle_values:
+            raise ValueError("workers and pickle_values can't be used together")
+        if workers and store_buffers:
+            raise ValueError("workers and store_buffers can't be used together")
+        # A local missing from a step is recorded as deleted, which only holds if every local was captured.
+        if history and kwargs.get("capture_locals", "all") != "all":
+            raise ValueError('history needs capture_locals="all"')
+
+        self.sink = SqliteSink(
+            database,
+            pickle_values=pickle_values,
+            store_buffers=store_buffers,
+            compress=compress,
+            partition=partition,
+            partition_dir=partition_dir,
+            retention=retention,
+            on_evict=on_evict,
+            history=history,
+            search=search,
+            # Written (and committed) in short transactions: other tracers recording to the same database only
+            # wait for one of them, and readers see events at most a second late.
+            commit_every=256,
+            commit_interval=1.0,
+        )
+        super().__init__([self.sink], batch_size=batch_size, workers=workers, **kwargs)
+        self.run: SqliteRun = self.sink.run(self.uuid)
+        self.run_id = self.run.run_id
+        # Events are encoded for the one sink there is (see `encode`), there's nothing left to prepare.
+        self.preparers = [None]
+
+    def encode_locals(self, f_locals: Mapping[str, Any]) -> Any:
+        # Through the run's blob and pickle stores, and with the values for its history.
+        return self.run.encode_locals(f_locals)
+
+    def encode(self, record: Record) -> Event:
+        if type(record) is FrameRecord:
+            return (
+                "frames",
+                (
+                    self.uuid,
+                    record.f_id,
+                    record.f_back_id,
+                    record.f_call_id,
+                    record.f_filename,
+                    record.f_funcname,
+                    record.f_lineno,
+                    self.encode_locals(record.f_locals),
+                ),
             )
-            self.cursor.execute(sql, args)
+        return encode(record, self.uuid, self.run.blobs)
 
-            sys.settrace(self.tracefunc)
+    @property
+    def db_path(self) -> Optional[str]:
+        return self.run.db_path
 
-    def dispatch_return(self, frame):
-        PREV_FRAME_IDS.pop()
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self.run.counts
 
-    def dispatch_exception(self, frame):
-        pass
+    @property
+    def nbytes(self) -> int:
+        return self.run.nbytes
 
-    def dispatch_opcode(self, frame):
-        pass
+    @property
+    def retention_worker(self) -> Optional[RetentionWorker]:
+        return self.sink.retention_worker
@@ -1,5 +1,12 @@
+import os
+import tempfile
+
+from goet.lib.db.sqlite import connect, seed_db
 from goet.tracer.sql import SqlTracer
-from goet.lib.db.sqlite import connection
+
+# A database of the test's own, never the default one.
+connection = connect(os.path.join(tempfile.mkdtemp(), "sql_test.sqlite3"))
+seed_db(connection)
 
 
 class A:
@@ -23,8 +30,465 @@ def fn2():
     return a
 
 
-with SqlTracer(connection) as t:
+def fn3():
+    try:
+        fn4()
+    except ValueError:
+        pass
+
+
+def fn4():
+    c = "raise site"
+    raise ValueError(c)
+
+
+with SqlTracer(connection, capture_exception_locals=True) as t:
     fn()
+    fn3()
 
 cursor = connection.cursor()
 print(f"{cursor.execute('select count(*) from frames;').fetchall()}")
+print(
+    f"{cursor.execute('select exc_type, exc_message, tb_f_ids, f_locals from exceptions;').fetchall()}"
+)
+
+
+# Black box: only the failing call is written.
+def fn5():
+    fn()
+    fn4()
+
+
+black_box = SqlTracer(connection, black_box=True)
+with black_box as t:
+    fn()
+    try:
+        fn5()
+    except ValueError:
+        pass
+
+print(
+    f"{cursor.execute('select f_funcname, count(*) from frames where run_id = ? group by f_funcname;', (black_box.run_id,)).fetchall()}"
+)
+
+
+# Watch: only lines where `b` changed are written.
+watched = SqlTracer(connection, watch=["b"])
+with watched as t:
+    fn()
+
+print(
+    f"{cursor.execute('select f_funcname, f_lineno from frames where run_id = ?;', (watched.run_id,)).fetchall()}"
+)
+
+
+def flags():
+    b = float("nan")
+    c = 0
+    b = 1
+    b = True
+    b = 1.0
+    return b
+
+
+# NaN is unchanged when it stays NaN, and 1, True and 1.0 are different values.
+watched = SqlTracer(connection, watch=["b"])
+with watched as t:
+    flags()
+
+lines = [
+    lineno - flags.__code__.co_firstlineno
+    for (lineno,) in cursor.execute("select f_lineno from frames where run_id = ?;", (watched.run_id,))
+]
+assert lines == [2, 4, 5, 6], lines
+
+
+def fn10(a):
+    x = 0
+    a.x = 2
+    x = a.x + 1
+    return x
+
+
+# capture_locals: "watched" records the variables watched expressions read (`a`, not the attribute `x`),
+# "changed" only the locals that changed since the frame's previous line.
+import json
+
+for capture, expected in {
+    "watched": [{"a": {"x": 1}}, {"a": {"x": 2}}],
+    "changed": [{"a": {"x": 1}}, {"x": 0}, {}, {"x": 3}],
+}.items():
+    captured = SqlTracer(connection, watch=["a.x"] if capture == "watched" else None, capture_locals=capture)
+    with captured as t:
+        fn10(A(1))
+
+    f_locals = [
+        json.loads(value)
+        for (value,) in cursor.execute(
+            "select f_locals from frames where run_id = ? and f_funcname = ? order by f_id;",
+            (captured.run_id, fn10.__name__),
+        )
+    ]
+    assert f_locals == expected, (capture, f_locals)
+
+
+def fn11():
+    xs = [1, 2]
+    xs[0] = 3
+    d = {"k": 1}
+    d["k"] = 2
+    return xs, d
+
+
+# "changed" sees in-place mutations of small containers that keep their length.
+captured = SqlTracer(connection, capture_locals="changed")
+with captured as t:
+    fn11()
+
+f_locals = [
+    json.loads(value)
+    for (value,) in cursor.execute(
+        "select f_locals from frames where run_id = ? and f_funcname = ? order by f_id;",
+        (captured.run_id, fn11.__name__),
+    )
+]
+assert f_locals == [{}, {"xs": [1, 2]}, {"xs": [3, 2]}, {"d": {"k": 1}}, {"d": {"k": 2}}], f_locals
+
+
+# Breakpoints: capture `return b` only when b == 3, and `a = 1 + 1` once `a` is bound. Log `a` there too.
+line = fn.__code__.co_firstlineno
+probed = SqlTracer(
+    connection,
+    breakpoints={f"{__file__}:{line + 5}": "b == 3", f"{__file__}:{line + 3}": "a"},
+    logpoints={f"{__file__}:{line + 3}": "a={a}"},
+)
+with probed as t:
+    fn()
+
+print(
+    f"{cursor.execute('select f_funcname, f_lineno from frames where run_id = ?;', (probed.run_id,)).fetchall()}"
+)
+print(
+    f"{cursor.execute('select f_funcname, f_lineno, message from logs where run_id = ?;', (probed.run_id,)).fetchall()}"
+)
+
+# Relative locations match by the end of the path, wherever the tracer runs from.
+probed = SqlTracer(
+    connection,
+    breakpoints={f"{os.path.basename(__file__)}:{line + 5}": None, f"tracer/sql_test.py:{line + 3}": None},
+)
+with probed as t:
+    fn()
+
+assert cursor.execute(
+    "select f_lineno - ? from frames where run_id = ? order by f_id;", (line, probed.run_id)
+).fetchall() == [(3,), (5,)]
+
+
+# Triggers: idle until fn2 is entered, recording stops once it returns.
+def fn6():
+    fn()
+    fn2()
+    return fn()
+
+
+armed = SqlTracer(connection, triggers=[fn2])
+with armed as t:
+    fn6()
+
+print(
+    f"{cursor.execute('select f_funcname, count(*) from frames where run_id = ? group by f_funcname;', (armed.run_id,)).fetchall()}"
+)
+
+# Once done, the tracer isn't kept alive by sys.monitoring callbacks.
+import gc
+import weakref
+
+armed_ref = weakref.ref(armed)
+del armed
+gc.collect()
+assert armed_ref() is None
+
+
+# Workers: locals are serialized by another process, rows stay in order.
+offloaded = SqlTracer(connection, workers=1)
+with offloaded as t:
+    fn()
+
+print(
+    f"{cursor.execute('select f_id, f_funcname, f_locals from frames where run_id = ? and f_funcname = ? order by id;', (offloaded.run_id, fn.__name__)).fetchall()}"
+)
+
+
+# Pickled values: read back lazily, and identical pickles are stored once.
+from goet.lib.db.pickles import LazyValue, PickleStore
+
+pickled = SqlTracer(connection, pickle_values=True)
+with pickled as t:
+    fn()
+
+store = PickleStore(connection)
+rows = cursor.execute(
+    "select f_locals from frames where run_id = ? and f_funcname = ? order by id;",
+    (pickled.run_id, fn.__name__),
+).fetchall()
+values = [store.decode(f_locals) for (f_locals,) in rows]
+print(values)
+a = values[1]["a"]
+assert isinstance(a, LazyValue) and repr(a.value) == "A(x=1)"
+print(f"{cursor.execute('select count(*) from pickles;').fetchall()}")
+
+# Values that can't be pickled are written as JSON, the objects they share are resolved when read back.
+shared = [1]
+unpicklable = A(lambda: shared)
+unpicklable.items = [shared, shared]
+decoded = store.decode(store.encode({"s": {2}, "u": unpicklable}))
+assert isinstance(decoded["s"], LazyValue) and decoded["s"].value == {2}
+items = decoded["u"]["items"]
+assert items == [[1], [1]] and items[0] is items[1], decoded
+
+
+# Buffers: summarized in f_locals, raw bytes stored once per digest.
+import json
+from array import array
+
+from goet.lib.db.blobs import BlobStore
+
+
+def fn7():
+    buffer = array("d", [0.5] * 1000)
+    same = buffer
+    buffer[0] = 1.5
+    return buffer
+
+
+buffered = SqlTracer(connection, store_buffers=True)
+with buffered as t:
+    fn7()
+
+rows = cursor.execute(
+    "select f_locals from frames where run_id = ? and f_funcname = ? order by id;",
+    (buffered.run_id, fn7.__name__),
+).fetchall()
+summaries = [json.loads(f_locals)["buffer"]["$buffer"] for (f_locals,) in rows[1:]]
+print(summaries[-1])
+assert summaries[0]["hash"] == summaries[1]["hash"] != summaries[2]["hash"]
+blob = BlobStore(connection).get(summaries[2]["hash"])
+assert array("d", blob)[:2] == array("d", [1.5, 0.5])
+print(f"{cursor.execute('select count(*) from blobs;').fetchall()}")
+
+
+# Large bytes: stored raw in blobs (once), referenced from f_locals.
+def fn8():
+    payload = b"\x00\xff" * 1024
+    copy = bytes(payload)
+    return copy
+
+
+blobbed = SqlTracer(connection)
+with blobbed as t:
+    fn8()
+
+(f_locals,) = cursor.execute(
+    "select f_locals from frames where run_id = ? and f_funcname = ? order by id desc limit 1;",
+    (blobbed.run_id, fn8.__name__),
+).fetchone()
+f_locals = json.loads(f_locals)
+print(f_locals)
+assert f_locals["payload"] == f_locals["copy"]
+assert BlobStore(connection).get(f_locals["copy"]["$blob"]["hash"]) == b"\x00\xff" * 1024
+
+
+# Compressed locals: read back transparently, with a dictionary trained on the first lines.
+from goet.lib.db.compress import Decompressor
+
+
+def fn9():
+    rows = []
+    for i in range(200):
+        rows.append({"i": i, "a": A(i)})
+    return len(rows)
+
+
+compressed = SqlTracer(connection, compress="zlib")
+with compressed as t:
+    fn9()
+
+rows = cursor.execute(
+    "select f_locals from frames where run_id = ? and f_funcname = ? order by id;",
+    (compressed.run_id, fn9.__name__),
+).fetchall()
+decompressor = Decompressor(connection)
+f_locals = [json.loads(decompressor.decompress(value)) for (value,) in rows]
+assert all(isinstance(value, bytes) for (value,) in rows)
+assert f_locals[-1]["rows"][-1] == {"i": 199, "a": {"x": 199}}
+assert rows[-1][0][:1] == b"Z" and rows[0][0][:1] == b"z"
+print(
+    f"{cursor.execute('select codec, length(data) from dictionaries where run_id = ?;', (compressed.run_id,)).fetchall()}"
+)
+
+
+# Runs: one row per run with its counts, partitioned runs live (and die) in their own file.
+from goet.lib.db.runs import attach_run, delete_run, list_runs
+
+runs = {run.id: run for run in list_runs(connection)}
+run = runs[compressed.run_id]
+assert run.uuid == compressed.uuid and run.pid == os.getpid()
+assert run.frames == compressed.counts["frames"] > 0 and run.bytes > 0
+assert run.ended_at >= run.started_at and run.db_path is None
+
+partitioned = SqlTracer(connection, partition=True, partition_dir=tempfile.mkdtemp())
+with partitioned as t:
+    fn()
+
+run = list_runs(connection)[0]
+assert run.id == partitioned.run_id and os.path.exists(run.db_path)
+(schema,) = attach_run(connection, run.id)
+print(
+    f"{cursor.execute(f'select f_funcname, f_lineno from {schema}.frames where f_funcname = ?;', (fn.__name__,)).fetchall()}"
+)
+delete_run(connection, run.id)
+assert not os.path.exists(run.db_path)
+assert run.id not in {run.id for run in list_runs(connection)}
+
+delete_run(connection, compressed.run_id)
+assert not cursor.execute(
+    "select count(*) from frames where run_id = ?;", (compressed.run_id,)
+).fetchone()[0]
+
+
+# Retention: old segments and runs are dropped in the background, and reported.
+import attr
+
+from goet.lib.db.retention import Eviction, Retention
+
+
+def fn10():
+    for i in range(50):
+        text = "x" * 100 + str(i)
+    return text
+
+
+evicted = []
+retained = [
+    SqlTracer(
+        connection,
+        partition=True,
+        partition_dir=tempfile.mkdtemp(),
+        retention=Retention(max_run_bytes=2000, keep_last=1),
+        on_evict=evicted.append,
+    )
+    for _ in range(2)
+]
+for tracer in retained:
+    with tracer as t:
+        fn10()
+for tracer in retained:
+    tracer.retention_worker.close(wait=True)
+
+print(sorted({(e.run_id == retained[0].run_id, e.reason) for e in evicted}))
+assert Eviction(retained[0].run_id, None, "keep_last", retained[0].nbytes) in [
+    attr.evolve(e, bytes=retained[0].nbytes) for e in evicted if e.segment is None
+]
+assert [run.id for run in list_runs(connection)] == [retained[1].run_id]
+# The run rotated, and only its most recent segments are left.
+kept = [
+    idx
+    for (idx,) in cursor.execute(
+        "select idx from segments where run_id = ? order by idx;",
+        (retained[1].run_id,),
+    )
+]
+assert kept and kept == list(range(kept[0], kept[-1] + 1)) and kept[0] > 0
+assert len(attach_run(connection, retained[1].run_id)) == len(kept)
+
+
+# A tracer given a path (or $GOET_DB) opens, and closes, its own connection.
+from goet.lib.db.runs import database_path
+from goet.lib.db.sqlite import ENV_VAR
+
+path = os.path.join(tempfile.mkdtemp(), "own.sqlite3")
+own_tracer = SqlTracer(path)
+with own_tracer as t:
+    fn()
+# Opening it again doesn't drop what's recorded.
+own = connect(path)
+assert [run.uuid for run in list_runs(own)] == [own_tracer.uuid]
+assert own.execute(
+    "select f_lineno from frames where run_id = ? and f_funcname = ?;",
+    (own_tracer.run_id, fn.__name__),
+).fetchall() == [(fn.__code__.co_firstlineno + offset,) for offset in (1, 3, 4, 5)]
+
+os.environ[ENV_VAR] = os.path.join(tempfile.mkdtemp(), "env.sqlite3")
+try:
+    env_tracer = SqlTracer()
+    with env_tracer as t:
+        fn()
+finally:
+    env_path = os.environ.pop(ENV_VAR)
+assert database_path(connect(env_path)) == env_path
+assert [run.uuid for run in list_runs(connect(env_path))] == [env_tracer.uuid]
+
+
+# Retention never drops runs still being recorded (by other processes), and also checks on a timer when idle.
+import time
+
+from goet.lib.db.retention import RetentionWorker, enforce
+from goet.lib.db.runs import end_run, start_run
+
+path = os.path.join(tempfile.mkdtemp(), "retention.sqlite3")
+db = connect(path)
+recording = start_run(db)
+ended = start_run(db)
+end_run(db, ended, {}, 0)
+db.commit()
+assert enforce(db, Retention(keep_last=0)) == [Eviction(ended, None, "keep_last", 0)]
+assert [run.id for run in list_runs(db)] == [recording]
+
+ended = start_run(db)
+end_run(db, ended, {}, 0)
+db.commit()
+worker = RetentionWorker(path, Retention(max_age=0), interval=0.01)
+deadline = time.time() + 10
+while not worker.evicted and time.time() < deadline:
+    time.sleep(0.01)
+worker.close(wait=True)
+assert [e.run_id for e in worker.evicted] == [ended], worker.evicted
+assert [run.id for run in list_runs(db)] == [recording]
+
+# Unless it's stale: a run still "recording" long after its last write was left by a process that died.
+assert enforce(db, Retention(keep_last=0, stale_after=60), now=time.time() + 120) == [
+    Eviction(recording, None, "keep_last", 0)
+]
+assert list_runs(db) == []
+
+
+# Two tracers recording to the same file at once: neither waits for the other to end.
+import threading
+
+path = os.path.join(tempfile.mkdtemp(), "concurrent.sqlite3")
+both_recording = threading.Barrier(2, timeout=20)
+concurrent = []
+
+
+def record():
+    tracer = SqlTracer(path)
+    concurrent.append(tracer)
+    with tracer:
+        fn9()
+        # Each one has written (and holds) events here, and starts or records while the other waits.
+        both_recording.wait()
+        fn9()
+
+
+threads = [threading.Thread(target=record) for _ in range(2)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+db = connect(path)
+assert len(concurrent) == 2 and {run.uuid for run in list_runs(db)} == {t.uuid for t in concurrent}
+for tracer in concurrent:
+    (frames,) = db.execute("select count(*) from frames where run_id = ?;", (tracer.run_id,)).fetchone()
+    assert frames == tracer.counts["frames"] > 0
@@ -0,0 +1,97 @@
+import ast
+from typing import Any, Iterable, List, Tuple
+
+# Returned for expressions that cannot be evaluated in a frame (e.g. the name is not bound yet).
+UNSET = object()
+# Stands in for NaN, which isn't equal to itself.
+NAN = object()
+
+IMMUTABLE_TYPES = (str, int, float, bool, type(None), bytes, complex)
+# Containers whose items are part of their fingerprint, up to SMALL_SIZE of them.
+SHALLOW_TYPES = (list, dict, set)
+SMALL_SIZE = 16
+
+
+def fingerprint(value: Any) -> Any:
+    """A cheap stand-in for `value` that changes when the value (most likely) changed.
+
+    * immutable primitives are fingerprinted by type and value (`1`, `1.0` and `True` differ, NaN is NaN)
+    * lists, dicts and sets of up to SMALL_SIZE items also by a shallow copy of their items
+    * everything else is fingerprinted by identity and, when sized, length
+
+    So `xs[0] = 2` is seen in a small list, but not in a larger one, nor `xs[0].append(1)` in any: in-place
+    mutations that keep a container's length are only detected one level deep, in small containers, and between
+    items that aren't equal (`xs[0] = True` after `xs[0] = 1` is missed). Watch the element instead (`xs[0]`).
+    """
+    cls = type(value)
+    if cls in IMMUTABLE_TYPES:
+        return (cls, value if value == value else NAN)
+    try:
+        size = len(value)
+    except TypeError:
+        return id(value)
+    if size <= SMALL_SIZE and cls in SHALLOW_TYPES:
+        try:
+            # A shallow copy, compared item by item (identity first, then ==).
+            return (id(value), size, tuple(value.items() if cls is dict else value))
+        except RuntimeError:
+            # Changed size during iteration, from another thread.
+            return id(value)
+    return (id(value), size)
+
+
+def same(fingerprints: Tuple[Any, ...], others: Tuple[Any, ...]) -> bool:
+    return all(a is b or a == b for a, b in zip(fingerprints, others))
+
+
+class Watch:
+    """Watch only lets a line through when one of the watched expressions changed in its frame.
+
+    Expressions are compiled once, then evaluated against each traced frame on every line.
+
+    >>> with SqlTracer(connection, watch=["order.total", "retries"]) as t:
+    ...     fn()
+    """
+
+    def __init__(self, expressions: Iterable[str]):
+        self.expressions: Tuple[str, ...] = tuple(expressions)
+        self.codes = tuple(
+            compile(expression, f"<watch {expression}>", "eval")
+            for expression in self.expressions
+        )
+        # The variables the expressions read, e.g. `order` for "order.total" (not `total`).
+        self.names: Tuple[str, ...] = tuple(
+            dict.fromkeys(
+                node.id
+                for expression in self.expressions
+                for node in ast.walk(ast.parse(expression, mode="eval"))
+                if isinstance(node, ast.Name)
+            )
+        )
+        # Last fingerprints, for each frame on the stack. Frames where nothing is bound yet stay quiet.
+        self.unset: Tuple[Any, ...] = (UNSET,) * len(self.codes)
+        self.fingerprints: List[Tuple[Any, ...]] = [self.unset]
+
+    def call(self):
+        self.fingerprints.append(self.unset)
+
+    def return_(self):
+        self.fingerprints.pop()
+
+    def evaluate(self, sysframe) -> Tuple[Any, ...]:
+        f_globals = sysframe.f_globals
+        f_locals = sysframe.f_locals
+        values = []
+        for code in self.codes:
+            try:
+                values.append(fingerprint(eval(code, f_globals, f_locals)))
+            except Exception:
+                values.append(UNSET)
+        return tuple(values)
+
+    def changed(self, sysframe) -> bool:
+        fingerprints = self.evaluate(sysframe)
+        if same(fingerprints, self.fingerprints[-1]):
+            return False
+        self.fingerprints[-1] = fingerprints
+        return True